@@ -0,0 +1,73 @@
+"""
+Import-time regression benchmark.
+
+Every statement is timed in fresh interpreters (so nothing is cached in `sys.modules`), and the heavy
+dependencies it loaded are listed. The script exits with status 1 if a statement is slower than its budget
+or loads a dependency it should not, so it can run in CI:
+
+    python benchmarks/import_time.py --runs 20
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+from typing import List, Tuple
+
+# Heavy dependencies that must only be imported when a Volume, a Cube or the crawler needs them
+HEAVY_MODULES = ["tensorstore", "zarr", "numcodecs", "nrrd", "PIL", "requests", "aiohttp", "lxml", "nest_asyncio", "yaml", "numpy"]
+
+# Statement, budget in milliseconds, heavy modules it is allowed to load
+CASES: List[Tuple[str, float, List[str]]] = [
+    ("import vesuvius", 50.0, []),
+    ("import vesuvius.paths", 50.0, []),
+    ("from vesuvius import list_files", 50.0, []),
+    ("from vesuvius.serve import VolumeClient", 1000.0, ["tensorstore", "zarr", "numcodecs", "requests", "numpy"]),
+    ("from vesuvius import Volume", 1000.0, ["tensorstore", "zarr", "numcodecs", "requests", "numpy"]),
+]
+
+_PROBE = """
+import sys, time, json
+start = time.perf_counter()
+exec({statement!r})
+elapsed = time.perf_counter() - start
+print(json.dumps({{"ms": elapsed * 1000, "modules": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def measure(statement: str, runs: int) -> Tuple[List[float], List[str]]:
+    """
+    Time a statement in `runs` fresh interpreters and collect the heavy modules it loaded.
+    """
+    env = dict(os.environ)
+    # The catalog refresh is not part of the import
+    env.setdefault("VESUVIUS_CATALOG_MAX_AGE", "1e12")
+    times, loaded = [], set()
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, "-c", _PROBE.format(statement=statement, heavy=HEAVY_MODULES)], env=env, capture_output=True, text=True, check=True)
+        result = json.loads(output.stdout.strip().splitlines()[-1])
+        times.append(result["ms"])
+        loaded.update(result["modules"])
+    return times, sorted(loaded)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Measure the import time of vesuvius and check that heavy dependencies are imported lazily")
+    parser.add_argument("--runs", type=int, default=10, help="Number of fresh interpreters per statement")
+    parser.add_argument("--scale", type=float, default=1.0, help="Multiply the time budgets, e.g. on slow CI machines")
+    args = parser.parse_args()
+
+    failed = False
+    for statement, budget, allowed in CASES:
+        times, loaded = measure(statement, args.runs)
+        median = statistics.median(times)
+        unexpected = [module for module in loaded if module not in allowed]
+        ok = median <= budget * args.scale and not unexpected
+        failed = failed or not ok
+        print(f"{'ok  ' if ok else 'FAIL'} {statement:<55} median {median:7.1f} ms  min {min(times):7.1f} ms  budget {budget * args.scale:6.1f} ms  heavy modules: {', '.join(loaded) or '-'}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
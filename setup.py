@@ -37,6 +37,10 @@ setup(
         'pyyaml',
         'Pillow'
     ],
+    extras_require={
+        'dask': ['dask[array]'],
+        'xarray': ['dask[array]', 'xarray'],
+    },
     python_requires='>=3.8',
     include_package_data=True,
     package_data={
@@ -45,6 +49,7 @@ setup(
     entry_points={
         'console_scripts': [
             'vesuvius.accept_terms=vesuvius.setup.accept_terms:main',
+            'vesuvius.serve=vesuvius.serve:main',
         ],
     },
     classifiers=[
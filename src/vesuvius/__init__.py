@@ -1,16 +1,51 @@
 import os
 import sys
 import site
+import importlib
+from typing import Any, List
 
-from .volume import Volume, Cube
 from .setup.accept_terms import is_colab
-from .paths.utils import update_list
-from .paths.utils import list_files
-from .paths.utils import list_cubes as cubes
-from .paths.local import update_local_list
-from .paths.utils import is_aws_ec2_instance
 
-__all__ = ["Volume", "Cube", "list_files", "cubes", "is_aws_ec2_instance"]
+# Public names and the module defining them. They are imported on first access, so that `import vesuvius`
+# does not load TensorStore, zarr, PIL or the crawler until a Volume, a Cube or the catalog is used.
+_EXPORTS = {
+    "Volume": (".volume", "Volume"),
+    "Cube": (".volume", "Cube"),
+    "SegmentDataset": (".dataset", "SegmentDataset"),
+    "TileIndex": (".tiles", "TileIndex"),
+    "PredictionStore": (".store", "PredictionStore"),
+    "VolumeView": (".views", "VolumeView"),
+    "read_priority": (".scheduler", "read_priority"),
+    "update_list": (".paths.utils", "update_list"),
+    "list_files": (".paths.utils", "list_files"),
+    "cubes": (".paths.utils", "list_cubes"),
+    "update_local_list": (".paths.local", "update_local_list"),
+    "is_aws_ec2_instance": (".paths.utils", "is_aws_ec2_instance"),
+    "refresh_catalog": (".paths.utils", "refresh_catalog"),
+    "catalog_age": (".paths.utils", "catalog_age"),
+    "CATALOG_MAX_AGE": (".paths.utils", "CATALOG_MAX_AGE"),
+    "query_catalog": (".paths.query", "query_catalog"),
+    "CatalogEntry": (".paths.query", "CatalogEntry"),
+}
+
+# Submodules reachable as attributes of the package, e.g. `vesuvius.volume.cache_stats()`
+_SUBMODULES = {"volume", "dataset", "tiles", "store", "views", "adapters", "inference", "sampling", "stats", "cache", "chunks", "memory", "scheduler", "tracing", "serve", "paths", "setup"}
+
+__all__ = ["Volume", "Cube", "SegmentDataset", "TileIndex", "PredictionStore", "VolumeView", "list_files", "cubes", "query_catalog", "CatalogEntry", "is_aws_ec2_instance"]
+
+def __getattr__(name: str) -> Any:
+    if name in _EXPORTS:
+        module, attribute = _EXPORTS[name]
+        value = getattr(importlib.import_module(module, __name__), attribute)
+    elif name in _SUBMODULES:
+        value = importlib.import_module(f".{name}", __name__)
+    else:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    globals()[name] = value
+    return value
+
+def __dir__() -> List[str]:
+    return sorted(set(globals()) | set(_EXPORTS) | _SUBMODULES)
 
 def check_agreement():
     if is_colab():
@@ -36,19 +71,4 @@ def check_agreement():
 # Check agreement on import
 check_agreement()
 
-# Update list of files on import
-if is_aws_ec2_instance():
-        try:
-            update_local_list("/mnt/scrolls", "/mnt/annotated-instances")
-            #print("Updated local file paths.")
-        except Exception as e:
-            print(f"Could not update the local file paths: {e}")
-            try:
-                update_list("https://dl.ash2txt.org/other/dev/", "https://dl.ash2txt.org/full-scrolls/Scroll1/PHercParis4.volpkg/seg-volumetric-labels/instance-annotated-cubes/")
-            except:
-                print("Could not update the remote file paths.")
-else:
-    try:
-        update_list("https://dl.ash2txt.org/other/dev/", "https://dl.ash2txt.org/full-scrolls/Scroll1/PHercParis4.volpkg/seg-volumetric-labels/instance-annotated-cubes/")
-    except:
-        print("Could not update the remote file paths.")
\ No newline at end of file
+# The catalogs are refreshed on first use (see `vesuvius.paths.utils.refresh_catalog`), not on import
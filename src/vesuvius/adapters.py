@@ -0,0 +1,198 @@
+import pickle
+import hashlib
+import threading
+import numpy as np
+from numpy.typing import NDArray
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+# Volumes unpickled in this process, keyed by their pickled spec, so that all the blocks read by a worker
+# share one opened volume: its TensorStore handles, its cache pool and its chunk readers
+_shared_volumes: Dict[str, Any] = {}
+_shared_volumes_lock = threading.Lock()
+
+
+def _shared_volume(key: str, volume: Any) -> Any:
+    """
+    Get the volume of this process registered under `key`, registering `volume` if there is none.
+    """
+    with _shared_volumes_lock:
+        return _shared_volumes.setdefault(key, volume)
+
+
+class _VolumeBlocks:
+    """
+    Array-like reading the blocks of a level of a volume, for `dask.array.from_array`.
+
+    It pickles by the spec of its volume and resolves to the shared volume of the process it is unpickled in.
+    """
+    def __init__(self, volume: Any, level: int, key: Optional[str] = None) -> None:
+        self.volume = volume
+        self.level = level
+        self.key = key if key is not None else hashlib.sha1(pickle.dumps(volume)).hexdigest()
+        self.shape = tuple(volume.shape(level))
+        self.ndim = len(self.shape)
+        dtype = np.dtype(volume.dtype)
+        # Normalization divides by a Python float
+        self.dtype = (np.zeros(0, dtype=dtype) / 1.0).dtype if volume.normalize else dtype
+
+    def __reduce__(self) -> Tuple[Any, Tuple[Any, ...]]:
+        return (_rebuild_blocks, (self.key, self.volume, self.level))
+
+    def __getitem__(self, idx: Tuple[slice, ...]) -> NDArray:
+        data = np.asarray(self.volume._read_region(self.level, idx))
+        if self.volume.normalize:
+            return np.asarray(self.volume._normalize(data), dtype=self.dtype)
+        return data
+
+
+def _rebuild_blocks(key: str, volume: Any, level: int) -> _VolumeBlocks:
+    return _VolumeBlocks(_shared_volume(key, volume), level, key)
+
+
+def block_shape(volume: Any, level: int = 0, chunks: Optional[Union[int, Sequence[int]]] = None) -> Tuple[int, ...]:
+    """
+    Get the shape of the dask blocks of a level: its chunk shape, or `chunks` rounded up to a multiple of it.
+
+    Parameters
+    ----------
+    volume : Volume
+        The volume.
+    level : int, default = 0
+        Index of the level (sub-volume).
+    chunks : Optional[Union[int, Sequence[int]]], default = None
+        Requested block shape, for all the axes or for every axis. If None the chunk shape of the level is used.
+
+    Returns
+    -------
+    Tuple[int, ...]
+        The block shape, a multiple of the chunk shape clipped to the level shape.
+    """
+    native = tuple(volume.chunks(level))
+    shape = tuple(volume.shape(level))
+    if chunks is None:
+        requested = native
+    elif isinstance(chunks, (int, np.integer)):
+        requested = (int(chunks),) * len(native)
+    else:
+        requested = tuple(int(n) for n in chunks)
+    if len(requested) != len(native):
+        raise ValueError(f"chunks must have {len(native)} values.")
+    # Blocks cover whole chunks, so that no chunk is read by two tasks
+    return tuple(min(-(-max(r, 1) // n) * n, s) for r, n, s in zip(requested, native, shape))
+
+
+def to_dask(volume: Any, level: int = 0, chunks: Optional[Union[int, Sequence[int]]] = None) -> Any:
+    """
+    Wrap a level of a volume in a lazy dask array whose blocks line up with the chunks of the level.
+
+    Every block is read with the chunk-level reads of the volume, and normalized as the volume. The volume is
+    pickled by spec into the task graph; each worker process opens it once and reuses the same handles and
+    cache for all its blocks.
+
+    Parameters
+    ----------
+    volume : Volume
+        The volume.
+    level : int, default = 0
+        Index of the level (sub-volume).
+    chunks : Optional[Union[int, Sequence[int]]], default = None
+        Block shape, rounded up to a multiple of the chunk shape. If None every block is one chunk.
+
+    Returns
+    -------
+    dask.array.Array
+        The lazy array.
+
+    Raises
+    ------
+    ImportError
+        If dask is not installed.
+    """
+    try:
+        import dask.array as da
+        from dask.base import tokenize
+    except ImportError as e:
+        raise ImportError("to_dask requires dask: pip install 'vesuvius[dask]'") from e
+    blocks = _VolumeBlocks(volume, level)
+    block = block_shape(volume, level, chunks)
+    name = f"vesuvius-{tokenize(blocks.key, level, block)}"
+    return da.from_array(blocks, chunks=block, name=name, lock=False, asarray=True, fancy=False, meta=np.empty((0,) * blocks.ndim, dtype=blocks.dtype))
+
+
+def level_coordinates(volume: Any, level: int = 0) -> Tuple[List[str], Dict[str, NDArray]]:
+    """
+    Get the axis names and the physical coordinates of a level from the OME metadata.
+
+    Parameters
+    ----------
+    volume : Volume
+        The volume.
+    level : int, default = 0
+        Index of the level (sub-volume).
+
+    Returns
+    -------
+    Tuple[List[str], Dict[str, NDArray]]
+        The names of the axes, and for every axis the coordinates of the voxel centers,
+        `translation + scale * index` with the `coordinateTransformations` of the level.
+    """
+    shape = tuple(volume.shape(level))
+    axes = volume.metadata['zattrs']['multiscales'][0].get('axes') or ["z", "y", "x"]
+    names = [axis['name'] if isinstance(axis, dict) else str(axis) for axis in axes][-len(shape):]
+    if len(names) != len(shape):
+        names = ["z", "y", "x"][-len(shape):]
+    scale, translation = volume._level_transform(level)
+    coordinates = {name: translation[i] + scale[i] * np.arange(size) for i, (name, size) in enumerate(zip(names, shape))}
+    return names, coordinates
+
+
+def to_xarray(volume: Any, level: int = 0, chunks: Optional[Union[int, Sequence[int]]] = None, name: Optional[str] = None) -> Any:
+    """
+    Wrap a level of a volume in a lazy xarray DataArray backed by `to_dask`, with physical coordinates.
+
+    Parameters
+    ----------
+    volume : Volume
+        The volume.
+    level : int, default = 0
+        Index of the level (sub-volume).
+    chunks : Optional[Union[int, Sequence[int]]], default = None
+        Block shape of the dask array (see `to_dask`).
+    name : Optional[str], default = None
+        Name of the DataArray. If None it is derived from the volume.
+
+    Returns
+    -------
+    xarray.DataArray
+        The lazy array, with dimensions named after the OME axes, coordinates from the OME coordinate
+        transformations and the axis units, scale, translation, URL and level as attributes.
+
+    Raises
+    ------
+    ImportError
+        If xarray or dask is not installed.
+    """
+    try:
+        import xarray as xr
+    except ImportError as e:
+        raise ImportError("to_xarray requires xarray and dask: pip install 'vesuvius[xarray]'") from e
+    data = to_dask(volume, level, chunks)
+    names, coordinates = level_coordinates(volume, level)
+    scale, translation = volume._level_transform(level)
+    axes = volume.metadata['zattrs']['multiscales'][0].get('axes') or []
+    units = {axis['name']: axis['unit'] for axis in axes if isinstance(axis, dict) and 'unit' in axis}
+    coords = {
+        dim: xr.Variable(dim, values, attrs={"units": units[dim]} if dim in units else {})
+        for dim, values in coordinates.items()
+    }
+    if name is None:
+        name = f"segment_{volume.segment_id}" if volume.type == "segment" else f"scroll_{volume.scroll_id}"
+    attrs = {
+        "url": str(volume.url),
+        "level": level,
+        "scale": scale.tolist(),
+        "translation": translation.tolist(),
+        "energy": volume.energy,
+        "resolution": volume.resolution,
+    }
+    return xr.DataArray(data, dims=names, coords=coords, name=name, attrs=attrs)
@@ -0,0 +1,233 @@
+import threading
+import numpy as np
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+
+def nbytes(value: Any) -> int:
+    """
+    Estimate the memory used by a cached value: arrays, bytes, and tuples or lists of them.
+
+    Parameters
+    ----------
+    value : Any
+        The value.
+
+    Returns
+    -------
+    int
+        The size of the value in bytes.
+    """
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return len(value)
+    if isinstance(value, (tuple, list)):
+        return sum(nbytes(item) for item in value)
+    return getattr(value, "nbytes", 0)
+
+
+class LRUCache:
+    """
+    A thread-safe least recently used cache bounded by the total size of its values in bytes.
+
+    Attributes
+    ----------
+    max_bytes : int
+        Maximum total size of the cached values. Lowering it evicts values immediately.
+    on_evict : Optional[Callable[[Hashable, Any], None]]
+        Function called with the key and the value of every evicted entry, outside the cache lock.
+    hits : int
+        Number of lookups that found their key.
+    misses : int
+        Number of lookups that did not find their key.
+    evictions : int
+        Number of entries evicted to respect `max_bytes`.
+    """
+    def __init__(self, max_bytes: int, on_evict: Optional[Callable[[Hashable, Any], None]] = None, sizeof: Callable[[Any], int] = nbytes) -> None:
+        """
+        Initialize the LRUCache object.
+
+        Parameters
+        ----------
+        max_bytes : int
+            Maximum total size of the cached values in bytes.
+        on_evict : Optional[Callable[[Hashable, Any], None]], default = None
+            Function called with the key and the value of every evicted entry.
+        sizeof : Callable[[Any], int], default = nbytes
+            Function returning the size of a value in bytes.
+        """
+        self._max_bytes = int(max_bytes)
+        self.on_evict = on_evict
+        self.sizeof = sizeof
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._sizes: Dict[Hashable, int] = {}
+        self._nbytes = 0
+        self._lock = threading.Lock()
+        self._loading: Dict[Hashable, threading.Lock] = {}
+
+    @property
+    def max_bytes(self) -> int:
+        return self._max_bytes
+
+    @max_bytes.setter
+    def max_bytes(self, value: int) -> None:
+        with self._lock:
+            self._max_bytes = int(value)
+            evicted = self._evict()
+        self._notify(evicted)
+
+    @property
+    def nbytes(self) -> int:
+        """
+        Total size of the cached values in bytes.
+        """
+        return self._nbytes
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._entries
+
+    def _evict(self) -> list:
+        # Must be called with the lock held
+        evicted = []
+        while self._nbytes > self._max_bytes and self._entries:
+            key, value = self._entries.popitem(last=False)
+            self._nbytes -= self._sizes.pop(key)
+            self.evictions += 1
+            evicted.append((key, value))
+        return evicted
+
+    def _notify(self, evicted: list) -> None:
+        if self.on_evict is not None:
+            for key, value in evicted:
+                self.on_evict(key, value)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """
+        Get a cached value and mark it as recently used.
+
+        Parameters
+        ----------
+        key : Hashable
+            The key.
+        default : Any, default = None
+            Value returned if the key is not cached.
+
+        Returns
+        -------
+        Any
+            The cached value, or `default`.
+        """
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+            return default
+
+    def put(self, key: Hashable, value: Any) -> None:
+        """
+        Cache a value, evicting the least recently used values beyond `max_bytes`. Values larger than `max_bytes` are not cached.
+
+        Parameters
+        ----------
+        key : Hashable
+            The key.
+        value : Any
+            The value.
+        """
+        size = self.sizeof(value)
+        with self._lock:
+            if key in self._entries:
+                self._nbytes -= self._sizes.pop(key)
+                del self._entries[key]
+            if size > self._max_bytes:
+                return
+            self._entries[key] = value
+            self._sizes[key] = size
+            self._nbytes += size
+            evicted = self._evict()
+        self._notify(evicted)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        """
+        Remove a value from the cache and return it, without calling `on_evict`.
+        """
+        with self._lock:
+            if key not in self._entries:
+                return default
+            self._nbytes -= self._sizes.pop(key)
+            return self._entries.pop(key)
+
+    def clear(self) -> None:
+        """
+        Remove all the cached values, without calling `on_evict`.
+        """
+        with self._lock:
+            self._entries.clear()
+            self._sizes.clear()
+            self._nbytes = 0
+
+    def get_or_load(self, key: Hashable, loader: Callable[[], Any]) -> Any:
+        """
+        Get a cached value, or load and cache it. Concurrent calls for the same key run `loader` once.
+
+        Parameters
+        ----------
+        key : Hashable
+            The key.
+        loader : Callable[[], Any]
+            Function returning the value of `key`.
+
+        Returns
+        -------
+        Any
+            The value.
+        """
+        missing = object()
+        value = self.get(key, missing)
+        if value is not missing:
+            return value
+        with self._lock:
+            loading = self._loading.setdefault(key, threading.Lock())
+        with loading:
+            with self._lock:
+                value = self._entries.get(key, missing)
+            if value is missing:
+                try:
+                    value = loader()
+                    self.put(key, value)
+                finally:
+                    with self._lock:
+                        self._loading.pop(key, None)
+        return value
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Get the usage counters of the cache.
+
+        Returns
+        -------
+        Dict[str, int]
+            The number of entries, their total size, the budget and the hit, miss and eviction counters.
+        """
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "nbytes": self._nbytes,
+                "max_bytes": self._max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def _reset_after_fork(self) -> None:
+        self._lock = threading.Lock()
+        self._loading = {}
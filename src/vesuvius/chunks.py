@@ -0,0 +1,473 @@
+import os
+import json
+import itertools
+import threading
+import numpy as np
+import tensorstore as ts
+from numcodecs import Blosc
+from numpy.typing import NDArray
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, Hashable, List, Optional, Tuple, Union
+from .cache import LRUCache
+from .memory import get_cache_budget, on_cache_budget_change
+from .tracing import span
+from .scheduler import current_read_priority, get_read_scheduler
+
+# Codec of the compressed tier: LZ4 with byte shuffling decompresses at several GB/s
+# and typically shrinks uint8/uint16 CT chunks by 2-4x
+CHUNK_CODEC = Blosc(cname="lz4", clevel=5, shuffle=Blosc.SHUFFLE)
+
+# Chunk caches shared by all the volumes of this process, keyed by their budgets
+_chunk_caches: Dict[str, "ChunkCache"] = {}
+_chunk_caches_lock = threading.Lock()
+
+
+def compress_chunk(chunk: NDArray) -> Tuple[bytes, np.dtype, Tuple[int, ...]]:
+    """
+    Compress a chunk with `CHUNK_CODEC`.
+
+    Parameters
+    ----------
+    chunk : NDArray
+        The decoded chunk.
+
+    Returns
+    -------
+    Tuple[bytes, np.dtype, Tuple[int, ...]]
+        The compressed bytes, the dtype and the shape of the chunk.
+    """
+    chunk = np.ascontiguousarray(chunk)
+    return bytes(CHUNK_CODEC.encode(chunk)), chunk.dtype, chunk.shape
+
+
+def decompress_chunk(entry: Tuple[bytes, np.dtype, Tuple[int, ...]]) -> NDArray:
+    """
+    Decompress a chunk compressed by `compress_chunk`. The returned array is read-only.
+    """
+    data, dtype, shape = entry
+    return np.frombuffer(CHUNK_CODEC.decode(data), dtype=dtype).reshape(shape)
+
+
+class ChunkCache:
+    """
+    A two-tier cache of volume chunks: decoded chunks in a byte-budget LRU cache, and the chunks
+    evicted from it kept compressed in a second LRU cache and decompressed on a hit.
+
+    With uint8/uint16 CT data the compressed tier holds several times more chunks per byte than the
+    decoded tier, so regions larger than the decoded budget are served without refetching them.
+
+    The cache also tracks the chunks being fetched: a reader missing a chunk that another thread is already
+    fetching waits for that fetch instead of starting its own (see `claim`).
+
+    Attributes
+    ----------
+    decoded : LRUCache
+        The decoded chunks.
+    compressed : LRUCache
+        The compressed chunks.
+    """
+    def __init__(self, decoded_bytes: int, compressed_bytes: int) -> None:
+        """
+        Initialize the ChunkCache object.
+
+        Parameters
+        ----------
+        decoded_bytes : int
+            Maximum total size of the decoded chunks in bytes.
+        compressed_bytes : int
+            Maximum total size of the compressed chunks in bytes.
+        """
+        self.compressed = LRUCache(compressed_bytes)
+        self.decoded = LRUCache(decoded_bytes, on_evict=self._demote)
+        self.shared_fetches = 0
+        self._in_flight: Dict[Hashable, Future] = {}
+        self._in_flight_lock = threading.Lock()
+
+    def _demote(self, key: Hashable, chunk: NDArray) -> None:
+        # Chunks are immutable, so a chunk already in the compressed tier is not compressed again
+        if self.compressed.max_bytes > 0 and key not in self.compressed:
+            self.compressed.put(key, compress_chunk(chunk))
+
+    def get(self, key: Hashable) -> Optional[NDArray]:
+        """
+        Get a chunk, decompressing it into the decoded tier if it is only in the compressed tier.
+
+        Parameters
+        ----------
+        key : Hashable
+            The key of the chunk.
+
+        Returns
+        -------
+        Optional[NDArray]
+            The read-only chunk, or None if it is not cached.
+        """
+        chunk = self.decoded.get(key)
+        if chunk is None:
+            entry = self.compressed.get(key)
+            if entry is not None:
+                chunk = decompress_chunk(entry)
+                self.decoded.put(key, chunk)
+        return chunk
+
+    def put(self, key: Hashable, chunk: NDArray) -> None:
+        """
+        Cache a chunk. The chunk is made read-only, since it is shared by all the readers.
+
+        Parameters
+        ----------
+        key : Hashable
+            The key of the chunk.
+        chunk : NDArray
+            The decoded chunk.
+        """
+        chunk.flags.writeable = False
+        if chunk.nbytes > self.decoded.max_bytes:
+            self._demote(key, chunk)
+        else:
+            self.decoded.put(key, chunk)
+
+    def claim(self, key: Hashable) -> Tuple[Future, bool]:
+        """
+        Claim the fetch of a chunk missing from the cache.
+
+        Parameters
+        ----------
+        key : Hashable
+            The key of the chunk.
+
+        Returns
+        -------
+        Tuple[Future, bool]
+            A future of the chunk and True if the caller must fetch the chunk and pass it to `resolve`,
+            or False if the chunk is cached or fetched by another thread, the future then giving it.
+        """
+        with self._in_flight_lock:
+            future = self._in_flight.get(key)
+            if future is not None:
+                self.shared_fetches += 1
+                return future, False
+            future = Future()
+            # The chunk may have been cached since the caller missed it
+            chunk = self.get(key) if key in self.decoded or key in self.compressed else None
+            if chunk is not None:
+                future.set_result(chunk)
+                return future, False
+            self._in_flight[key] = future
+            return future, True
+
+    def resolve(self, key: Hashable, future: Future, chunk: Optional[NDArray] = None, error: Optional[BaseException] = None) -> None:
+        """
+        Complete a fetch claimed with `claim`: cache the chunk and wake up the threads waiting for it, or pass them the error.
+        """
+        if error is None:
+            self.put(key, chunk)
+        with self._in_flight_lock:
+            self._in_flight.pop(key, None)
+        if error is None:
+            future.set_result(chunk)
+        else:
+            future.set_exception(error)
+
+    def clear(self) -> None:
+        """
+        Remove all the cached chunks.
+        """
+        self.decoded.clear()
+        self.compressed.clear()
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """
+        Get the usage counters of both tiers.
+
+        Returns
+        -------
+        Dict[str, Dict[str, int]]
+            The counters of the "decoded" and "compressed" tiers (see `LRUCache.stats`), and under "in_flight"
+            the number of chunks being fetched and of fetches shared with a concurrent reader.
+        """
+        with self._in_flight_lock:
+            in_flight = {"pending": len(self._in_flight), "shared": self.shared_fetches}
+        return {"decoded": self.decoded.stats(), "compressed": self.compressed.stats(), "in_flight": in_flight}
+
+    def _reset_after_fork(self) -> None:
+        self.decoded._reset_after_fork()
+        self.compressed._reset_after_fork()
+        # Fetches of the parent's threads never complete in the child
+        self._in_flight = {}
+        self._in_flight_lock = threading.Lock()
+
+
+def get_chunk_cache(decoded_bytes: Optional[int], compressed_bytes: int) -> ChunkCache:
+    """
+    Get the chunk cache of this process for a pair of budgets, so volumes opened with the same budgets share it.
+
+    Parameters
+    ----------
+    decoded_bytes : Optional[int]
+        Maximum total size of the decoded chunks in bytes. If None the decoded tier follows the process-wide
+        cache budget (see `vesuvius.memory.get_cache_budget`), and is resized when the budget changes.
+    compressed_bytes : int
+        Maximum total size of the compressed chunks in bytes.
+
+    Returns
+    -------
+    ChunkCache
+        The shared chunk cache.
+    """
+    key = json.dumps(["auto" if decoded_bytes is None else int(decoded_bytes), int(compressed_bytes)])
+    budget = get_cache_budget() if decoded_bytes is None else int(decoded_bytes)
+    with _chunk_caches_lock:
+        cache = _chunk_caches.get(key)
+        if cache is None:
+            cache = _chunk_caches[key] = ChunkCache(budget, int(compressed_bytes))
+    if decoded_bytes is None and cache.decoded.max_bytes != budget:
+        # The budget of a forked worker is only known once it runs (see `vesuvius.memory.cache_processes`)
+        cache.decoded.max_bytes = budget
+    return cache
+
+
+def chunk_cache_stats() -> Dict[str, Dict[str, Dict[str, int]]]:
+    """
+    Get the usage counters of the chunk caches of this process, keyed by their [decoded, compressed] budgets.
+    """
+    with _chunk_caches_lock:
+        caches = dict(_chunk_caches)
+    return {key: cache.stats() for key, cache in caches.items()}
+
+
+def _resize_auto_caches(budget: int) -> None:
+    with _chunk_caches_lock:
+        caches = [cache for key, cache in _chunk_caches.items() if json.loads(key)[0] == "auto"]
+    for cache in caches:
+        cache.decoded.max_bytes = budget
+
+on_cache_budget_change(_resize_auto_caches)
+
+
+def _reset_after_fork() -> None:
+    global _chunk_caches_lock
+    _chunk_caches_lock = threading.Lock()
+    for cache in _chunk_caches.values():
+        cache._reset_after_fork()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+class ChunkReader:
+    """
+    Read regions of a zarr array or TensorStore by whole chunks, through a `ChunkCache`.
+
+    Attributes
+    ----------
+    store : Union[ts.TensorStore, Any]
+        The array read on cache misses.
+    key : Hashable
+        Identifier of the array in the cache, e.g. (url, level).
+    cache : ChunkCache
+        The chunk cache.
+    shape : Tuple[int, ...]
+        Shape of the array.
+    chunks : Tuple[int, ...]
+        Chunk shape of the array.
+    fetch_group : int
+        Number of chunks fetched per slot of the read scheduler by non-interactive reads.
+    """
+    def __init__(self, store: Union[ts.TensorStore, Any], key: Hashable, cache: ChunkCache, max_workers: int = 8, fetch_group: int = 16) -> None:
+        """
+        Initialize the ChunkReader object.
+
+        Parameters
+        ----------
+        store : Union[ts.TensorStore, zarr.Array]
+            The array to read.
+        key : Hashable
+            Identifier of the array in the cache.
+        cache : ChunkCache
+            The chunk cache.
+        max_workers : int, default = 8
+            Number of threads reading chunks of zarr arrays concurrently.
+        fetch_group : int, default = 16
+            Number of chunks fetched per slot of the read scheduler by non-interactive reads. Smaller groups let
+            urgent reads get ahead of large ones sooner, larger groups coalesce more shard reads.
+        """
+        self.store = store
+        self.key = key
+        self.cache = cache
+        self.max_workers = max_workers
+        self.fetch_group = max(int(fetch_group), 1)
+        self.shape = tuple(store.shape)
+        if isinstance(store, ts.TensorStore):
+            self.chunks = tuple(store.chunk_layout.read_chunk.shape)
+            self.dtype = store.dtype.numpy_dtype
+        else:
+            self.chunks = tuple(store.chunks)
+            self.dtype = store.dtype
+
+    def _chunk_region(self, chunk_idx: Tuple[int, ...]) -> Tuple[slice, ...]:
+        return tuple(slice(c * n, min((c + 1) * n, s)) for c, n, s in zip(chunk_idx, self.chunks, self.shape))
+
+    def _fetch(self, chunk_indices: List[Tuple[int, ...]]) -> List[NDArray]:
+        """
+        Read chunks from the store concurrently.
+        """
+        regions = [self._chunk_region(chunk_idx) for chunk_idx in chunk_indices]
+        with span("chunks.fetch", chunks=len(regions)):
+            if isinstance(self.store, ts.TensorStore):
+                # One batch, so that the chunks of a shard are read with coalesced byte-range requests
+                with ts.Batch() as batch:
+                    futures = [self.store[region].read(batch=batch) for region in regions]
+                return [future.result() for future in futures]
+            if len(regions) == 1:
+                return [np.asarray(self.store[regions[0]])]
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                return [np.asarray(chunk) for chunk in executor.map(lambda region: self.store[region], regions)]
+
+    def _fetch_group(self, owned: List[Tuple[Tuple[int, ...], Future]]) -> None:
+        """
+        Fetch claimed chunks and resolve their futures with the chunks or the error.
+        """
+        if not owned:
+            return
+        try:
+            chunks = self._fetch([chunk_idx for chunk_idx, _ in owned])
+        except BaseException as e:
+            for chunk_idx, future in owned:
+                self.cache.resolve((self.key, chunk_idx), future, error=e)
+            raise
+        for (chunk_idx, future), chunk in zip(owned, chunks):
+            self.cache.resolve((self.key, chunk_idx), future, chunk)
+
+    def read_chunks(self, chunk_indices: List[Tuple[int, ...]]) -> List[NDArray]:
+        """
+        Read whole chunks, clipped to the array bounds, fetching the missing ones concurrently.
+
+        Chunks already being fetched by another thread are not fetched again: this read waits for them.
+        Missing chunks are fetched in slots of the read scheduler, with the priority of the calling thread
+        (see `vesuvius.scheduler.read_priority`): by groups of `fetch_group`, or all at once for interactive reads.
+
+        Parameters
+        ----------
+        chunk_indices : List[Tuple[int, ...]]
+            Grid indices of the chunks.
+
+        Returns
+        -------
+        List[NDArray]
+            The read-only chunks, in the order requested.
+        """
+        result: Dict[Tuple[int, ...], NDArray] = {}
+        for chunk_idx in chunk_indices:
+            if chunk_idx not in result:
+                chunk = self.cache.get((self.key, chunk_idx))
+                if chunk is not None:
+                    result[chunk_idx] = chunk
+        missing = [chunk_idx for chunk_idx in dict.fromkeys(chunk_indices) if chunk_idx not in result]
+        scheduler = get_read_scheduler()
+        context = current_read_priority()
+        # Interactive reads have no more urgent reads to let through, and are fetched at once
+        group = len(missing) if context[0] == "interactive" else self.fetch_group
+        pending = []
+        for start in range(0, len(missing), max(group, 1)):
+            # Chunks are claimed once the slot is granted: a fetch shared with other readers never waits for one
+            ticket = scheduler.acquire(*context)
+            owned = []
+            for chunk_idx in missing[start:start + group]:
+                future, owner = self.cache.claim((self.key, chunk_idx))
+                pending.append((chunk_idx, future))
+                if owner:
+                    owned.append((chunk_idx, future))
+            if len(missing) > group:
+                # Groups run in the fetch threads of the scheduler, as many at once as the class of the read is
+                # granted slots, so that more urgent reads get ahead between groups
+                scheduler.run_in_slot(ticket, self._fetch_group, owned)
+            else:
+                try:
+                    self._fetch_group(owned)
+                finally:
+                    scheduler.release(ticket)
+        for chunk_idx, future in pending:
+            result[chunk_idx] = future.result()
+        return [result[chunk_idx] for chunk_idx in chunk_indices]
+
+    def _bounds(self, region: Tuple[Any, ...]) -> Optional[List[Tuple[int, int, Union[slice, int]]]]:
+        """
+        Convert a region to per-axis (start, stop, selection within [start, stop)), or None if it is not made of integers and slices.
+        """
+        region = tuple(region) + (slice(None),) * (len(self.shape) - len(region))
+        if len(region) != len(self.shape):
+            return None
+        bounds = []
+        for axis, size in zip(region, self.shape):
+            if isinstance(axis, (int, np.integer)):
+                index = range(size)[axis]
+                bounds.append((index, index + 1, 0))
+            elif isinstance(axis, slice):
+                indices = range(size)[axis]
+                if len(indices) == 0:
+                    bounds.append((0, 0, slice(0, 0)))
+                    continue
+                start, stop = min(indices[0], indices[-1]), max(indices[0], indices[-1]) + 1
+                end = indices.stop - start
+                bounds.append((start, stop, slice(indices.start - start, end if end >= 0 else None, indices.step)))
+            else:
+                return None
+        return bounds
+
+    def read_many(self, regions: List[Tuple[Any, ...]]) -> List[NDArray]:
+        """
+        Read several regions, fetching the chunks they need once and concurrently.
+
+        Parameters
+        ----------
+        regions : List[Tuple[Union[slice, int], ...]]
+            The regions, as tuples of integers and slices. Other indices are read from the store directly.
+
+        Returns
+        -------
+        List[NDArray]
+            The regions, as new arrays.
+        """
+        all_bounds = [self._bounds(region) for region in regions]
+        needed: Dict[Tuple[int, ...], None] = {}
+        for bounds in all_bounds:
+            if bounds is not None and all(stop > start for start, stop, _ in bounds):
+                ranges = [range(start // n, -(-stop // n)) for (start, stop, _), n in zip(bounds, self.chunks)]
+                needed.update(dict.fromkeys(itertools.product(*ranges)))
+        chunks = dict(zip(needed, self.read_chunks(list(needed))))
+
+        results = []
+        for region, bounds in zip(regions, all_bounds):
+            if bounds is None:
+                with get_read_scheduler().slot():
+                    data = self.store[region]
+                    results.append(data.read().result() if isinstance(data, ts.TensorStore) else np.asarray(data))
+                continue
+            box = np.empty([stop - start for start, stop, _ in bounds], dtype=self.dtype)
+            if box.size:
+                ranges = [range(start // n, -(-stop // n)) for (start, stop, _), n in zip(bounds, self.chunks)]
+                for chunk_idx in itertools.product(*ranges):
+                    # Overlap of the chunk and the bounding box, in array coordinates
+                    low = [max(c * n, start) for c, n, (start, _, _) in zip(chunk_idx, self.chunks, bounds)]
+                    high = [min((c + 1) * n, stop) for c, n, (_, stop, _) in zip(chunk_idx, self.chunks, bounds)]
+                    box[tuple(slice(l - start, h - start) for l, h, (start, _, _) in zip(low, high, bounds))] = \
+                        chunks[chunk_idx][tuple(slice(l - c * n, h - c * n) for l, h, c, n in zip(low, high, chunk_idx, self.chunks))]
+            results.append(np.asarray(box[tuple(selection for _, _, selection in bounds)]))
+        return results
+
+    def read(self, region: Tuple[Any, ...]) -> NDArray:
+        """
+        Read a region.
+
+        Parameters
+        ----------
+        region : Tuple[Union[slice, int], ...]
+            The region, as a tuple of integers and slices.
+
+        Returns
+        -------
+        NDArray
+            The region, as a new array.
+        """
+        return self.read_many([region])[0]
@@ -0,0 +1,317 @@
+import os
+import queue
+import threading
+import requests
+import numpy as np
+from numpy.typing import NDArray
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+from .volume import Volume
+from .tiles import TileIndex
+from .cache import LRUCache
+from .scheduler import bind_read_priority
+from .paths.metadata import get_metadata_cache
+
+# Default total size of the full-resolution ink labels kept in memory by a dataset
+LABEL_CACHE_BYTES = 1 << 30
+
+
+class SegmentDataset:
+    """
+    A dataset of (surface volume patch, ink label patch) pairs drawn from many segments.
+
+    Segments are opened concurrently and their ink labels are indexed once, at a coarse resolution,
+    into tiles with and without ink. Patches are then read on demand, optionally with balanced
+    sampling of ink and background tiles and a background prefetch thread pool.
+
+    Tiles without papyrus, according to the persisted `TileIndex` of each segment, are never read.
+    Ink labels are only checked to exist when the dataset is created: they are downloaded to build a missing
+    tile index and by `__getitem__`, and at most `label_cache` bytes of decoded labels are kept in memory.
+
+    The class implements `__len__` and `__getitem__`, so it can be wrapped directly by a PyTorch `DataLoader`.
+
+    Attributes
+    ----------
+    segment_ids : List[int]
+        IDs of the segments that were opened and have an ink label.
+    volumes : List[Volume]
+        The opened segment volumes, in the same order as `segment_ids`.
+    tile_size : int
+        Size of the tiles along the Y and X dimensions.
+    stride : int
+        Stride between tiles along the Y and X dimensions.
+    z_start : int
+        First surface volume layer of each patch.
+    z_depth : int
+        Number of surface volume layers of each patch.
+    label_scale : int
+        Downsampling factor of the ink label used to build the tile index.
+    min_ink : float
+        Minimum fraction of ink pixels for a tile to count as an ink tile.
+    min_papyrus : float
+        Tiles with at most this fraction of papyrus pixels are skipped.
+    label_cache : int
+        Maximum total size in bytes of the decoded ink labels kept in memory.
+    tile_indices : List[TileIndex]
+        The tile index of every segment.
+    tiles : NDArray
+        Array of shape (N, 3) with the (segment index, y, x) of every indexed tile.
+    ink_fraction : NDArray
+        Fraction of ink pixels of every indexed tile, measured on the coarse ink label.
+    """
+    def __init__(self, segment_ids: Sequence[Union[int, str]], tile_size: int = 256, stride: Optional[int] = None, z_start: int = 26, z_depth: int = 16, label_scale: int = 8, min_ink: float = 0.05, min_papyrus: float = 0, cache_dir: Optional[os.PathLike] = None, num_workers: int = 8, label_cache: int = LABEL_CACHE_BYTES, **volume_kwargs: Any) -> None:
+        """
+        Initialize the SegmentDataset object.
+
+        Parameters
+        ----------
+        segment_ids : Sequence[Union[int, str]]
+            IDs of the segments to use, e.g. taken from `list_files()`.
+        tile_size : int, default = 256
+            Size of the tiles along the Y and X dimensions.
+        stride : Optional[int], default = None
+            Stride between tiles along the Y and X dimensions. If None it equals `tile_size`.
+        z_start : int, default = 26
+            First surface volume layer of each patch.
+        z_depth : int, default = 16
+            Number of surface volume layers of each patch.
+        label_scale : int, default = 8
+            Downsampling factor of the ink label used to build the tile index.
+        min_ink : float, default = 0.05
+            Minimum fraction of ink pixels for a tile to count as an ink tile.
+        min_papyrus : float, default = 0
+            Tiles with at most this fraction of papyrus pixels are skipped.
+        cache_dir : Optional[os.PathLike], default = None
+            Directory where the tile indices are stored. If None they will be saved in $HOME / vesuvius / tile-index
+        num_workers : int, default = 8
+            Number of threads used to open the segments and to prefetch patches.
+        label_cache : int, default = LABEL_CACHE_BYTES
+            Maximum total size in bytes of the decoded full-resolution ink labels kept in memory (1 GiB by default).
+            Least recently used labels are dropped and downloaded again when needed.
+        **volume_kwargs : Any
+            Additional keyword arguments passed to `Volume`, e.g. `normalize=True`.
+        """
+        self.tile_size = tile_size
+        self.stride = stride if stride is not None else tile_size
+        self.z_start = z_start
+        self.z_depth = z_depth
+        self.label_scale = label_scale
+        self.min_ink = min_ink
+        self.min_papyrus = min_papyrus
+        self.cache_dir = cache_dir
+        self.num_workers = num_workers
+        self.label_cache = label_cache
+        self._labels = LRUCache(label_cache)
+
+        with ThreadPoolExecutor(max_workers=num_workers) as executor:
+            opened = list(executor.map(lambda segment_id: self._open_segment(segment_id, volume_kwargs), segment_ids))
+
+        self.segment_ids: List[int] = []
+        self.volumes: List[Volume] = []
+        for segment_id, volume in zip(segment_ids, opened):
+            if volume is not None:
+                self.segment_ids.append(int(segment_id))
+                self.volumes.append(volume)
+
+        self.tiles, self.ink_fraction = self.build_index()
+
+    @staticmethod
+    def _open_segment(segment_id: Union[int, str], volume_kwargs: Any) -> Optional[Volume]:
+        try:
+            volume = Volume(int(segment_id), **volume_kwargs)
+        except Exception as e:
+            print(f"Skipping segment {segment_id}: {e}")
+            return None
+        # Only check that the label exists: it is downloaded when a tile index or a patch needs it
+        url = volume._inklabel_url()
+        try:
+            found = os.path.isfile(url) if volume.domain == "local" else get_metadata_cache().get_validator(url) is not None
+        except requests.RequestException as e:
+            print(f"Skipping segment {segment_id}: could not check the ink label: {e}")
+            return None
+        if not found:
+            print(f"Skipping segment {segment_id}: no ink label available.")
+            return None
+        return volume
+
+    def __getstate__(self) -> Dict[str, Any]:
+        state = self.__dict__.copy()
+        state.pop('_labels', None)
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        self._labels = LRUCache(self.label_cache)
+
+    @staticmethod
+    def _load_label(volume: Volume) -> NDArray:
+        inklabel = volume._fetch_inklabel()
+        if inklabel is not None and inklabel.ndim == 3 and inklabel.shape[-1] in (3, 4):
+            # RGB(A) label images carry the same mask in every channel
+            inklabel = inklabel[..., 0]
+        if inklabel is None or inklabel.ndim != 2:
+            print(f"Using an empty ink label for segment {volume.segment_id}: the label could not be read.")
+            return np.zeros(volume.shape(0)[1:], dtype=np.uint8)
+        return inklabel
+
+    def label(self, segment_idx: int) -> NDArray:
+        """
+        Get the full-resolution ink label of a segment, downloading it if it is not in the label cache.
+
+        Parameters
+        ----------
+        segment_idx : int
+            Index of the segment in `volumes`.
+
+        Returns
+        -------
+        NDArray
+            The 2D ink label.
+        """
+        volume = self.volumes[segment_idx]
+        return self._labels.get_or_load(segment_idx, lambda: self._load_label(volume))
+
+    def build_index(self) -> Tuple[NDArray, NDArray]:
+        """
+        Load or build the tile index of every segment and collect the tiles containing papyrus.
+
+        Returns
+        -------
+        Tuple[NDArray, NDArray]
+            The (segment index, y, x) of every tile and the fraction of ink pixels in it.
+        """
+        with ThreadPoolExecutor(max_workers=self.num_workers) as executor:
+            self.tile_indices = list(executor.map(
+                lambda volume: TileIndex.for_volume(volume, self.tile_size, self.stride, cache_dir=self.cache_dir, label_scale=self.label_scale),
+                self.volumes
+            ))
+
+        tiles = []
+        fractions = []
+        for segment_idx, index in enumerate(self.tile_indices):
+            corners, ink = index.positions(min_papyrus=self.min_papyrus)
+            tiles.append(np.concatenate([np.full((len(corners), 1), segment_idx), corners], axis=1))
+            fractions.append(ink)
+
+        if not tiles:
+            return np.zeros((0, 3), dtype=np.int64), np.zeros(0, dtype=np.float64)
+        return np.concatenate(tiles).astype(np.int64), np.concatenate(fractions)
+
+    @property
+    def ink_tiles(self) -> NDArray:
+        """
+        Indices of the tiles with at least `min_ink` ink.
+        """
+        return np.nonzero(self.ink_fraction >= self.min_ink)[0]
+
+    @property
+    def background_tiles(self) -> NDArray:
+        """
+        Indices of the tiles with less than `min_ink` ink.
+        """
+        return np.nonzero(self.ink_fraction < self.min_ink)[0]
+
+    def __len__(self) -> int:
+        return len(self.tiles)
+
+    def __getitem__(self, idx: int) -> Tuple[NDArray, NDArray]:
+        """
+        Read the patch and the ink label of a tile.
+
+        Parameters
+        ----------
+        idx : int
+            Index of the tile.
+
+        Returns
+        -------
+        Tuple[NDArray, NDArray]
+            The surface volume patch of shape (z_depth, tile_size, tile_size) and the ink label patch of shape (tile_size, tile_size) in [0, 1].
+        """
+        segment_idx, y, x = self.tiles[idx]
+        volume = self.volumes[segment_idx]
+        patch = volume[self.z_start:self.z_start + self.z_depth, y:y + self.tile_size, x:x + self.tile_size]
+        label = self.label(segment_idx)[y:y + self.tile_size, x:x + self.tile_size] / 255
+        return patch, label
+
+    def sample_indices(self, num_samples: int, ink_ratio: float = 0.5, seed: Optional[int] = None) -> NDArray:
+        """
+        Draw tile indices with a fixed proportion of ink and background tiles.
+
+        Parameters
+        ----------
+        num_samples : int
+            Number of indices to draw.
+        ink_ratio : float, default = 0.5
+            Fraction of the drawn indices taken from the ink tiles.
+        seed : Optional[int], default = None
+            Seed of the random generator.
+
+        Returns
+        -------
+        NDArray
+            The shuffled tile indices.
+        """
+        rng = np.random.default_rng(seed)
+        ink_tiles, background_tiles = self.ink_tiles, self.background_tiles
+        num_ink = int(round(num_samples * ink_ratio)) if len(background_tiles) else num_samples
+        if not len(ink_tiles):
+            num_ink = 0
+        parts = []
+        if num_ink:
+            parts.append(rng.choice(ink_tiles, num_ink))
+        if num_samples - num_ink:
+            parts.append(rng.choice(background_tiles, num_samples - num_ink))
+        indices = np.concatenate(parts) if parts else np.zeros(0, dtype=np.int64)
+        rng.shuffle(indices)
+        return indices
+
+    def iterate(self, indices: Optional[Sequence[int]] = None, prefetch: int = 16) -> Iterator[Tuple[NDArray, NDArray]]:
+        """
+        Iterate over (patch, label) pairs, reading up to `prefetch` patches ahead in background threads.
+
+        Parameters
+        ----------
+        indices : Optional[Sequence[int]], default = None
+            Tile indices to visit, e.g. from `sample_indices`. If None all tiles are visited in order.
+        prefetch : int, default = 16
+            Maximum number of patches read ahead of the consumer.
+
+        Yields
+        ------
+        Tuple[NDArray, NDArray]
+            The surface volume patch and the ink label patch.
+        """
+        if indices is None:
+            indices = range(len(self))
+        pending: queue.Queue = queue.Queue()
+        slots = threading.Semaphore(max(prefetch, 1))
+        stop = threading.Event()
+        # Patches are read in the pool with the read priority of the consumer
+        read = bind_read_priority(self.__getitem__)
+
+        with ThreadPoolExecutor(max_workers=self.num_workers) as executor:
+            def submit_all() -> None:
+                try:
+                    for idx in indices:
+                        slots.acquire()
+                        if stop.is_set():
+                            return
+                        pending.put(executor.submit(read, int(idx)))
+                except RuntimeError:
+                    # The executor was shut down because the consumer stopped early
+                    return
+                pending.put(None)
+
+            producer = threading.Thread(target=submit_all, daemon=True)
+            producer.start()
+            try:
+                while True:
+                    future = pending.get()
+                    if future is None:
+                        break
+                    yield future.result()
+                    slots.release()
+            finally:
+                stop.set()
+                slots.release()
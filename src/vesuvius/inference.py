@@ -0,0 +1,289 @@
+import os
+import itertools
+import numpy as np
+from collections import deque
+from numpy.typing import NDArray
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
+from .store import PredictionStore
+from .scheduler import bind_read_priority
+
+# Blend windows are clipped to this fraction of their maximum, so tile borders keep a nonzero weight
+MIN_BLEND_WEIGHT = 1e-3
+
+
+def blend_window(shape: Sequence[int], blend: str = "gaussian") -> NDArray:
+    """
+    Build the weights given to every voxel of a tile prediction when overlapping tiles are averaged.
+
+    Parameters
+    ----------
+    shape : Sequence[int]
+        Shape of the tile prediction.
+    blend : str, default = "gaussian"
+        "constant" for a plain average, "linear" for weights decreasing linearly towards the tile borders,
+        "gaussian" for a Gaussian of standard deviation 1/8 of the tile size centered on the tile.
+
+    Returns
+    -------
+    NDArray
+        The float32 window, of the given shape.
+    """
+    window = np.ones((), dtype=np.float32)
+    for n in shape:
+        position = (np.arange(n, dtype=np.float32) + 0.5) / n
+        if blend == "constant":
+            weights = np.ones(n, dtype=np.float32)
+        elif blend == "linear":
+            weights = 1 - np.abs(2 * position - 1)
+        elif blend == "gaussian":
+            weights = np.exp(-0.5 * ((position - 0.5) * 8) ** 2)
+        else:
+            raise ValueError("blend should be 'constant', 'linear' or 'gaussian'.")
+        window = np.multiply.outer(window, weights)
+    window = window.astype(np.float32)
+    return np.maximum(window, MIN_BLEND_WEIGHT * window.max())
+
+
+def tile_starts(size: int, tile: int, step: int) -> List[int]:
+    """
+    Get the start of the tiles covering an axis, the last one ending on the axis end.
+
+    Parameters
+    ----------
+    size : int
+        Length of the axis.
+    tile : int
+        Length of the tiles.
+    step : int
+        Distance between the starts of consecutive tiles.
+
+    Returns
+    -------
+    List[int]
+        The starts, in increasing order.
+    """
+    if size <= tile:
+        return [0]
+    starts = list(range(0, size - tile + 1, step))
+    if starts[-1] + tile < size:
+        starts.append(size - tile)
+    return starts
+
+
+class _TileAccumulator:
+    """
+    Blend tile predictions, keeping in memory only the parts of the output that are overlapped by added tiles and not final yet.
+
+    The output is split into cells at the starts and stops of the tiles along every axis. Every tile owns the cells
+    from its start to the start of the next tile (to the end of the axis for the last tile). Tiles must be added in
+    the lexicographic order of their starts, as `itertools.product` yields them: all the tiles covering the cells
+    of a tile have then been added with it, so its block is divided by its weight, passed to `write` with its
+    region, and its cells are released. Cells overlapped by the current tile and owned by later tiles, at most
+    one row of tiles and the overlap with the next band, are the only ones held.
+
+    Attributes
+    ----------
+    nbytes : int
+        Size of the cells held.
+    peak_nbytes : int
+        Largest size of the cells held at once.
+    """
+    def __init__(self, write: Callable[[Tuple[slice, ...], NDArray], None], channels: Tuple[int, ...], size: Tuple[int, ...], starts: Sequence[Sequence[int]], tile: Tuple[int, ...], window: NDArray) -> None:
+        self.write = write
+        self.channels = channels
+        self.size = size
+        self.tile = tile
+        self.window = window
+        self.starts = [list(axis_starts) for axis_starts in starts]
+        # Cell bounds along every axis, and the cells covered and owned by every tile
+        self.bounds = []
+        self.covered = []
+        self.owned = []
+        for axis_starts, t, n in zip(self.starts, tile, size):
+            stops = [min(a + t, n) for a in axis_starts]
+            bounds = sorted(set(axis_starts) | set(stops) | {n})
+            self.bounds.append(bounds)
+            self.covered.append([range(bounds.index(a), bounds.index(b)) for a, b in zip(axis_starts, stops)])
+            ends = axis_starts[1:] + [n]
+            self.owned.append([range(bounds.index(a), bounds.index(b)) for a, b in zip(axis_starts, ends)])
+        self.cells: Dict[Tuple[int, ...], Tuple[NDArray, NDArray]] = {}
+        self.nbytes = 0
+        self.peak_nbytes = 0
+
+    def add(self, start: Tuple[int, ...], prediction: NDArray) -> None:
+        """
+        Add the prediction of a tile starting at `start` in output coordinates, and write the block it owns.
+        """
+        index = tuple(axis_starts.index(a) for axis_starts, a in zip(self.starts, start))
+        for cell in itertools.product(*(covered[i] for covered, i in zip(self.covered, index))):
+            low = tuple(bounds[c] for bounds, c in zip(self.bounds, cell))
+            high = tuple(bounds[c + 1] for bounds, c in zip(self.bounds, cell))
+            if cell not in self.cells:
+                extent = tuple(h - l for l, h in zip(low, high))
+                self.cells[cell] = (np.zeros(self.channels + extent, dtype=np.float32), np.zeros(extent, dtype=np.float32))
+                self.nbytes += sum(array.nbytes for array in self.cells[cell])
+                self.peak_nbytes = max(self.peak_nbytes, self.nbytes)
+            values, weights = self.cells[cell]
+            source = tuple(slice(l - a, h - a) for l, h, a in zip(low, high, start))
+            window = self.window[source]
+            values += prediction[(Ellipsis,) + source] * window
+            weights += window
+
+        owned = [owned[i] for owned, i in zip(self.owned, index)]
+        origin = tuple(bounds[cells[0]] for bounds, cells in zip(self.bounds, owned))
+        region = tuple(slice(o, bounds[cells[-1] + 1]) for o, bounds, cells in zip(origin, self.bounds, owned))
+        blended = np.zeros(self.channels + tuple(r.stop - r.start for r in region), dtype=np.float32)
+        for cell in itertools.product(*owned):
+            values, weights = self.cells.pop(cell)
+            self.nbytes -= values.nbytes + weights.nbytes
+            target = tuple(slice(bounds[c] - o, bounds[c + 1] - o) for bounds, c, o in zip(self.bounds, cell, origin))
+            np.divide(values, weights, out=blended[(Ellipsis,) + target], where=weights > 0)
+        self.write(region, blended)
+
+
+def sliding_window_inference(volume: Any, predict: Callable[[NDArray], Any], tile_shape: Sequence[int], overlap: Union[int, Sequence[int]] = 0, region: Optional[Tuple[slice, ...]] = None, subvolume_idx: int = 0, blend: str = "gaussian", batch_size: int = 8, output: Optional[Any] = None, output_dtype: Any = np.float32, prefetch: int = 2) -> Any:
+    """
+    Run a model over a region of a volume tile by tile and blend the overlapping tile predictions.
+
+    Tiles are read in batches, `prefetch` batches ahead of the model, through the chunk-level reads of the
+    volume (so tiles whose step is a multiple of the chunk shape read every chunk once). Overlaps are blended
+    with a weighted average. Every tile's block of the output, from its start to the start of the next tile, is
+    written to `output` as soon as no later tile overlaps it, so only the parts of the output still overlapped by
+    upcoming tiles are held in memory. `output` can be a NumPy array, a memory map, a zarr array or a `PredictionStore`.
+
+    Parameters
+    ----------
+    volume : Volume
+        The volume.
+    predict : Callable[[NDArray], Any]
+        Function mapping a batch of tiles of shape (B, *tile_shape) to predictions convertible to a NumPy array,
+        of shape (B, *channels, *tile_shape) for 3D predictions or (B, *channels, tile_shape[1], tile_shape[2]) for
+        2D predictions of the (y, x) plane. 2D predictions need tiles spanning the whole z range of the region.
+    tile_shape : Sequence[int]
+        (z, y, x) shape of the tiles.
+    overlap : Union[int, Sequence[int]], default = 0
+        Overlap of consecutive tiles, for all the axes or for every axis.
+    region : Optional[Tuple[slice, ...]], default = None
+        (z, y, x) slices, without step, of the region in the coordinates of the sub-volume. If None the whole sub-volume is used.
+    subvolume_idx : int, default = 0
+        Index of the sub-volume.
+    blend : str, default = "gaussian"
+        Blend window of the tile predictions: "constant", "linear" or "gaussian" (see `blend_window`).
+    batch_size : int, default = 8
+        Number of tiles per call of `predict`.
+    output : Optional[Any], default = None
+        Where the predictions are written:
+        - None: a new NumPy array of shape (*channels, *region_shape);
+        - an array of shape (*channels, *region_shape);
+        - a `PredictionStore` aligned with the volume, written at the position of the region in level `subvolume_idx`;
+        - a path: a new `PredictionStore` aligned with the volume (see `Volume.create_store`), closed with its pyramid at the end.
+    output_dtype : Any, default = np.float32
+        Dtype of the allocated output.
+    prefetch : int, default = 2
+        Number of batches read ahead of the model.
+
+    Returns
+    -------
+    Any
+        The output array or store.
+
+    Raises
+    ------
+    ValueError
+        If the tiles, the overlap, the region or the prediction shapes are invalid.
+    """
+    shape = volume.shape(subvolume_idx)
+    region = tuple(range(size)[axis] for size, axis in zip(shape, region or (slice(None),) * 3))
+    if any(axis.step != 1 for axis in region) or len(region) != 3:
+        raise ValueError("The region must be three slices without step.")
+    size = tuple(len(axis) for axis in region)
+    tile_shape = tuple(int(n) for n in tile_shape)
+    overlap = tuple(int(n) for n in (overlap if isinstance(overlap, Sequence) else (overlap,) * 3))
+    if len(tile_shape) != 3 or len(overlap) != 3:
+        raise ValueError("tile_shape and overlap must have three values (z, y, x).")
+    if any(o < 0 or o >= t for o, t in zip(overlap, tile_shape)):
+        raise ValueError("The overlap must be smaller than the tiles.")
+
+    starts = [tile_starts(s, t, t - o) for s, t, o in zip(size, tile_shape, overlap)]
+    tiles = list(itertools.product(*starts))
+    batches = [tiles[i:i + batch_size] for i in range(0, len(tiles), batch_size)]
+
+    def read_batch(batch: List[Tuple[int, ...]]) -> NDArray:
+        regions = [
+            tuple(slice(axis.start + a, axis.start + min(a + t, s)) for axis, a, t, s in zip(region, start, tile_shape, size))
+            for start in batch
+        ]
+        arrays = volume._read_regions(subvolume_idx, regions)
+        # Tiles larger than the region are padded with zeros
+        arrays = [np.pad(array, [(0, t - n) for t, n in zip(tile_shape, array.shape)]) for array in arrays]
+        inputs = np.stack(arrays)
+        return volume._normalize(inputs) if volume.normalize else inputs
+
+    accumulator: Optional[_TileAccumulator] = None
+    output_axes = (0, 1, 2)
+    created = None
+
+    def create_accumulator(predictions: NDArray) -> _TileAccumulator:
+        nonlocal output, output_axes, created
+        if predictions.ndim >= 4 and predictions.shape[-3:] == tile_shape:
+            output_axes = (0, 1, 2)
+        elif predictions.ndim >= 3 and predictions.shape[-2:] == tile_shape[1:]:
+            if len(starts[0]) > 1:
+                raise ValueError("2D predictions need tiles spanning the whole z range of the region.")
+            output_axes = (1, 2)
+        else:
+            raise ValueError(f"Predictions of shape {predictions.shape[1:]} do not match tiles of shape {tile_shape}.")
+        channels = predictions.shape[1:predictions.ndim - len(output_axes)]
+        output_size = tuple(size[axis] for axis in output_axes)
+        output_tile = tuple(tile_shape[axis] for axis in output_axes)
+
+        if isinstance(output, (str, os.PathLike)):
+            output = created = volume.create_store(output, dtype=output_dtype, channels=channels, ndim=len(output_axes))
+        if isinstance(output, PredictionStore):
+            store = output
+            origin = tuple(region[axis].start for axis in output_axes)
+            def write(roi: Tuple[slice, ...], data: NDArray) -> None:
+                store.write(tuple(slice(o + r.start, o + r.stop) for o, r in zip(origin, roi)), data, level=subvolume_idx)
+        else:
+            if output is None:
+                output = np.zeros(channels + output_size, dtype=output_dtype)
+            elif tuple(output.shape) != channels + output_size:
+                raise ValueError(f"The output should have shape {channels + output_size}.")
+            array = output
+            def write(roi: Tuple[slice, ...], data: NDArray) -> None:
+                array[(slice(None),) * len(channels) + roi] = data.astype(array.dtype, copy=False)
+        output_starts = [starts[axis] for axis in output_axes]
+        return _TileAccumulator(write, channels, output_size, output_starts, output_tile, blend_window(output_tile, blend))
+
+    # Tiles are read in the prefetch threads with the read priority of the caller
+    read_batch = bind_read_priority(read_batch)
+    try:
+        with ThreadPoolExecutor(max_workers=max(prefetch, 1)) as executor:
+            remaining = iter(batches)
+            pending = deque((batch, executor.submit(read_batch, batch)) for batch in itertools.islice(remaining, max(prefetch, 1)))
+            while pending:
+                batch, future = pending.popleft()
+                inputs = future.result()
+                following = next(remaining, None)
+                if following is not None:
+                    pending.append((following, executor.submit(read_batch, following)))
+
+                predictions = np.asarray(predict(inputs))
+                if accumulator is None:
+                    accumulator = create_accumulator(predictions)
+                if predictions.shape[0] != len(batch):
+                    raise ValueError("predict must return one prediction per tile.")
+
+                for start, prediction in zip(batch, predictions):
+                    accumulator.add(tuple(start[axis] for axis in output_axes), prediction)
+
+        if isinstance(output, PredictionStore) and output is not created:
+            output.flush()
+    except BaseException:
+        if created is not None:
+            created.close(pyramid=False)
+        raise
+    if created is not None:
+        created.close()
+    return output
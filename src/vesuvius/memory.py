@@ -0,0 +1,247 @@
+import os
+import sys
+import threading
+from typing import Callable, Dict, List, Optional
+
+# Limits at or above this value mean "no limit" in cgroup files
+_UNLIMITED = 1 << 60
+
+CGROUP_ROOT = "/sys/fs/cgroup"
+
+# Fraction of the memory limit (physical memory or cgroup limit) given to the caches of volumes opened with cache_pool=None
+CACHE_FRACTION = float(os.environ.get("VESUVIUS_CACHE_FRACTION", 0.25))
+
+# Cache budget used when the memory limit cannot be determined
+FALLBACK_CACHE_BYTES = 1024 ** 3
+
+# Cache budget set with set_cache_budget or VESUVIUS_CACHE_BYTES, None when derived from the memory limit
+_cache_budget: Optional[int] = int(float(os.environ["VESUVIUS_CACHE_BYTES"])) if os.environ.get("VESUVIUS_CACHE_BYTES") else None
+# Number of processes sharing the memory limit, set with set_cache_processes or VESUVIUS_CACHE_PROCESSES
+_cache_processes: Optional[int] = max(int(os.environ["VESUVIUS_CACHE_PROCESSES"]), 1) if os.environ.get("VESUVIUS_CACHE_PROCESSES") else None
+_budget_listeners: List[Callable[[int], None]] = []
+_budget_lock = threading.Lock()
+
+
+def _read_int(path: str) -> Optional[int]:
+    try:
+        with open(path, 'r') as file:
+            value = file.read().strip()
+    except OSError:
+        return None
+    if not value.isdigit():
+        # "max" in cgroup v2 files
+        return None
+    value = int(value)
+    return value if value < _UNLIMITED else None
+
+
+def _cgroup_files(name_v2: str, name_v1: str) -> list:
+    """
+    Candidate paths of a memory controller file of the cgroup of this process, for cgroup v2 and v1.
+    """
+    paths = []
+    try:
+        with open("/proc/self/cgroup", 'r') as file:
+            lines = file.read().splitlines()
+    except OSError:
+        lines = []
+    for line in lines:
+        parts = line.split(":", 2)
+        if len(parts) != 3:
+            continue
+        hierarchy, controllers, group = parts
+        if hierarchy == "0" and controllers == "":
+            paths.append(os.path.join(CGROUP_ROOT, group.lstrip("/"), name_v2))
+        elif "memory" in controllers.split(","):
+            paths.append(os.path.join(CGROUP_ROOT, "memory", group.lstrip("/"), name_v1))
+    # Inside a cgroup namespace the group of the process is mounted at the root
+    paths += [os.path.join(CGROUP_ROOT, name_v2), os.path.join(CGROUP_ROOT, "memory", name_v1)]
+    return paths
+
+
+def physical_memory() -> Optional[int]:
+    """
+    Get the physical memory of the machine in bytes, or None if it cannot be determined.
+    """
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def cgroup_memory_limit() -> Optional[int]:
+    """
+    Get the memory limit of the cgroup (container) of this process in bytes, or None if it is unlimited or unknown.
+    """
+    limits = [_read_int(path) for path in _cgroup_files("memory.max", "memory.limit_in_bytes")]
+    limits = [limit for limit in limits if limit is not None]
+    return min(limits) if limits else None
+
+
+def cgroup_memory_usage() -> Optional[int]:
+    """
+    Get the memory used by the cgroup (container) of this process in bytes, or None if unknown.
+    """
+    for path in _cgroup_files("memory.current", "memory.usage_in_bytes"):
+        usage = _read_int(path)
+        if usage is not None:
+            return usage
+    return None
+
+
+def memory_limit() -> Optional[int]:
+    """
+    Get the memory this process can use in bytes: the smallest of the physical memory and the cgroup limit.
+
+    Returns
+    -------
+    Optional[int]
+        The limit, or None if neither can be determined.
+    """
+    limits = [limit for limit in (physical_memory(), cgroup_memory_limit()) if limit is not None]
+    return min(limits) if limits else None
+
+
+def available_memory() -> Optional[int]:
+    """
+    Get the memory still available to this process in bytes, from /proc/meminfo and the cgroup usage.
+
+    Returns
+    -------
+    Optional[int]
+        The available memory, or None if it cannot be determined.
+    """
+    available = []
+    try:
+        with open("/proc/meminfo", 'r') as file:
+            for line in file:
+                if line.startswith("MemAvailable:"):
+                    available.append(int(line.split()[1]) * 1024)
+                    break
+    except (OSError, ValueError, IndexError):
+        pass
+    limit, usage = cgroup_memory_limit(), cgroup_memory_usage()
+    if limit is not None and usage is not None:
+        available.append(max(limit - usage, 0))
+    return min(available) if available else None
+
+
+def memory_info() -> Dict[str, Optional[int]]:
+    """
+    Get the memory limits and availability seen by this process.
+
+    Returns
+    -------
+    Dict[str, Optional[int]]
+        The physical memory, the cgroup limit and usage, the effective limit and the available memory, in bytes.
+    """
+    return {
+        "physical": physical_memory(),
+        "cgroup_limit": cgroup_memory_limit(),
+        "cgroup_usage": cgroup_memory_usage(),
+        "limit": memory_limit(),
+        "available": available_memory(),
+    }
+
+
+def cache_processes() -> int:
+    """
+    Get the number of processes sharing the memory limit, among which the derived cache budget is split.
+
+    Returns
+    -------
+    int
+        The number set with `set_cache_processes` or `VESUVIUS_CACHE_PROCESSES`, or else, in a PyTorch
+        `DataLoader` worker, the number of workers plus the main process, or else 1.
+    """
+    if _cache_processes is not None:
+        return _cache_processes
+    # Only if PyTorch is already used: it is never imported here
+    data = sys.modules.get("torch.utils.data")
+    info = data.get_worker_info() if data is not None and hasattr(data, "get_worker_info") else None
+    return info.num_workers + 1 if info is not None else 1
+
+
+def get_cache_budget() -> int:
+    """
+    Get the byte budget shared by the caches of the volumes opened with `cache_pool=None`.
+
+    Returns
+    -------
+    int
+        The budget set with `set_cache_budget` or `VESUVIUS_CACHE_BYTES`, or else `CACHE_FRACTION` (25% by default,
+        `VESUVIUS_CACHE_FRACTION`) of the smallest of the physical memory and the cgroup memory limit, split
+        evenly among the `cache_processes()` processes sharing it (e.g. a training process and its data loader workers).
+    """
+    if _cache_budget is not None:
+        return _cache_budget
+    limit = memory_limit()
+    return int(limit * CACHE_FRACTION / cache_processes()) if limit is not None else FALLBACK_CACHE_BYTES
+
+
+def _notify_budget() -> int:
+    with _budget_lock:
+        listeners = list(_budget_listeners)
+    budget = get_cache_budget()
+    for listener in listeners:
+        listener(budget)
+    return budget
+
+
+def set_cache_budget(max_bytes: Optional[int]) -> int:
+    """
+    Change the byte budget of the caches of the volumes opened with `cache_pool=None`, at runtime.
+
+    Parameters
+    ----------
+    max_bytes : Optional[int]
+        The new budget of this process, or None to derive it from the memory limit again.
+
+    Returns
+    -------
+    int
+        The budget now in effect.
+    """
+    global _cache_budget
+    with _budget_lock:
+        _cache_budget = None if max_bytes is None else int(max_bytes)
+    return _notify_budget()
+
+
+def set_cache_processes(processes: Optional[int]) -> int:
+    """
+    Set the number of processes sharing the memory limit, so that the cache budget derived from it is split among them.
+
+    Every process (e.g. the main process and each of its data loader workers, in a `worker_init_fn`) should call it
+    with the same number, or the `VESUVIUS_CACHE_PROCESSES` environment variable can be set before they start.
+
+    Parameters
+    ----------
+    processes : Optional[int]
+        The number of processes, or None to detect it again (see `cache_processes`).
+
+    Returns
+    -------
+    int
+        The budget now in effect.
+    """
+    global _cache_processes
+    with _budget_lock:
+        _cache_processes = None if processes is None else max(int(processes), 1)
+    return _notify_budget()
+
+
+def on_cache_budget_change(listener: Callable[[int], None]) -> None:
+    """
+    Register a function called with the new budget whenever `set_cache_budget` or `set_cache_processes` is called.
+    """
+    with _budget_lock:
+        _budget_listeners.append(listener)
+
+
+def _reset_after_fork() -> None:
+    global _budget_lock
+    _budget_lock = threading.Lock()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
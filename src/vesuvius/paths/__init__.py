@@ -1,3 +1,29 @@
-from .utils import update_list, list_files, list_cubes
-from .local import update_local_list
-__all__ = ["update_list", "update_local_list", "list_files", "list_cubes"]
\ No newline at end of file
+import importlib
+from typing import Any, List
+
+# Public names and the submodule defining them, imported on first access
+_EXPORTS = {
+    "update_list": ".utils",
+    "list_files": ".utils",
+    "list_cubes": ".utils",
+    "export_catalog": ".utils",
+    "refresh_catalog": ".utils",
+    "update_local_list": ".local",
+    "query_catalog": ".query",
+    "CatalogEntry": ".query",
+    "MetadataCache": ".metadata",
+    "get_metadata_cache": ".metadata",
+    "configure_metadata_cache": ".metadata",
+}
+
+__all__ = ["update_list", "update_local_list", "list_files", "list_cubes", "export_catalog", "refresh_catalog", "query_catalog", "CatalogEntry", "MetadataCache", "get_metadata_cache", "configure_metadata_cache"]
+
+def __getattr__(name: str) -> Any:
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(_EXPORTS[name], __name__), name)
+    globals()[name] = value
+    return value
+
+def __dir__() -> List[str]:
+    return sorted(set(globals()) | set(_EXPORTS))
@@ -0,0 +1,151 @@
+import os
+import stat
+import time
+import tempfile
+import threading
+from typing import Optional, Union
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+_umask: Optional[int] = None
+_umask_lock = threading.Lock()
+
+
+def _default_mode() -> int:
+    """
+    Get the permissions of a new file created with `open`, from the umask of the process (read once).
+    """
+    global _umask
+    with _umask_lock:
+        if _umask is None:
+            # The umask can only be read by setting it
+            _umask = os.umask(0o022)
+            os.umask(_umask)
+    return 0o666 & ~_umask
+
+
+def _reset_after_fork() -> None:
+    global _umask_lock
+    _umask_lock = threading.Lock()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def atomic_write(file_path: str, data: Union[str, bytes]) -> None:
+    """
+    Write a file atomically: the data goes to a temporary file in the same directory, which then replaces `file_path`.
+
+    Readers therefore see either the old or the new content, never a truncated file. The file keeps the permissions
+    of the file it replaces, and new files get the usual permissions of the umask (not the 0600 of temporary files).
+
+    Parameters
+    ----------
+    file_path : str
+        The path of the file to write.
+    data : Union[str, bytes]
+        The content of the file.
+
+    Returns
+    -------
+    None
+    """
+    directory = os.path.dirname(os.path.abspath(file_path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(file_path)}.", suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb' if isinstance(data, bytes) else 'w') as file:
+            file.write(data)
+            file.flush()
+            os.fsync(file.fileno())
+        try:
+            mode = stat.S_IMODE(os.stat(file_path).st_mode)
+        except OSError:
+            mode = _default_mode()
+        os.chmod(tmp_path, mode)
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+class FileLock:
+    """
+    An inter-process lock backed by `flock` (or `msvcrt.locking` on Windows) on a lock file.
+
+    Attributes
+    ----------
+    lock_path : str
+        The path of the lock file.
+    """
+    def __init__(self, lock_path: str) -> None:
+        """
+        Initialize the FileLock object.
+
+        Parameters
+        ----------
+        lock_path : str
+            The path of the lock file. It is created if missing and never removed.
+        """
+        self.lock_path = lock_path
+        self._fd: Optional[int] = None
+
+    def acquire(self, blocking: bool = True, poll_interval: float = 0.1) -> bool:
+        """
+        Acquire the lock.
+
+        Parameters
+        ----------
+        blocking : bool, default = True
+            If False, return immediately when another process holds the lock.
+        poll_interval : float, default = 0.1
+            Seconds between attempts on platforms without blocking locks.
+
+        Returns
+        -------
+        bool
+            True if the lock was acquired.
+        """
+        fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o666)
+        while True:
+            try:
+                if fcntl is not None:
+                    fcntl.flock(fd, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+                else:
+                    msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+                self._fd = fd
+                return True
+            except OSError:
+                if not blocking:
+                    os.close(fd)
+                    return False
+                time.sleep(poll_interval)
+
+    def release(self) -> None:
+        """
+        Release the lock.
+        """
+        if self._fd is None:
+            return
+        try:
+            if fcntl is not None:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+            else:
+                msvcrt.locking(self._fd, msvcrt.LK_UNLCK, 1)
+        finally:
+            os.close(self._fd)
+            self._fd = None
+
+    def __enter__(self) -> "FileLock":
+        self.acquire()
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.release()
@@ -0,0 +1,247 @@
+import os
+import json
+import threading
+from typing import Any, BinaryIO, Dict, Hashable, List, Optional, Tuple
+from .atomic import atomic_write
+from ..tracing import span, traced
+
+# Catalogs are stored as JSON lines: a header with the byte range of every top-level section (one per
+# scroll), followed by one line per section. Loading one section reads only the header and that line.
+CATALOG_FORMAT = "vesuvius-catalog"
+CATALOG_VERSION = 1
+
+# JSON objects only have string keys, dictionaries with other keys (e.g. the cubes catalog) are stored as pairs
+_ITEMS = "__items__"
+
+_memo: Dict[Tuple[str, Hashable], Tuple[Tuple[int, int, int], Any]] = {}
+_memo_lock = threading.Lock()
+_MISSING = object()
+
+
+def _encode(value: Any) -> Any:
+    if isinstance(value, dict):
+        if all(isinstance(key, str) for key in value):
+            return {key: _encode(item) for key, item in value.items()}
+        return {_ITEMS: [[key, _encode(item)] for key, item in value.items()]}
+    return value
+
+
+def _decode_object(obj: Dict[str, Any]) -> Any:
+    if len(obj) == 1 and _ITEMS in obj:
+        return {key: item for key, item in obj[_ITEMS]}
+    return obj
+
+
+def _file_key(file: BinaryIO) -> Tuple[int, int, int]:
+    # Catalogs are replaced by renaming a new file over them, which changes the inode
+    stat = os.fstat(file.fileno())
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+def _memoized(file_path: str, file_key: Tuple[int, int, int], part: Hashable, loader: Any) -> Any:
+    """
+    Return `loader()` for a part of a catalog file, reusing the previous result while the file is unchanged.
+    """
+    key = (file_path, part)
+    with _memo_lock:
+        cached = _memo.get(key)
+    if cached is not None and cached[0] == file_key:
+        return cached[1]
+    value = loader()
+    with _memo_lock:
+        _memo[key] = (file_key, value)
+    return value
+
+
+def save_catalog(file_path: str, data: Dict[Any, Any]) -> None:
+    """
+    Save a catalog dictionary as JSON lines, replacing the file atomically.
+
+    Parameters
+    ----------
+    file_path : str
+        The path of the catalog file.
+    data : Dict[Any, Any]
+        The catalog. Keys of any JSON scalar type are preserved.
+
+    Returns
+    -------
+    None
+    """
+    lines = [json.dumps(_encode(section), separators=(',', ':')).encode('utf-8') for section in data.values()]
+    sections: List[List[Any]] = []
+    # The header stores absolute offsets, so its own length must be known first: iterate until it is stable
+    header = b""
+    while True:
+        offset = len(header) + 1
+        sections = []
+        for key, line in zip(data.keys(), lines):
+            sections.append([key, offset, len(line)])
+            offset += len(line) + 1
+        new_header = json.dumps({"format": CATALOG_FORMAT, "version": CATALOG_VERSION, "sections": sections}, separators=(',', ':')).encode('utf-8')
+        stable = len(new_header) == len(header)
+        header = new_header
+        if stable:
+            break
+    atomic_write(file_path, b"\n".join([header] + lines) + b"\n")
+
+
+def _read_header(file_path: str, file: BinaryIO, file_key: Tuple[int, int, int]) -> Dict[str, Any]:
+    def loader() -> Dict[str, Any]:
+        file.seek(0)
+        header = json.loads(file.readline())
+        if header.get("format") != CATALOG_FORMAT or header.get("version") != CATALOG_VERSION:
+            raise ValueError(f"{file_path} is not a catalog of version {CATALOG_VERSION}.")
+        return header
+    return _memoized(file_path, file_key, "header", loader)
+
+
+def _read_section(file_path: str, file: BinaryIO, file_key: Tuple[int, int, int], key: Any, default: Any = None) -> Any:
+    # The header and the section are read from the same open file, so the offsets always match the content
+    # even if the catalog is replaced meanwhile
+    header = _read_header(file_path, file, file_key)
+    for section_key, offset, length in header["sections"]:
+        if section_key == key or str(section_key) == str(key):
+            def loader() -> Any:
+                file.seek(offset)
+                return json.loads(file.read(length), object_hook=_decode_object)
+            return _memoized(file_path, file_key, ("section", str(section_key)), loader)
+    return default
+
+
+def load_section(file_path: str, key: Any, default: Any = None) -> Any:
+    """
+    Load a single top-level section (e.g. one scroll) of a catalog file, without parsing the others.
+
+    The result is kept in memory and returned again as long as the file does not change, so it must not be modified.
+
+    Parameters
+    ----------
+    file_path : str
+        The path of the catalog file.
+    key : Any
+        The key of the section. Integer keys also match their string form and vice versa.
+    default : Any, default = None
+        Value returned if the section does not exist.
+
+    Returns
+    -------
+    Any
+        The section.
+    """
+    with open(file_path, 'rb') as file:
+        return _read_section(file_path, file, _file_key(file), key, default)
+
+
+def load_catalog(file_path: str) -> Dict[Any, Any]:
+    """
+    Load a whole catalog file.
+
+    The result is kept in memory and returned again as long as the file does not change, so it must not be modified.
+
+    Parameters
+    ----------
+    file_path : str
+        The path of the catalog file.
+
+    Returns
+    -------
+    Dict[Any, Any]
+        The catalog.
+    """
+    with open(file_path, 'rb') as file:
+        file_key = _file_key(file)
+
+        def loader() -> Dict[Any, Any]:
+            header = _read_header(file_path, file, file_key)
+            return {key: _read_section(file_path, file, file_key, key) for key, _, _ in header["sections"]}
+        return _memoized(file_path, file_key, "all", loader)
+
+
+@traced("catalog.read")
+def read_catalog(configs_path: str, name: str, section: Any = _MISSING) -> Any:
+    """
+    Read the catalog `name` (e.g. 'scrolls' or 'cubes') from the configs directory.
+
+    The JSON lines file `<name>.jsonl` is used when present. Otherwise (or when the YAML file is newer, after
+    a new installation) the YAML file shipped with the package is read once and converted.
+
+    Parameters
+    ----------
+    configs_path : str
+        The directory holding the catalog files.
+    name : str
+        The name of the catalog.
+    section : Any, optional
+        If given, only this top-level section is loaded and returned (None if missing).
+
+    Returns
+    -------
+    Any
+        The catalog, or one of its sections.
+    """
+    file_path = os.path.join(configs_path, f'{name}.jsonl')
+    yaml_path = os.path.join(configs_path, f'{name}.yaml')
+    # A YAML file newer than the JSON lines file comes from a fresh installation of the package
+    if not os.path.exists(file_path) or (os.path.exists(yaml_path) and os.path.getmtime(yaml_path) > os.path.getmtime(file_path)):
+        import yaml
+        with span("catalog.parse_yaml", catalog=name), open(yaml_path, 'r') as file:
+            data = yaml.safe_load(file) or {}
+        try:
+            save_catalog(file_path, data)
+        except OSError:
+            # Read-only installation: keep serving the YAML file
+            return data if section is _MISSING else data.get(section, data.get(str(section)))
+    if section is _MISSING:
+        return load_catalog(file_path)
+    return load_section(file_path, section)
+
+
+def write_catalog(configs_path: str, name: str, data: Dict[Any, Any]) -> None:
+    """
+    Write the catalog `name` to the configs directory.
+
+    Parameters
+    ----------
+    configs_path : str
+        The directory holding the catalog files.
+    name : str
+        The name of the catalog.
+    data : Dict[Any, Any]
+        The catalog.
+
+    Returns
+    -------
+    None
+    """
+    save_catalog(os.path.join(configs_path, f'{name}.jsonl'), data)
+
+
+def export_yaml(configs_path: str, name: str, yaml_path: Optional[str] = None) -> str:
+    """
+    Export the catalog `name` as YAML.
+
+    Parameters
+    ----------
+    configs_path : str
+        The directory holding the catalog files.
+    name : str
+        The name of the catalog.
+    yaml_path : Optional[str], default = None
+        Destination file. If None the catalog is exported to `<name>.yaml` in the current directory.
+
+    Returns
+    -------
+    str
+        The path of the YAML file.
+    """
+    if yaml_path is None:
+        yaml_path = os.path.join(os.getcwd(), f'{name}.yaml')
+    import yaml
+    atomic_write(yaml_path, yaml.dump(read_catalog(configs_path, name), default_flow_style=False))
+    file_path = os.path.join(configs_path, f'{name}.jsonl')
+    if os.path.abspath(yaml_path) == os.path.abspath(os.path.join(configs_path, f'{name}.yaml')) and os.path.exists(file_path):
+        # A YAML file newer than the JSON lines file is taken for a new installation and converted again:
+        # the exported copy has the same content, so the JSON lines file is kept as the newer one
+        os.utime(file_path)
+    return yaml_path
@@ -1,51 +1,179 @@
 import os
 import re
-import yaml
-from typing import Dict, List, Optional
-from .utils import get_installation_path
+import json
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+from .utils import get_installation_path, get_configs_path, catalog_lock, mark_catalog_refreshed
+from .catalog import write_catalog
+from .atomic import atomic_write
+
+# Bumped whenever the layout of the persisted directory index changes
+INDEX_VERSION = 1
 
 
 def update_local_list(base_dir: str, base_dir_cubes: str) -> None:
-    install_path = get_installation_path()
-    scroll_config = os.path.join(install_path, 'vesuvius', 'configs', 'scrolls.yaml')
-    directory_config = os.path.join(install_path, 'vesuvius', 'configs', 'directory_structure.yaml')
-    cubes_config = os.path.join(install_path, 'vesuvius', 'configs', 'cubes.yaml')
+    configs_path = get_configs_path()
+    index_config = os.path.join(configs_path, 'local_index.json')
+
+    lock = catalog_lock()
+    if not lock.acquire(blocking=False):
+        # Another process is refreshing the catalog: wait for it to finish and reuse its result
+        lock.acquire()
+        lock.release()
+        return
+
+    try:
+        #print(f"Starting directory traversal for: {base_dir}")
+
+        # Directories whose mtime did not change since the last run are not listed again
+        index = load_index(index_config)
+        
+        tree = get_directory_structure(base_dir, index)
+        #print(f"Directory structure: {tree}")
+
+        zarr_files = categorize_zarr_files(tree, base_dir)
+        #print(f"Zarr files found: {zarr_files}")
+
+        cubes_folders = list_subfolders(base_dir_cubes, index)
+        #print(f"Cubes subfolders: {cubes_folders}")
+
+        # Drop the directories that were removed from the mounts, so that the index does not grow forever
+        visited = {base_dir, base_dir_cubes}
+        visited.update(os.path.join(base_dir, path) for path in tree)
+        visited.update(os.path.join(base_dir_cubes, path) for path in cubes_folders)
+        index = {path: entry for path, entry in index.items() if path in visited}
+
+        save_index(index_config, index)
+        write_catalog(configs_path, 'directory_structure', tree)
+        write_catalog(configs_path, 'scrolls', zarr_files)
+        update_cubes_config(configs_path, cubes_folders, base_dir_cubes)
+        mark_catalog_refreshed()
+    finally:
+        lock.release()
+
+
+def load_index(index_path: str) -> Dict[str, Dict[str, Any]]:
+    """
+    Load the persisted directory index, mapping each scanned directory to its mtime and subdirectories.
 
-    #print(f"Starting directory traversal for: {base_dir}")
-    
-    tree = get_directory_structure(base_dir)
-    #print(f"Directory structure: {tree}")
+    Parameters
+    ----------
+    index_path : str
+        The path to the index file.
 
-    zarr_files = categorize_zarr_files(tree, base_dir)
-    #print(f"Zarr files found: {zarr_files}")
+    Returns
+    -------
+    Dict[str, Dict[str, Any]]
+        The index, or an empty index if the file is missing or unreadable.
+    """
+    try:
+        with open(index_path, 'r') as file:
+            index = json.load(file)
+    except (OSError, ValueError):
+        return {}
+    if index.get("version") != INDEX_VERSION:
+        return {}
+    return index.get("directories", {})
 
-    cubes_folders = list_subfolders(base_dir_cubes)
-    #print(f"Cubes subfolders: {cubes_folders}")
 
-    save_yaml(directory_config, tree)
-    save_yaml(scroll_config, zarr_files)
-    update_cubes_config(cubes_config, cubes_folders, base_dir_cubes)
+def save_index(index_path: str, index: Dict[str, Dict[str, Any]]) -> None:
+    """
+    Save the directory index.
 
+    Parameters
+    ----------
+    index_path : str
+        The path to the index file.
+    index : Dict[str, Dict[str, Any]]
+        The index to save.
 
-def get_directory_structure(base_dir: str):
-    directory_tree = {}
+    Returns
+    -------
+    None
+    """
+    atomic_write(index_path, json.dumps({"version": INDEX_VERSION, "directories": index}))
 
-    for root, dirs, files in os.walk(base_dir):
-        dirs_to_remove = []
-        for name in dirs:
-            dir_path = os.path.relpath(os.path.join(root, name), base_dir)
-            #print(f"Encountered directory: {dir_path}")
-            if name.endswith('.zarr'):
-                directory_tree[dir_path] = None
-                #print(f"Identified zarr directory: {dir_path}")
-                # Mark this directory to be removed from further traversal
-                dirs_to_remove.append(name)
-            else:
-                directory_tree[dir_path] = {}
 
-        # Remove directories from traversal after checking all dirs
-        for dir_to_remove in dirs_to_remove:
-            dirs.remove(dir_to_remove)
+def _list_directory(path: str, index: Dict[str, Dict[str, Any]]) -> List[Tuple[str, bool]]:
+    """
+    List the subdirectories of `path` as (name, is_symlink) pairs, reusing the index when the mtime is unchanged.
+    """
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        return []
+    cached = index.get(path)
+    if cached is not None and cached["mtime"] == mtime:
+        return [(name, is_link) for name, is_link in cached["subdirs"]]
+
+    subdirs = []
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir():
+                        subdirs.append((entry.name, entry.is_symlink()))
+                except OSError:
+                    continue
+    except OSError:
+        return []
+    subdirs.sort()
+    index[path] = {"mtime": mtime, "subdirs": [list(subdir) for subdir in subdirs]}
+    return subdirs
+
+
+def scan_directories(base_dir: str, index: Optional[Dict[str, Dict[str, Any]]] = None, prune_zarr: bool = True, max_workers: int = 32) -> List[str]:
+    """
+    List all directories below `base_dir`, scanning each level in parallel.
+
+    Like `os.walk`, symbolic links to directories are listed but not followed. On network filesystems
+    most of the time goes into listing directories, so directories whose mtime matches the entry in
+    `index` are not listed again, and `.zarr` directories are not descended into when `prune_zarr` is set.
+
+    Parameters
+    ----------
+    base_dir : str
+        The directory to scan.
+    index : Optional[Dict[str, Dict[str, Any]]], default = None
+        The directory index from `load_index`. It is updated in place with the directories that were listed.
+    prune_zarr : bool, default = True
+        If True, directories ending with `.zarr` are not descended into.
+    max_workers : int, default = 32
+        Number of directories listed concurrently.
+
+    Returns
+    -------
+    List[str]
+        The paths of all directories found, relative to `base_dir`.
+    """
+    if index is None:
+        index = {}
+    found: List[str] = []
+    level = [base_dir]
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while level:
+            next_level = []
+            for path, subdirs in zip(level, executor.map(lambda path: _list_directory(path, index), level)):
+                for name, is_link in subdirs:
+                    dir_path = os.path.join(path, name)
+                    found.append(os.path.relpath(dir_path, base_dir))
+                    if is_link or (prune_zarr and name.endswith('.zarr')):
+                        continue
+                    next_level.append(dir_path)
+            level = next_level
+    return found
+
+
+def get_directory_structure(base_dir: str, index: Optional[Dict[str, Dict[str, Any]]] = None):
+    directory_tree = {}
+
+    for dir_path in scan_directories(base_dir, index, prune_zarr=True):
+        #print(f"Encountered directory: {dir_path}")
+        if dir_path.endswith('.zarr'):
+            directory_tree[dir_path] = None
+            #print(f"Identified zarr directory: {dir_path}")
+        else:
+            directory_tree[dir_path] = {}
 
     #print(f"Final directory tree: {directory_tree}")
     return directory_tree
@@ -107,7 +235,7 @@ def categorize_zarr_files(tree, base_dir):
 
 
 
-def list_subfolders(directory: str) -> List[str]:
+def list_subfolders(directory: str, index: Optional[Dict[str, Dict[str, Any]]] = None) -> List[str]:
     """
     List all subfolders in a directory.
 
@@ -115,35 +243,25 @@ def list_subfolders(directory: str) -> List[str]:
     ----------
     directory : str
         The directory to list subfolders from.
+    index : Optional[Dict[str, Dict[str, Any]]], default = None
+        The directory index from `load_index`, used to skip listing unchanged directories.
 
     Returns
     -------
     List[str]
         A list of subfolder paths.
     """
-    subfolders = []
-
-    for root, dirs, _ in os.walk(directory):
-        relative_path = os.path.relpath(root, directory)
-        if relative_path == ".":
-            relative_path = ""
-
-        for name in dirs:
-            dir_path = os.path.join(relative_path, name)
-            subfolders.append(dir_path)
-            #print(f"Subfolder found: {dir_path}")
-
-    return subfolders
+    return scan_directories(directory, index, prune_zarr=False)
 
 
-def update_cubes_config(cubes_config: str, cubes_folders: List[str], base_dir_cubes: str) -> None:
+def update_cubes_config(configs_path: str, cubes_folders: List[str], base_dir_cubes: str) -> None:
     """
-    Update the cubes configuration YAML file.
+    Update the cubes catalog.
 
     Parameters
     ----------
-    cubes_config : str
-        The path to the cubes configuration file.
+    configs_path : str
+        The directory holding the catalog files.
     cubes_folders : List[str]
         A list of subfolder paths under the cubes base directory.
     base_dir_cubes : str
@@ -166,24 +284,4 @@ def update_cubes_config(cubes_config: str, cubes_folders: List[str], base_dir_cu
         data[1][54][7.91][folder_name] = os.path.join(base_dir_cubes, folder)
         #print(f"Cube folder added to config: {folder_name}")
 
-    save_yaml(cubes_config, data)
-
-
-def save_yaml(file_path: str, data: Dict) -> None:
-    """
-    Save data to a YAML file.
-
-    Parameters
-    ----------
-    file_path : str
-        The path to the YAML file.
-    data : Dict
-        The data to save to the file.
-
-    Returns
-    -------
-    None
-    """
-    with open(file_path, 'w') as file:
-        yaml.dump(data, file, default_flow_style=False)
-    #print(f"YAML saved: {file_path}")
\ No newline at end of file
+    write_catalog(configs_path, 'cubes', data)
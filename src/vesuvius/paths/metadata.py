@@ -0,0 +1,359 @@
+import os
+import json
+import time
+import hashlib
+import threading
+import requests
+import numpy as np
+from pathlib import Path
+from .atomic import atomic_write
+from typing import Any, Dict, Optional, Tuple
+
+
+class MetadataCache:
+    """
+    A disk-backed cache for small JSON metadata documents (OME `.zattrs`, zarr `.zarray`, ...).
+
+    Entries are keyed by URL and stored together with their `ETag` / `Last-Modified` headers.
+    Within `max_age` seconds an entry is served without touching the network, after that it is
+    revalidated with a conditional GET, so an unchanged document costs a `304` instead of a download.
+
+    Attributes
+    ----------
+    cache_dir : Path
+        Directory where the cached documents are stored.
+    max_age : float
+        Number of seconds a cached entry is trusted without revalidation.
+    timeout : float
+        Timeout in seconds for the HTTP requests.
+    session : requests.Session
+        The HTTP session shared by all metadata requests.
+    """
+    def __init__(self, cache_dir: Optional[os.PathLike] = None, max_age: float = 24 * 3600, timeout: float = 30) -> None:
+        """
+        Initialize the MetadataCache object.
+
+        Parameters
+        ----------
+        cache_dir : Optional[os.PathLike], default = None
+            Directory where cached documents are stored. If None they will be saved in $HOME / vesuvius / metadata
+        max_age : float, default = 86400
+            Number of seconds a cached entry is trusted without revalidation.
+        timeout : float, default = 30
+            Timeout in seconds for the HTTP requests.
+        """
+        if cache_dir is not None:
+            self.cache_dir = Path(cache_dir)
+        else:
+            self.cache_dir = Path.home() / 'vesuvius' / 'metadata'
+        self.max_age = max_age
+        self.timeout = timeout
+        self.session = requests.Session()
+        self._memory: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def _entry_path(self, url: str) -> Path:
+        return self.cache_dir / f"{hashlib.sha1(url.encode('utf-8')).hexdigest()}.json"
+
+    def _load_entry(self, url: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._memory.get(url)
+        if entry is not None:
+            return entry
+        try:
+            with open(self._entry_path(url), 'r') as file:
+                entry = json.load(file)
+        except (OSError, ValueError):
+            return None
+        if entry.get("url") != url:
+            return None
+        with self._lock:
+            self._memory[url] = entry
+        return entry
+
+    def _store_entry(self, url: str, entry: Dict[str, Any]) -> None:
+        with self._lock:
+            self._memory[url] = entry
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            atomic_write(str(self._entry_path(url)), json.dumps(entry))
+        except OSError as e:
+            print(f"Could not write metadata cache entry for {url}: {e}")
+
+    def get_json(self, url: str) -> Dict[str, Any]:
+        """
+        Return the JSON document at `url`, using the cached copy whenever it is still valid.
+
+        Parameters
+        ----------
+        url : str
+            The URL of the JSON document.
+
+        Returns
+        -------
+        Dict[str, Any]
+            The decoded JSON document.
+
+        Raises
+        ------
+        requests.HTTPError
+            If the server answers with a 4xx status (the cached copy is then dropped), or with a 5xx status and
+            no cached copy is available.
+        requests.RequestException
+            If the server cannot be reached and no cached copy is available.
+        """
+        entry = self._load_entry(url)
+        if entry is not None and time.time() - entry.get("validated", 0) < self.max_age:
+            return entry["body"]
+
+        headers = {}
+        if entry is not None:
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+
+        try:
+            response = self.session.get(url, headers=headers, timeout=self.timeout)
+            if response.status_code == 304 and entry is not None:
+                entry = dict(entry, validated=time.time())
+                self._store_entry(url, entry)
+                return entry["body"]
+            response.raise_for_status()
+            body = response.json()
+        except requests.HTTPError as e:
+            status = e.response.status_code if e.response is not None else 500
+            if status < 500:
+                # The document was removed or is not accessible anymore: forget it
+                self.invalidate(url)
+            elif entry is not None:
+                # Serve the stale copy when the server fails
+                return entry["body"]
+            raise
+        except requests.RequestException:
+            if entry is not None:
+                # Serve the stale copy when the server cannot be reached
+                return entry["body"]
+            raise
+
+        self._store_entry(url, {
+            "url": url,
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "validated": time.time(),
+            "body": body,
+        })
+        return body
+
+    def get_validator(self, url: str) -> Optional[Dict[str, Any]]:
+        """
+        Return the `ETag`, `Last-Modified` and `Content-Length` headers of the file at `url`, without downloading it.
+
+        The headers are cached and revalidated like the documents of `get_json`, with a `HEAD` request.
+
+        Parameters
+        ----------
+        url : str
+            The URL of the file.
+
+        Returns
+        -------
+        Optional[Dict[str, Any]]
+            The "etag", "last_modified" and "size" of the file (None when the server does not send them),
+            or None if the file does not exist.
+
+        Raises
+        ------
+        requests.HTTPError
+            If the server answers with another 4xx status (the cached copy is then dropped), or with a 5xx status and
+            no cached copy is available.
+        requests.RequestException
+            If the server cannot be reached and no cached copy is available.
+        """
+        key = f"HEAD {url}"
+        entry = self._load_entry(key)
+        if entry is not None and time.time() - entry.get("validated", 0) < self.max_age:
+            return entry["body"]
+
+        try:
+            response = self.session.head(url, timeout=self.timeout, allow_redirects=True)
+            if response.status_code in (404, 410):
+                body = None
+            else:
+                response.raise_for_status()
+                size = response.headers.get("Content-Length")
+                body = {
+                    "etag": response.headers.get("ETag"),
+                    "last_modified": response.headers.get("Last-Modified"),
+                    "size": int(size) if size else None,
+                }
+        except requests.HTTPError as e:
+            status = e.response.status_code if e.response is not None else 500
+            if status < 500:
+                self.invalidate(key)
+            elif entry is not None:
+                return entry["body"]
+            raise
+        except requests.RequestException:
+            if entry is not None:
+                return entry["body"]
+            raise
+
+
+        self._store_entry(key, {"url": key, "validated": time.time(), "body": body})
+        return body
+
+    def invalidate(self, url: str) -> None:
+        """
+        Remove the cached copy of `url`, if any.
+
+        Parameters
+        ----------
+        url : str
+            The URL of the JSON document.
+        """
+        with self._lock:
+            self._memory.pop(url, None)
+        try:
+            os.remove(self._entry_path(url))
+        except OSError:
+            pass
+
+
+_metadata_cache: Optional[MetadataCache] = None
+_metadata_cache_lock = threading.Lock()
+
+
+def _reset_after_fork() -> None:
+    # Pooled connections and locks must not be shared with the parent process
+    global _metadata_cache_lock
+    _metadata_cache_lock = threading.Lock()
+    if _metadata_cache is not None:
+        _metadata_cache._lock = threading.Lock()
+        _metadata_cache.session = requests.Session()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def configure_metadata_cache(cache_dir: Optional[os.PathLike] = None, max_age: float = 24 * 3600, timeout: float = 30) -> MetadataCache:
+    """
+    Replace the process-wide metadata cache, e.g. to point worker processes at a shared cache directory.
+
+    Parameters
+    ----------
+    cache_dir : Optional[os.PathLike], default = None
+        Directory where cached documents are stored. If None they will be saved in $HOME / vesuvius / metadata
+    max_age : float, default = 86400
+        Number of seconds a cached entry is trusted without revalidation.
+    timeout : float, default = 30
+        Timeout in seconds for the HTTP requests.
+
+    Returns
+    -------
+    MetadataCache
+        The new shared metadata cache.
+    """
+    global _metadata_cache
+    with _metadata_cache_lock:
+        _metadata_cache = MetadataCache(cache_dir, max_age=max_age, timeout=timeout)
+        return _metadata_cache
+
+
+def get_metadata_cache() -> MetadataCache:
+    """
+    Return the process-wide metadata cache shared by `Volume` and the catalog functions.
+
+    Returns
+    -------
+    MetadataCache
+        The shared metadata cache.
+    """
+    global _metadata_cache
+    with _metadata_cache_lock:
+        if _metadata_cache is None:
+            _metadata_cache = MetadataCache(os.environ.get("VESUVIUS_METADATA_CACHE"))
+        return _metadata_cache
+
+
+def read_json(url: str) -> Dict[str, Any]:
+    """
+    Read a JSON metadata document, through the metadata cache for remote URLs.
+
+    Parameters
+    ----------
+    url : str
+        URL or local path of the document.
+
+    Returns
+    -------
+    Dict[str, Any]
+        The decoded JSON document.
+    """
+    if url.startswith(("http://", "https://")):
+        return get_metadata_cache().get_json(url)
+    with open(url, 'r') as file:
+        return json.load(file)
+
+
+def read_multiscales(url: str) -> Tuple[Dict[str, Any], int]:
+    """
+    Read the OME attributes of a multiscale zarr group, detecting the zarr format.
+
+    Zarr v2 groups keep their attributes in `.zattrs`. Zarr v3 groups keep them under "attributes" in
+    `zarr.json`, nested under "ome" since OME-Zarr 0.5.
+
+    Parameters
+    ----------
+    url : str
+        URL or local path of the group.
+
+    Returns
+    -------
+    Tuple[Dict[str, Any], int]
+        The attributes, with the "multiscales" key at the top level, and the zarr format (2 or 3).
+    """
+    try:
+        return read_json(f"{url}/.zattrs"), 2
+    except FileNotFoundError:
+        pass
+    except requests.HTTPError as e:
+        if e.response is None or e.response.status_code not in (403, 404):
+            raise
+    attributes = read_json(f"{url}/zarr.json").get("attributes", {})
+    return attributes.get("ome", attributes), 3
+
+
+def read_array_metadata(url: str, zarr_format: int) -> Dict[str, Any]:
+    """
+    Read the metadata document of a zarr array: `.zarray` for zarr v2, `zarr.json` for zarr v3.
+    """
+    return read_json(f"{url}/.zarray" if zarr_format == 2 else f"{url}/zarr.json")
+
+
+def array_geometry(metadata: Dict[str, Any], zarr_format: int) -> Dict[str, Any]:
+    """
+    Get the shape, dtype, chunk shape and shard shape of a zarr array from its metadata document.
+
+    Parameters
+    ----------
+    metadata : Dict[str, Any]
+        The `.zarray` or `zarr.json` document.
+    zarr_format : int
+        The zarr format, 2 or 3.
+
+    Returns
+    -------
+    Dict[str, Any]
+        The keys 'shape', 'dtype', 'chunks' (the unit of reads, i.e. the inner chunks of sharded arrays)
+        and 'shards' (the stored objects of sharded arrays, None otherwise).
+    """
+    if zarr_format == 2:
+        return {"shape": tuple(metadata['shape']), "dtype": np.dtype(metadata['dtype']), "chunks": tuple(metadata['chunks']), "shards": None}
+    chunks = tuple(metadata['chunk_grid']['configuration']['chunk_shape'])
+    shards = None
+    codecs = metadata.get('codecs', [])
+    if codecs and codecs[0].get('name') == 'sharding_indexed':
+        shards, chunks = chunks, tuple(codecs[0]['configuration']['chunk_shape'])
+    return {"shape": tuple(metadata['shape']), "dtype": np.dtype(metadata['data_type']), "chunks": chunks, "shards": shards}
@@ -0,0 +1,222 @@
+import os
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple, Union
+from .utils import list_files
+from .metadata import read_multiscales, read_array_metadata, array_geometry
+
+
+def _parse_scroll_id(scroll_id: str) -> Union[int, str]:
+    return int(scroll_id) if scroll_id.isdigit() else scroll_id
+
+
+class CatalogEntry:
+    """
+    A volume (full scroll or segment) listed in the catalog.
+
+    The array metadata of the entry (shape, dtype, chunk shape and number of multiscale levels) is read
+    from the `.zattrs` and `.zarray` documents (`zarr.json` for zarr v3) only, through the metadata cache, without opening the data.
+
+    Attributes
+    ----------
+    scroll_id : Union[int, str]
+        ID of the scroll.
+    energy : int
+        Energy of the scan.
+    resolution : float
+        Resolution of the scan.
+    resolution_key : str
+        Resolution of the scan as written in the catalog (e.g. "8.00"), used to look the entry up again.
+    segment_id : Optional[int]
+        ID of the segment, or None for a full scroll volume.
+    url : str
+        URL (or local path) of the OME-Zarr volume.
+    """
+    def __init__(self, scroll_id: Union[int, str], energy: int, resolution: float, segment_id: Optional[int], url: str, resolution_key: Optional[str] = None) -> None:
+        """
+        Initialize the CatalogEntry object.
+
+        Parameters
+        ----------
+        scroll_id : Union[int, str]
+            ID of the scroll.
+        energy : int
+            Energy of the scan.
+        resolution : float
+            Resolution of the scan.
+        segment_id : Optional[int]
+            ID of the segment, or None for a full scroll volume.
+        url : str
+            URL (or local path) of the OME-Zarr volume.
+        resolution_key : Optional[str], default = None
+            Resolution as written in the catalog. If None it is `str(resolution)`.
+        """
+        self.scroll_id = scroll_id
+        self.energy = energy
+        self.resolution = resolution
+        self.resolution_key = str(resolution) if resolution_key is None else resolution_key
+        self.segment_id = segment_id
+        self.url = url.rstrip('/')
+        self._metadata: Optional[Dict[str, Any]] = None
+
+    @property
+    def type(self) -> str:
+        """
+        'segment' for segments, 'scroll' for full scroll volumes.
+        """
+        return "scroll" if self.segment_id is None else "segment"
+
+    def __repr__(self) -> str:
+        name = f"segment={self.segment_id}" if self.segment_id is not None else "scroll"
+        return f"CatalogEntry(scroll_id={self.scroll_id!r}, energy={self.energy}, resolution={self.resolution}, {name})"
+
+    def metadata(self, refresh: bool = False) -> Dict[str, Any]:
+        """
+        Get the array metadata of the entry.
+
+        Parameters
+        ----------
+        refresh : bool, default = False
+            If True the documents are read again instead of reusing the values of a previous call.
+
+        Returns
+        -------
+        Dict[str, Any]
+            A dictionary with the keys 'shape', 'dtype' and 'chunks' (of the full resolution level, inner chunks for sharded arrays), 'levels' and 'zarr_format'.
+
+        Raises
+        ------
+        requests.RequestException
+            If the metadata cannot be fetched and no cached copy is available.
+        """
+        if self._metadata is None or refresh:
+            zattrs, zarr_format = read_multiscales(self.url)
+            datasets = zattrs['multiscales'][0]['datasets']
+            geometry = array_geometry(read_array_metadata(f"{self.url}/{datasets[0]['path']}", zarr_format), zarr_format)
+            self._metadata = {
+                "shape": geometry['shape'],
+                "dtype": geometry['dtype'],
+                "chunks": geometry['chunks'],
+                "levels": len(datasets),
+                "zarr_format": zarr_format,
+            }
+        return self._metadata
+
+    @property
+    def shape(self) -> Tuple[int, ...]:
+        """
+        Shape of the full resolution level.
+        """
+        return self.metadata()["shape"]
+
+    @property
+    def dtype(self) -> np.dtype:
+        """
+        Data type of the volume.
+        """
+        return self.metadata()["dtype"]
+
+    @property
+    def chunks(self) -> Tuple[int, ...]:
+        """
+        Chunk shape of the full resolution level.
+        """
+        return self.metadata()["chunks"]
+
+    @property
+    def levels(self) -> int:
+        """
+        Number of multiscale levels.
+        """
+        return self.metadata()["levels"]
+
+    def open(self, **kwargs: Any) -> Any:
+        """
+        Open the entry as a `Volume`.
+
+        Parameters
+        ----------
+        **kwargs : Any
+            Additional keyword arguments passed to `Volume`, e.g. `normalize=True`.
+
+        Returns
+        -------
+        Volume
+            The opened volume.
+        """
+        from ..volume import Volume
+        if not self.url.startswith(("http://", "https://")):
+            kwargs.setdefault("domain", "local")
+            kwargs.setdefault("path", self.url)
+        # The catalog key, not the float, so that keys such as "8.00" are found again
+        return Volume(self.type, scroll_id=self.scroll_id, energy=self.energy, resolution=self.resolution_key, segment_id=self.segment_id, **kwargs)
+
+
+def _in_range(value: int, bounds: Optional[Tuple[Optional[int], Optional[int]]]) -> bool:
+    if bounds is None:
+        return True
+    low, high = bounds
+    return (low is None or value >= low) and (high is None or value <= high)
+
+
+def query_catalog(scroll_id: Optional[Union[int, str]] = None, energy: Optional[int] = None, resolution: Optional[float] = None, segment_range: Optional[Tuple[Optional[int], Optional[int]]] = None, type: Optional[str] = None, with_metadata: bool = False, max_workers: int = 16) -> List[CatalogEntry]:
+    """
+    Find the volumes of the catalog that match the given filters.
+
+    Parameters
+    ----------
+    scroll_id : Optional[Union[int, str]], default = None
+        Only entries of this scroll. If None all scrolls are searched.
+    energy : Optional[int], default = None
+        Only entries with this energy.
+    resolution : Optional[float], default = None
+        Only entries with this resolution.
+    segment_range : Optional[Tuple[Optional[int], Optional[int]]], default = None
+        Only segments whose ID lies in this inclusive range; either bound may be None. Full scroll volumes are excluded.
+    type : Optional[str], default = None
+        Only entries of this type, 'scroll' or 'segment'.
+    with_metadata : bool, default = False
+        If True the array metadata of every entry is fetched concurrently before returning. Entries whose metadata cannot be fetched are dropped.
+    max_workers : int, default = 16
+        Number of threads used to fetch the metadata.
+
+    Returns
+    -------
+    List[CatalogEntry]
+        The matching entries, sorted by scroll, energy, resolution and segment ID.
+    """
+    assert type in [None, "scroll", "segment"], "type should be None, 'scroll' or 'segment'"
+    catalog = list_files() if scroll_id is None else list_files(scroll_id)
+
+    entries = []
+    for scroll_key, energies in catalog.items():
+        for energy_key, resolutions in energies.items():
+            if energy is not None and int(energy_key) != int(energy):
+                continue
+            for resolution_key, content in resolutions.items():
+                if resolution is not None and float(resolution_key) != float(resolution):
+                    continue
+                args = (_parse_scroll_id(str(scroll_key)), int(energy_key), float(resolution_key))
+                if type != "segment" and segment_range is None and content.get("volume"):
+                    entries.append(CatalogEntry(*args, None, content["volume"], str(resolution_key)))
+                if type != "scroll":
+                    for segment_key, url in content.get("segments", {}).items():
+                        if str(segment_key).isdigit() and _in_range(int(segment_key), segment_range):
+                            entries.append(CatalogEntry(*args, int(segment_key), url, str(resolution_key)))
+
+    entries.sort(key=lambda entry: (str(entry.scroll_id), entry.energy, entry.resolution, -1 if entry.segment_id is None else entry.segment_id))
+
+    if with_metadata and entries:
+        def fetch(entry: CatalogEntry) -> bool:
+            try:
+                entry.metadata()
+                return True
+            except Exception as e:
+                print(f"Skipping {entry}: {e}")
+                return False
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            available = list(executor.map(fetch, entries))
+        entries = [entry for entry, ok in zip(entries, available) if ok]
+
+    return entries
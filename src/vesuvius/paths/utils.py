@@ -1,15 +1,53 @@
-import asyncio
-import aiohttp
-import yaml
-import requests
 from ..setup.accept_terms import get_installation_path
-from typing import List, Optional, Dict, Tuple
-from .parser import get_directory_structure, find_zarr_files, list_subfolders
-import nest_asyncio
-import ssl
+from typing import List, Optional, Dict, Tuple, Union
+from .atomic import FileLock, atomic_write
+from .catalog import read_catalog, write_catalog, export_yaml
+from ..tracing import span, traced
 import os
+import threading
+import time
+
+# asyncio, ssl, aiohttp, lxml, nest_asyncio and requests are imported by the functions using them,
+# so that reading the catalog does not pay for the crawler
+
+# Catalogs older than this many seconds are refreshed on first use, unless another process refreshed them recently
+CATALOG_MAX_AGE = float(os.environ.get("VESUVIUS_CATALOG_MAX_AGE", 600))
+
+# Lock file serializing catalog refreshes across processes, and stamp file marking the last successful one
+CATALOG_LOCK = 'catalog.lock'
+CATALOG_STAMP = 'catalog.refreshed'
+
+def get_configs_path() -> str:
+    """
+    Return the directory holding the catalog files.
+    """
+    return os.path.join(get_installation_path(), 'vesuvius', 'configs')
+
+def catalog_lock() -> FileLock:
+    """
+    Return the inter-process lock guarding catalog refreshes.
+    """
+    return FileLock(os.path.join(get_configs_path(), CATALOG_LOCK))
+
+def catalog_age() -> float:
+    """
+    Return the number of seconds since the catalog was last refreshed successfully, or infinity if never.
+    """
+    try:
+        return time.time() - os.path.getmtime(os.path.join(get_configs_path(), CATALOG_STAMP))
+    except OSError:
+        return float('inf')
+
+def mark_catalog_refreshed() -> None:
+    """
+    Record that the catalog was just refreshed successfully.
+    """
+    atomic_write(os.path.join(get_configs_path(), CATALOG_STAMP), str(time.time()))
 
 async def scrape_website(base_url: str, ignore_list: List[str]) -> Tuple[Dict[str, Optional[Dict]], Dict[str, str]]:
+    import ssl
+    import aiohttp
+    from .parser import get_directory_structure, find_zarr_files
     ssl_context = ssl.create_default_context()
     ssl_context.check_hostname = False
     ssl_context.verify_mode = ssl.CERT_NONE
@@ -20,6 +58,9 @@ async def scrape_website(base_url: str, ignore_list: List[str]) -> Tuple[Dict[st
 
 # Define the function to scrape the website and generate the YAML
 async def collect_subfolders(base_url: str, ignore_list: List[str]) -> List[str]:
+    import ssl
+    import aiohttp
+    from .parser import list_subfolders
     ssl_context = ssl.create_default_context()
     ssl_context.check_hostname = False
     ssl_context.verify_mode = ssl.CERT_NONE
@@ -27,6 +68,7 @@ async def collect_subfolders(base_url: str, ignore_list: List[str]) -> List[str]
         subfolders = await list_subfolders(base_url, session, ignore_list)
         return subfolders
     
+@traced("update_list")
 def update_list(base_url: str, base_url_cubes: str, ignore_list: Optional[List[str]] = None) -> None:
     """
     Scrape a website for directory structures and Zarr files, then update the configuration files.
@@ -50,86 +92,155 @@ def update_list(base_url: str, base_url_cubes: str, ignore_list: Optional[List[s
     Notes
     -----
     - This function makes use of asyncio to scrape websites concurrently.
-    - It updates the following YAML configuration files:
-      - 'directory_structure.yaml'
-      - 'scrolls.yaml'
-      - 'cubes.yaml'
+    - It updates the following catalog files (JSON lines, see `export_catalog` for a YAML export):
+      - 'directory_structure.jsonl'
+      - 'scrolls.jsonl'
+      - 'cubes.jsonl'
     - The part of the function that deals with cubes is currently designed to work with scroll 1 and energy 54 at resolution 7.91, but should 
       be generalized in the future.
+    - Files are replaced atomically under an inter-process lock. If another process is already refreshing the
+      catalog, this function waits for it and reuses its result instead of scraping again.
+    - If the scrape finds no volumes (e.g. the server is unreachable) the current catalog is kept.
     """
-    install_path = get_installation_path()
-    scroll_config = os.path.join(install_path, 'vesuvius', 'configs', f'scrolls.yaml')
-    directory_config = os.path.join(install_path, 'vesuvius', 'configs', f'directory_structure.yaml')
-    cubes_config = os.path.join(install_path, 'vesuvius', 'configs', f'cubes.yaml')
+    configs_path = get_configs_path()
 
     if ignore_list is None:
         ignore_list = [r'\.zarr$']
-    
+
+    lock = catalog_lock()
+    if not lock.acquire(blocking=False):
+        # Another process is refreshing the catalog: wait for it to finish and reuse its result
+        lock.acquire()
+        lock.release()
+        return
+
     try:
-        loop = asyncio.get_running_loop()
-    except RuntimeError:
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-    
-    if loop.is_running():
-        nest_asyncio.apply()
-        tree, zarr_files = loop.run_until_complete(scrape_website(base_url, ignore_list))
-        cubes_folders = loop.run_until_complete(scrape_website(base_url_cubes, ignore_list))
-    else:
-        tree, zarr_files = loop.run_until_complete(scrape_website(base_url, ignore_list))
-        cubes_folders = loop.run_until_complete(scrape_website(base_url_cubes, ignore_list))
-
-    with open(directory_config, 'w') as file:
-        yaml.dump(tree, file, default_flow_style=False)
-    
-    with open(scroll_config, 'w') as file:
-        yaml.dump(zarr_files, file, default_flow_style=False)
-
-
-    #TODO: implement not only for scroll 1
-    #TODO: fix cubes path on website
-    data = {
-            1: {
-                54: {
-                    7.91: { }
-                }
-            }}
-    for folder in cubes_folders[0].keys():
-        # Extract the name of the first subfolder
-        folder_name = folder[:-1]
-        data[1][54][7.91][folder_name] = base_url_cubes + folder
-
-    with open(cubes_config, 'w') as file:
-        yaml.dump(data, file, default_flow_style=False)
+        import asyncio
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(loop)
+        
+        with span("update_list.scrape", base_url=base_url):
+            if loop.is_running():
+                import nest_asyncio
+                nest_asyncio.apply()
+                tree, zarr_files = loop.run_until_complete(scrape_website(base_url, ignore_list))
+                cubes_folders = loop.run_until_complete(scrape_website(base_url_cubes, ignore_list))
+            else:
+                tree, zarr_files = loop.run_until_complete(scrape_website(base_url, ignore_list))
+                cubes_folders = loop.run_until_complete(scrape_website(base_url_cubes, ignore_list))
+
+        if not zarr_files:
+            raise RuntimeError(f"No volumes found at {base_url}, keeping the current catalog.")
+
+        with span("update_list.write"):
+            write_catalog(configs_path, 'directory_structure', tree)
+            write_catalog(configs_path, 'scrolls', zarr_files)
+
+        #TODO: implement not only for scroll 1
+        #TODO: fix cubes path on website
+        data = {
+                1: {
+                    54: {
+                        7.91: { }
+                    }
+                }}
+        for folder in cubes_folders[0].keys():
+            # Extract the name of the first subfolder
+            folder_name = folder[:-1]
+            data[1][54][7.91][folder_name] = base_url_cubes + folder
+
+        if data[1][54][7.91]:
+            write_catalog(configs_path, 'cubes', data)
+
+        mark_catalog_refreshed()
+    finally:
+        lock.release()
     
     #print("Directory structure saved to 'directory_structure.yaml'")
     #print("Scrolls paths saved to 'scrolls.yaml'")
 
-def list_files() -> Dict:
+_catalog_checked = False
+_catalog_checked_lock = threading.Lock()
+
+def refresh_catalog(max_age: Optional[float] = None) -> None:
     """
-    Load and return the scrolls configuration data from a YAML file.
+    Refresh the catalogs if they are older than `max_age` seconds.
+
+    Without `max_age` this runs once per process, on first use, with the `CATALOG_MAX_AGE` limit (600 seconds by
+    default, set by the `VESUVIUS_CATALOG_MAX_AGE` environment variable). Call `refresh_catalog(max_age=0)` to
+    pick up new segments right away.
 
-    This function reads the updated 'scrolls.yaml' file and returns its contents as a dictionary.
+    On an AWS EC2 instance the local mounts are indexed, with the remote server as a fallback; elsewhere the
+    remote server is scraped. Failures are reported and the current catalogs are kept. Concurrent callers
+    wait for the same refresh.
+
+    Parameters
+    ----------
+    max_age : Optional[float], default = None
+        Refresh the catalogs if they were last refreshed more than this many seconds ago, even if they were
+        already checked by this process. 0 always refreshes them.
+    """
+    global _catalog_checked
+    with _catalog_checked_lock:
+        if max_age is None:
+            if _catalog_checked:
+                return
+            max_age = CATALOG_MAX_AGE
+        _catalog_checked = True
+        if catalog_age() < max_age:
+            return
+        remote_urls = ("https://dl.ash2txt.org/other/dev/", "https://dl.ash2txt.org/full-scrolls/Scroll1/PHercParis4.volpkg/seg-volumetric-labels/instance-annotated-cubes/")
+        if is_aws_ec2_instance():
+            from .local import update_local_list
+            try:
+                update_local_list("/mnt/scrolls", "/mnt/annotated-instances")
+            except Exception as e:
+                print(f"Could not update the local file paths: {e}")
+                try:
+                    update_list(*remote_urls)
+                except:
+                    print("Could not update the remote file paths.")
+        else:
+            try:
+                update_list(*remote_urls)
+            except:
+                print("Could not update the remote file paths.")
+
+def list_files(scroll_id: Optional[Union[int, str]] = None) -> Dict:
+    """
+    Load and return the scrolls catalog.
+
+    This function reads the updated 'scrolls' catalog and returns its contents as a dictionary.
+    The catalog is parsed once and kept in memory until the file changes, so the returned dictionary must not be modified.
 
     To update the files run:
     update_list("https://dl.ash2txt.org/other/dev/", "https://dl.ash2txt.org/full-scrolls/Scroll1/PHercParis4.volpkg/seg-volumetric-labels/instance-annotated-cubes/")
-    
+
+    Parameters
+    ----------
+    scroll_id : Optional[Union[int, str]], default = None
+        If given, only the section of this scroll is loaded and returned.
+
     Returns
     -------
     Dict
         A dictionary representing the scrolls configuration data.
     """
-    install_path = get_installation_path()
-    scroll_config = os.path.join(install_path, 'vesuvius', 'configs', f'scrolls.yaml')
-    with open(scroll_config, 'r') as file:
-        data = yaml.safe_load(file)
-    return data
+    refresh_catalog()
+    if scroll_id is None:
+        return read_catalog(get_configs_path(), 'scrolls')
+    section = read_catalog(get_configs_path(), 'scrolls', section=str(scroll_id))
+    return {str(scroll_id): section} if section is not None else {}
 
 def list_cubes() -> Dict:
     """
-    Load and return the cubes configuration data from a YAML file.
+    Load and return the cubes catalog.
 
-    This function reads the updated 'cubes.yaml' file and returns its contents as a dictionary.
+    This function reads the updated 'cubes' catalog and returns its contents as a dictionary.
+    The catalog is parsed once and kept in memory until the file changes, so the returned dictionary must not be modified.
 
     To update the files run:
     update_list("https://dl.ash2txt.org/other/dev/", "https://dl.ash2txt.org/full-scrolls/Scroll1/PHercParis4.volpkg/seg-volumetric-labels/instance-annotated-cubes/")
@@ -139,27 +250,50 @@ def list_cubes() -> Dict:
     Dict
         A dictionary representing the cubes configuration data.
     """
-    install_path = get_installation_path()
-    cubes_config = os.path.join(install_path, 'vesuvius', 'configs', f'cubes.yaml')
-    with open(cubes_config, 'r') as file:
-        data = yaml.safe_load(file)
-    return data
+    refresh_catalog()
+    return read_catalog(get_configs_path(), 'cubes')
+
+def export_catalog(name: str, yaml_path: Optional[str] = None) -> str:
+    """
+    Export a catalog ('scrolls', 'cubes' or 'directory_structure') as a YAML file.
+
+    Parameters
+    ----------
+    name : str
+        The name of the catalog.
+    yaml_path : Optional[str], default = None
+        Destination file. If None the catalog is exported to `<name>.yaml` in the current directory.
+
+    Returns
+    -------
+    str
+        The path of the YAML file.
+    """
+    return export_yaml(get_configs_path(), name, yaml_path)
+
+_aws_ec2_instance: Optional[bool] = None
+_aws_ec2_instance_lock = threading.Lock()
 
 def is_aws_ec2_instance() -> bool:
     """
     Determine if the current system is an AWS EC2 instance.
 
+    The instance metadata endpoint is probed once per process, concurrent callers wait for the same probe.
+
     Returns
     -------
     bool
         True if running on an AWS EC2 instance, False otherwise.
     """
-    try:
-        # Query EC2 instance metadata to check if running on AWS EC2
-        response = requests.get("http://169.254.169.254/latest/meta-data/", timeout=2)
-        if response.status_code == 200:
-            return True
-    except requests.RequestException:
-        return False
-
-    return False
\ No newline at end of file
+    global _aws_ec2_instance
+    with _aws_ec2_instance_lock:
+        if _aws_ec2_instance is None:
+            with span("ec2_probe"):
+                import requests
+                try:
+                    # Query EC2 instance metadata to check if running on AWS EC2
+                    response = requests.get("http://169.254.169.254/latest/meta-data/", timeout=2)
+                    _aws_ec2_instance = response.status_code == 200
+                except requests.RequestException:
+                    _aws_ec2_instance = False
+        return _aws_ec2_instance
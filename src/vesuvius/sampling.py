@@ -0,0 +1,156 @@
+import numpy as np
+from numpy.typing import NDArray
+from typing import Any, Sequence, Union
+
+# Offsets of the eight corners of a voxel cell, used by trilinear interpolation
+_CORNERS = np.array([[dz, dy, dx] for dz in (0, 1) for dy in (0, 1) for dx in (0, 1)], dtype=np.int64)
+
+# Number of chunks fetched concurrently while gathering samples
+CHUNK_BATCH = 64
+
+
+def gather_voxels(volume: Any, subvolume_idx: int, indices: NDArray, fill_value: Union[int, float] = 0) -> NDArray:
+    """
+    Gather the voxels at integer `indices` from a sub-volume, fetching every needed chunk only once.
+
+    Parameters
+    ----------
+    volume : Volume
+        The volume to read from.
+    subvolume_idx : int
+        Index of the sub-volume to read from.
+    indices : NDArray
+        Integer array of shape (N, 3) with (z, y, x) voxel indices. Indices outside the sub-volume are set to `fill_value`.
+    fill_value : Union[int, float], default = 0
+        Value returned for out-of-bounds indices.
+
+    Returns
+    -------
+    NDArray
+        Array of shape (N,) with the gathered voxel values.
+    """
+    shape = np.asarray(volume.shape(subvolume_idx), dtype=np.int64)
+    chunks = np.asarray(volume.chunks(subvolume_idx), dtype=np.int64)
+    values = np.full(len(indices), fill_value, dtype=volume.dtype)
+
+    inside = np.all((indices >= 0) & (indices < shape), axis=1)
+    positions = np.nonzero(inside)[0]
+    if len(positions) == 0:
+        return values
+    indices = indices[positions]
+
+    # Group the points by the chunk they fall in
+    chunk_coords = indices // chunks
+    grid = -(-shape // chunks)
+    chunk_ids = np.ravel_multi_index(chunk_coords.T, grid)
+    order = np.argsort(chunk_ids, kind='stable')
+    chunk_ids = chunk_ids[order]
+    unique_ids, starts = np.unique(chunk_ids, return_index=True)
+    ends = np.append(starts[1:], len(chunk_ids))
+
+    for batch_start in range(0, len(unique_ids), CHUNK_BATCH):
+        batch = slice(batch_start, batch_start + CHUNK_BATCH)
+        chunk_indices = [tuple(int(c) for c in np.unravel_index(cid, grid)) for cid in unique_ids[batch]]
+        for chunk_idx, data, start, end in zip(chunk_indices, volume._read_chunks(subvolume_idx, chunk_indices), starts[batch], ends[batch]):
+            sel = order[start:end]
+            local = indices[sel] - np.asarray(chunk_idx) * chunks
+            values[positions[sel]] = data[local[:, 0], local[:, 1], local[:, 2]]
+
+    return values
+
+
+def sample_volume(volume: Any, points: NDArray, order: int = 0, subvolume_idx: int = 0, fill_value: Union[int, float] = 0) -> NDArray:
+    """
+    Sample a volume at arbitrary (z, y, x) positions with nearest-neighbour or trilinear interpolation.
+
+    Parameters
+    ----------
+    volume : Volume
+        The volume to sample.
+    points : NDArray
+        Array of shape (..., 3) with (z, y, x) coordinates in full-resolution voxel units.
+    order : int, default = 0
+        Interpolation order: 0 for nearest-neighbour, 1 for trilinear.
+    subvolume_idx : int, default = 0
+        Index of the sub-volume to sample from. Coordinates are mapped to it through the OME coordinate transformations.
+    fill_value : Union[int, float], default = 0
+        Value returned for points outside the volume.
+
+    Returns
+    -------
+    NDArray
+        Array of shape points.shape[:-1] with the sampled values. Nearest-neighbour keeps the volume dtype, trilinear returns float32.
+
+    Raises
+    ------
+    ValueError
+        If `points` does not have a trailing dimension of size 3 or `order` is not 0 or 1.
+    """
+    points = np.asarray(points, dtype=np.float64)
+    if points.ndim < 1 or points.shape[-1] != 3:
+        raise ValueError("points must have shape (..., 3).")
+    out_shape = points.shape[:-1]
+    points = points.reshape(-1, 3)
+
+    if subvolume_idx != 0:
+        scale_0, translation_0 = volume._level_transform(0)
+        scale, translation = volume._level_transform(subvolume_idx)
+        points = (points * scale_0 + translation_0 - translation) / scale
+
+    shape = np.asarray(volume.shape(subvolume_idx), dtype=np.float64)
+
+    if order == 0:
+        indices = np.floor(points + 0.5).astype(np.int64)
+        return gather_voxels(volume, subvolume_idx, indices, fill_value).reshape(out_shape)
+
+    if order != 1:
+        raise ValueError("order must be 0 (nearest) or 1 (trilinear).")
+
+    values = np.full(len(points), fill_value, dtype=np.float32)
+    inside = np.all((points >= 0) & (points <= shape - 1), axis=1)
+    points = points[inside]
+    base = np.floor(points).astype(np.int64)
+    frac = (points - base).astype(np.float32)
+    upper = shape.astype(np.int64) - 1
+
+    # Gather all eight corners in one pass so shared chunks are fetched once
+    corners = np.minimum(base[None, :, :] + _CORNERS[:, None, :], upper).reshape(-1, 3)
+    corner_values = gather_voxels(volume, subvolume_idx, corners).astype(np.float32).reshape(len(_CORNERS), -1)
+
+    weights = np.where(_CORNERS[:, None, :] == 1, frac[None, :, :], 1 - frac[None, :, :]).prod(axis=2)
+    values[inside] = (weights * corner_values).sum(axis=0)
+    return values.reshape(out_shape)
+
+
+def block_mean(array: NDArray, factor: Union[int, Sequence[int]]) -> NDArray:
+    """
+    Downsample the last axes of an array by averaging blocks of `factor` voxels.
+
+    The array is padded by repeating its edge to a multiple of `factor`, so the output has ceil(size / factor) pixels per axis.
+
+    Parameters
+    ----------
+    array : NDArray
+        Array of shape (..., H, W), or (..., *spatial) with a sequence of factors.
+    factor : Union[int, Sequence[int]]
+        Downsampling factor of the last two axes, or one factor per last axis.
+
+    Returns
+    -------
+    NDArray
+        The downsampled array, with the dtype of `array` (integer means are rounded).
+    """
+    factors = (int(factor),) * 2 if isinstance(factor, (int, np.integer)) else tuple(int(f) for f in factor)
+    if all(f <= 1 for f in factors):
+        return array
+    spatial = array.shape[array.ndim - len(factors):]
+    pad = [(0, 0)] * (array.ndim - len(factors)) + [(0, -size % f) for size, f in zip(spatial, factors)]
+    padded = np.pad(array, pad, mode='edge')
+    blocks_shape = padded.shape[:array.ndim - len(factors)]
+    for size, f in zip(padded.shape[array.ndim - len(factors):], factors):
+        blocks_shape += (size // f, f)
+    blocks = padded.reshape(blocks_shape)
+    mean = blocks.mean(axis=tuple(range(blocks.ndim - 2 * len(factors) + 1, blocks.ndim, 2)), dtype=np.float64)
+    if np.issubdtype(array.dtype, np.integer):
+        mean = np.rint(mean)
+    return mean.astype(array.dtype)
@@ -0,0 +1,396 @@
+import os
+import time
+import threading
+import contextlib
+import functools
+from collections import deque
+from concurrent.futures import CancelledError, Future, ThreadPoolExecutor
+from typing import Any, Callable, Deque, Dict, Hashable, Iterator, Optional, Tuple
+from .tracing import span
+
+# Priority classes, from the most to the least urgent
+PRIORITIES = ("interactive", "default", "bulk")
+
+# Maximum number of fetches running at once in the process, over all the classes
+MAX_CONCURRENCY = int(os.environ.get("VESUVIUS_READ_CONCURRENCY", 32))
+
+
+def default_limits(max_concurrency: int) -> Dict[str, int]:
+    """
+    Get the default maximum number of running fetches per class. Default and bulk reads are capped, so
+    interactive reads always find free slots.
+    """
+    return {"interactive": max_concurrency, "default": max(max_concurrency * 3 // 4, 1), "bulk": max(max_concurrency // 4, 1)}
+
+
+# Priority, group and deadline of the reads of the current thread
+_local = threading.local()
+
+
+class _Ticket:
+    """
+    A request for a fetch slot.
+    """
+    __slots__ = ("priority", "group", "granted", "cancelled", "event", "queued")
+
+    def __init__(self, priority: str, group: Optional[Hashable]) -> None:
+        self.priority = priority
+        self.group = group
+        self.granted = False
+        self.cancelled = False
+        self.event = threading.Event()
+        self.queued = time.perf_counter()
+
+
+class ReadScheduler:
+    """
+    Process-wide scheduler of the chunk fetches of all the volumes, by priority class.
+
+    Every fetch runs in a slot. Slots are granted to the waiting fetches of the most urgent class first,
+    within the limit of running fetches of every class and the total limit. Large reads take one slot per
+    group of chunks, so more urgent reads get ahead of them between groups. Waiting fetches can be cancelled
+    by group, or dropped when their deadline passes.
+
+    Attributes
+    ----------
+    max_concurrency : int
+        Maximum number of fetches running at once.
+    limits : Dict[str, int]
+        Maximum number of fetches running at once per priority class.
+    """
+    def __init__(self, max_concurrency: int = MAX_CONCURRENCY, limits: Optional[Dict[str, int]] = None) -> None:
+        """
+        Parameters
+        ----------
+        max_concurrency : int, default = MAX_CONCURRENCY
+            Maximum number of fetches running at once (32 by default, `VESUVIUS_READ_CONCURRENCY`).
+        limits : Optional[Dict[str, int]], default = None
+            Maximum number of running fetches of some priority classes, the others keeping `default_limits`.
+        """
+        self.max_concurrency = max(int(max_concurrency), 1)
+        self.limits = {**default_limits(self.max_concurrency), **(limits or {})}
+        unknown = set(self.limits) - set(PRIORITIES)
+        if unknown:
+            raise ValueError(f"Unknown priority classes {sorted(unknown)}, expected {PRIORITIES}.")
+        self._lock = threading.Lock()
+        self._waiting: Dict[str, Deque[_Ticket]] = {priority: deque() for priority in PRIORITIES}
+        self._active = {priority: 0 for priority in PRIORITIES}
+        self._counters = {priority: {"granted": 0, "cancelled": 0, "wait_seconds": 0.0, "max_wait_seconds": 0.0} for priority in PRIORITIES}
+        self._executors: Dict[str, ThreadPoolExecutor] = {}
+        self._fetch_executor: Optional[ThreadPoolExecutor] = None
+        self._submitted: Dict[Hashable, "set[Future]"] = {}
+
+    def _dispatch(self) -> None:
+        """
+        Grant free slots to the most urgent waiting fetches. Called with the lock held.
+        """
+        while sum(self._active.values()) < self.max_concurrency:
+            for priority in PRIORITIES:
+                if self._waiting[priority] and self._active[priority] < self.limits[priority]:
+                    ticket = self._waiting[priority].popleft()
+                    ticket.granted = True
+                    self._active[priority] += 1
+                    counters = self._counters[priority]
+                    wait = time.perf_counter() - ticket.queued
+                    counters["granted"] += 1
+                    counters["wait_seconds"] += wait
+                    counters["max_wait_seconds"] = max(counters["max_wait_seconds"], wait)
+                    ticket.event.set()
+                    break
+            else:
+                return
+
+    def acquire(self, priority: str = "default", group: Optional[Hashable] = None, deadline: Optional[float] = None) -> _Ticket:
+        """
+        Wait for a fetch slot.
+
+        Parameters
+        ----------
+        priority : str, default = "default"
+            Priority class: "interactive", "default" or "bulk".
+        group : Optional[Hashable], default = None
+            Group of the request, for `cancel`.
+        deadline : Optional[float], default = None
+            Time (`time.monotonic()`) after which the request is dropped if it has not started.
+
+        Returns
+        -------
+        _Ticket
+            The granted slot, to pass to `release`.
+
+        Raises
+        ------
+        concurrent.futures.CancelledError
+            If the request was cancelled or its deadline passed before it started.
+        """
+        if priority not in self._waiting:
+            raise ValueError(f"priority should be one of {PRIORITIES}.")
+        ticket = _Ticket(priority, group)
+        with self._lock:
+            self._waiting[priority].append(ticket)
+            self._dispatch()
+        if not ticket.granted:
+            with span("scheduler.wait", priority=priority):
+                timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+                if not ticket.event.wait(timeout):
+                    with self._lock:
+                        if not ticket.granted:
+                            self._drop(ticket)
+        if ticket.cancelled:
+            raise CancelledError(f"Read of group {group!r} cancelled before it started.")
+        return ticket
+
+    def _drop(self, ticket: _Ticket) -> None:
+        """
+        Remove a waiting ticket from its queue and wake up its thread. Called with the lock held.
+        """
+        try:
+            self._waiting[ticket.priority].remove(ticket)
+        except ValueError:
+            return
+        ticket.cancelled = True
+        self._counters[ticket.priority]["cancelled"] += 1
+        ticket.event.set()
+
+    def release(self, ticket: _Ticket) -> None:
+        """
+        Free the slot of a finished fetch.
+        """
+        with self._lock:
+            self._active[ticket.priority] -= 1
+            self._dispatch()
+
+    def run_in_slot(self, ticket: _Ticket, function: Callable[..., Any], *args: Any) -> Future:
+        """
+        Run a fetch in a granted slot in the fetch threads of the scheduler, and release the slot when it finishes.
+
+        There is one fetch thread per slot, so the fetch starts at once. The caller can acquire the next slot
+        while it runs, letting one large read keep as many fetches running as its class is granted slots.
+
+        Parameters
+        ----------
+        ticket : _Ticket
+            The slot, from `acquire`.
+        function : Callable[..., Any]
+            The fetch, called with `args`.
+
+        Returns
+        -------
+        Future
+            The result of the fetch.
+        """
+        def run() -> Any:
+            try:
+                return function(*args)
+            finally:
+                self.release(ticket)
+        with self._lock:
+            if self._fetch_executor is None:
+                self._fetch_executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="vesuvius-fetch")
+        try:
+            return self._fetch_executor.submit(run)
+        except BaseException:
+            self.release(ticket)
+            raise
+
+    @contextlib.contextmanager
+    def slot(self, priority: Optional[str] = None, group: Optional[Hashable] = None, deadline: Optional[float] = None) -> Iterator[None]:
+        """
+        Run the enclosed fetch in a slot. The priority, group and deadline default to those of `read_priority`.
+        """
+        current = current_read_priority()
+        ticket = self.acquire(priority or current[0], group if group is not None else current[1], deadline if deadline is not None else current[2])
+        try:
+            yield
+        finally:
+            self.release(ticket)
+
+    def cancel(self, group: Hashable) -> int:
+        """
+        Cancel the requests of a group that have not started, e.g. the reads of a viewport that is not visible anymore.
+
+        Parameters
+        ----------
+        group : Hashable
+            The group.
+
+        Returns
+        -------
+        int
+            The number of requests cancelled.
+        """
+        with self._lock:
+            tickets = [ticket for queue in self._waiting.values() for ticket in queue if ticket.group == group]
+            for ticket in tickets:
+                self._drop(ticket)
+            futures = list(self._submitted.get(group, ()))
+        # Submitted reads still queued in the executors never start
+        return len(tickets) + sum(future.cancel() for future in futures)
+
+    def submit(self, function: Callable[..., Any], *args: Any, priority: str = "default", group: Optional[Hashable] = None, deadline: Optional[float] = None, **kwargs: Any) -> Future:
+        """
+        Run a read in the background with a priority class.
+
+        Parameters
+        ----------
+        function : Callable[..., Any]
+            The read, called with `args` and `kwargs`. Its fetches run in slots of the given class.
+        priority : str, default = "default"
+            Priority class.
+        group : Optional[Hashable], default = None
+            Group of the read, for `cancel`.
+        deadline : Optional[float], default = None
+            Time (`time.monotonic()`) after which the fetches of the read that have not started are dropped.
+
+        Returns
+        -------
+        Future
+            The result of the read. It raises `CancelledError` if the read was cancelled.
+        """
+        if priority not in self._waiting:
+            raise ValueError(f"priority should be one of {PRIORITIES}.")
+        with self._lock:
+            # One pool per class, so that queued bulk reads never delay interactive ones
+            executor = self._executors.get(priority)
+            if executor is None:
+                executor = self._executors[priority] = ThreadPoolExecutor(max_workers=self.limits[priority], thread_name_prefix=f"vesuvius-{priority}")
+        future = executor.submit(bind_read_priority(functools.partial(function, *args, **kwargs), priority, group, deadline))
+        if group is not None:
+            with self._lock:
+                self._submitted.setdefault(group, set()).add(future)
+            future.add_done_callback(functools.partial(self._forget, group))
+        return future
+
+    def _forget(self, group: Hashable, future: Future) -> None:
+        with self._lock:
+            futures = self._submitted.get(group)
+            if futures is not None:
+                futures.discard(future)
+                if not futures:
+                    del self._submitted[group]
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Get the running and waiting fetches and the counters of every priority class.
+
+        Returns
+        -------
+        Dict[str, Dict[str, Any]]
+            For every class: the "limit", the "active" and "waiting" fetches, the "granted" and "cancelled"
+            requests, and the mean and maximum time spent waiting for a slot in seconds.
+        """
+        with self._lock:
+            return {
+                priority: {
+                    "limit": self.limits[priority],
+                    "active": self._active[priority],
+                    "waiting": len(self._waiting[priority]),
+                    "granted": self._counters[priority]["granted"],
+                    "cancelled": self._counters[priority]["cancelled"],
+                    "mean_wait_seconds": self._counters[priority]["wait_seconds"] / max(self._counters[priority]["granted"], 1),
+                    "max_wait_seconds": self._counters[priority]["max_wait_seconds"],
+                }
+                for priority in PRIORITIES
+            }
+
+
+_scheduler: Optional[ReadScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_read_scheduler() -> ReadScheduler:
+    """
+    Get the read scheduler of this process, shared by all the volumes.
+    """
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = ReadScheduler()
+        return _scheduler
+
+
+def configure_read_scheduler(max_concurrency: int = MAX_CONCURRENCY, limits: Optional[Dict[str, int]] = None) -> ReadScheduler:
+    """
+    Replace the read scheduler of this process. Fetches already waiting keep the previous one.
+
+    Parameters
+    ----------
+    max_concurrency : int, default = MAX_CONCURRENCY
+        Maximum number of fetches running at once.
+    limits : Optional[Dict[str, int]], default = None
+        Maximum number of running fetches per priority class (see `default_limits`).
+
+    Returns
+    -------
+    ReadScheduler
+        The new scheduler.
+    """
+    global _scheduler
+    with _scheduler_lock:
+        _scheduler = ReadScheduler(max_concurrency, limits)
+        return _scheduler
+
+
+def current_read_priority() -> Tuple[str, Optional[Hashable], Optional[float]]:
+    """
+    Get the priority class, group and deadline of the reads of the current thread.
+    """
+    return getattr(_local, "context", ("default", None, None))
+
+
+@contextlib.contextmanager
+def read_priority(priority: str, group: Optional[Hashable] = None, timeout: Optional[float] = None) -> Iterator[None]:
+    """
+    Give a priority class to the reads of the current thread in the enclosed block.
+
+    Parameters
+    ----------
+    priority : str
+        Priority class: "interactive", "default" or "bulk".
+    group : Optional[Hashable], default = None
+        Group of the reads, to cancel them with `Volume.cancel` or `ReadScheduler.cancel`.
+    timeout : Optional[float], default = None
+        Seconds after which the fetches of the block that have not started are dropped with `CancelledError`.
+
+    Examples
+    --------
+    >>> with read_priority("bulk"):
+    ...     volume.predict(model, tile_shape=(64, 256, 256))
+    """
+    if priority not in PRIORITIES:
+        raise ValueError(f"priority should be one of {PRIORITIES}.")
+    previous = current_read_priority()
+    _local.context = (priority, group, None if timeout is None else time.monotonic() + timeout)
+    try:
+        yield
+    finally:
+        _local.context = previous
+
+
+def bind_read_priority(function: Callable[..., Any], priority: Optional[str] = None, group: Optional[Hashable] = None, deadline: Optional[float] = None) -> Callable[..., Any]:
+    """
+    Wrap a function so that it reads with the given priority class, by default the one of the calling thread.
+
+    Thread pools do not inherit the priority of the thread submitting to them: functions submitted on
+    behalf of a read are wrapped with this function.
+    """
+    context = current_read_priority() if priority is None else (priority, group, deadline)
+
+    @functools.wraps(function)
+    def wrapper(*args: Any, **kwargs: Any) -> Any:
+        previous = current_read_priority()
+        _local.context = context
+        try:
+            return function(*args, **kwargs)
+        finally:
+            _local.context = previous
+    return wrapper
+
+
+def _reset_after_fork() -> None:
+    global _scheduler, _scheduler_lock
+    _scheduler = None
+    _scheduler_lock = threading.Lock()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,592 @@
+import os
+import json
+import socket
+import argparse
+import threading
+import http.client
+import numpy as np
+from numpy.typing import NDArray
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from socketserver import ThreadingMixIn, UnixStreamServer
+from urllib.parse import parse_qs, quote, urlencode, urlsplit
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+from .volume import Volume
+from .paths.utils import is_aws_ec2_instance
+from .scheduler import read_priority
+
+# Regions are given as "start:stop[:step]" or as a single index, one per axis
+Region = Tuple[Union[slice, int], ...]
+AXES = ("z", "y", "x")
+
+
+def parse_axis(value: Optional[str]) -> Union[slice, int]:
+    """
+    Parse the selection of one axis, e.g. "10:20", "5" or "::4".
+
+    Parameters
+    ----------
+    value : Optional[str]
+        The selection. None or an empty string selects the whole axis.
+
+    Returns
+    -------
+    Union[slice, int]
+        The selection as a slice or an index.
+
+    Raises
+    ------
+    ValueError
+        If the selection cannot be parsed.
+    """
+    if value is None or value == "":
+        return slice(None)
+    if ":" not in value:
+        return int(value)
+    parts = value.split(":")
+    if len(parts) > 3:
+        raise ValueError(f"Invalid axis selection: {value}")
+    return slice(*(int(part) if part else None for part in parts))
+
+
+def format_axis(value: Union[slice, int, str, Tuple[int, int], None]) -> str:
+    """
+    Format the selection of one axis for a request, the inverse of `parse_axis`.
+    """
+    if value is None:
+        return ":"
+    if isinstance(value, str):
+        return value
+    if isinstance(value, slice):
+        parts = [value.start, value.stop] + ([value.step] if value.step is not None else [])
+        return ":".join("" if part is None else str(part) for part in parts)
+    if isinstance(value, (tuple, list)):
+        return ":".join(str(part) for part in value)
+    return str(int(value))
+
+
+class VolumeRegistry:
+    """
+    The volumes served by a server, opened on first use and kept open, so that all the clients share
+    their data handles, their TensorStore cache pool and their HTTP connections.
+
+    Attributes
+    ----------
+    max_volumes : int
+        Maximum number of open volumes. The least recently used volume is closed beyond this number.
+    root : Optional[str]
+        Directory of local volumes, or None to open the volumes of the catalog.
+    volume_kwargs : Dict[str, Any]
+        Keyword arguments passed to `Volume`, e.g. `cache_pool`.
+    """
+    def __init__(self, max_volumes: int = 64, root: Optional[str] = None, **volume_kwargs: Any) -> None:
+        """
+        Initialize the VolumeRegistry object.
+
+        Parameters
+        ----------
+        max_volumes : int, default = 64
+            Maximum number of open volumes.
+        root : Optional[str], default = None
+            Directory of local volumes: the volume `<name>` is opened from the OME-Zarr `<root>/<name>` with the
+            "local" domain, including volumes missing from the catalog. If None the volumes are found in the catalog.
+        **volume_kwargs : Any
+            Keyword arguments passed to `Volume`, e.g. `cache_pool` or `domain`.
+        """
+        self.max_volumes = max_volumes
+        self.root = root
+        self.volume_kwargs = volume_kwargs
+        self._volumes: "OrderedDict[Tuple[str, Optional[int], Optional[float]], Volume]" = OrderedDict()
+        self._opening: Dict[Tuple[str, Optional[int], Optional[float]], threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def get(self, name: str, energy: Optional[int] = None, resolution: Optional[float] = None) -> Volume:
+        """
+        Get an open volume, opening it on first use. Concurrent requests for the same volume open it once.
+
+        Parameters
+        ----------
+        name : str
+            The `type` argument of `Volume`: a segment ID or a scroll name such as "scroll1".
+        energy : Optional[int], default = None
+            Energy of the scan. If None the canonical energy is used.
+        resolution : Optional[float], default = None
+            Resolution of the scan. If None the canonical resolution is used.
+
+        Returns
+        -------
+        Volume
+            The open volume.
+
+        Raises
+        ------
+        ValueError
+            If the volume cannot be opened, or its name is not a plain file name while serving a root directory.
+        """
+        key = (name, energy, resolution)
+        with self._lock:
+            volume = self._volumes.get(key)
+            if volume is not None:
+                self._volumes.move_to_end(key)
+                return volume
+            opening = self._opening.setdefault(key, threading.Lock())
+
+        try:
+            with opening:
+                with self._lock:
+                    volume = self._volumes.get(key)
+                if volume is None:
+                    volume = Volume(name, energy=energy, resolution=resolution, **{**self.volume_kwargs, **self._location(name)})
+                    with self._lock:
+                        self._volumes[key] = volume
+                        while len(self._volumes) > self.max_volumes:
+                            self._volumes.popitem(last=False)
+        finally:
+            # Also when opening fails, e.g. for an unknown name, so that client-supplied names do not accumulate
+            with self._lock:
+                self._opening.pop(key, None)
+        return volume
+
+    def _location(self, name: str) -> Dict[str, Any]:
+        """
+        Get the `domain` and `path` arguments of `Volume` for a volume of the root directory.
+        """
+        if self.root is None:
+            return {}
+        # Names come from clients: they must not reach outside the root
+        if not name or name.startswith(".") or "/" in name or os.sep in name:
+            raise ValueError(f"Invalid volume name {name!r}.")
+        return {"domain": "local", "path": os.path.join(self.root, name)}
+
+
+class VolumeRequestHandler(BaseHTTPRequestHandler):
+    """
+    HTTP API over the volumes of a `VolumeRegistry`.
+
+    Endpoints (`<name>` is a segment ID or a scroll name, `energy` and `resolution` are optional query parameters):
+
+    - `GET /volumes/<name>`: JSON description (shape, dtype and chunks of every level).
+    - `GET /volumes/<name>/roi?z=0:64&y=100:356&x=200:456&level=0`: raw region.
+    - `GET /volumes/<name>/slice?axis=0&index=30&level=0`: raw 2D slice, optionally cropped with `z`, `y` and `x`.
+    - `GET /volumes/<name>/preview?axis=0&index=30&max_size=1024&format=png`: downsampled slice (see `Volume.preview`), as PNG or raw (`format=raw`).
+    - `POST /volumes/<name>/batch`: many regions of one level in a single round trip. The body is
+      `{"level": 0, "regions": [{"z": "0:64", "y": "0:64", "x": "0:64"}, ...]}`, the response is a JSON header line
+      `{"regions": [{"shape": [...], "dtype": "<u2", "offset": 0, "length": 524288}, ...]}` followed by the raw regions.
+
+    Raw responses are C-ordered arrays, described by the `X-Shape` and `X-Dtype` headers. Every endpoint takes an
+    optional `priority` query parameter, "interactive", "default" or "bulk", the read priority of the request.
+    """
+    protocol_version = "HTTP/1.1"
+    server_version = "vesuvius"
+
+    def log_message(self, format: str, *args: Any) -> None:
+        if getattr(self.server, "verbose", False):
+            super().log_message(format, *args)
+
+    def address_string(self) -> str:
+        # Unix socket clients have no address
+        return str(self.client_address[0]) if self.client_address else "unix"
+
+    def _send(self, status: int, body: bytes, content_type: str, headers: Optional[Dict[str, str]] = None) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def _send_json(self, status: int, obj: Any) -> None:
+        self._send(status, json.dumps(obj).encode("utf-8"), "application/json")
+
+    def _send_array(self, array: NDArray) -> None:
+        array = np.ascontiguousarray(array)
+        self._send(200, array.tobytes(), "application/octet-stream", {
+            "X-Shape": ",".join(str(size) for size in array.shape),
+            "X-Dtype": array.dtype.str,
+        })
+
+    def _route(self) -> Tuple[Volume, str, Dict[str, str]]:
+        url = urlsplit(self.path)
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        parts = [part for part in url.path.split("/") if part]
+        if len(parts) not in (2, 3) or parts[0] != "volumes":
+            raise LookupError(f"Unknown endpoint: {url.path}")
+        energy = int(params["energy"]) if "energy" in params else None
+        resolution = float(params["resolution"]) if "resolution" in params else None
+        try:
+            volume = self.server.registry.get(parts[1], energy, resolution)
+        except (ValueError, AssertionError) as e:
+            raise LookupError(f"Cannot open volume {parts[1]}: {e}")
+        return volume, parts[2] if len(parts) == 3 else "", params
+
+    def _region_bytes(self, volume: Volume, level: int, region: Region) -> int:
+        if not 0 <= level < len(volume.data):
+            raise ValueError(f"Invalid level {level}.")
+        nbytes = volume.dtype.itemsize
+        for size, axis in zip(volume.shape(level), region):
+            nbytes *= len(range(size)[axis]) if isinstance(axis, slice) else 1
+        return nbytes
+
+    def _check_size(self, nbytes: int) -> None:
+        if nbytes > self.server.max_bytes:
+            raise MemoryError(f"The response has {nbytes} bytes, more than the limit of {self.server.max_bytes} bytes.")
+
+    def _read(self, volume: Volume, level: int, region: Region) -> NDArray:
+        self._check_size(self._region_bytes(volume, level, region))
+        return volume._read_region(level, region)
+
+    def _handle(self, handler: Any) -> None:
+        try:
+            # Reads of interactive clients get ahead of bulk ones, see `vesuvius.scheduler`
+            priority = parse_qs(urlsplit(self.path).query).get("priority", ["default"])[-1]
+            with read_priority(priority):
+                handler()
+        except LookupError as e:
+            self._send_json(404, {"error": str(e)})
+        except MemoryError as e:
+            self._send_json(413, {"error": str(e)})
+        except (ValueError, IndexError, TypeError, AssertionError) as e:
+            self._send_json(400, {"error": str(e)})
+        except Exception as e:
+            self._send_json(500, {"error": str(e)})
+
+    def do_GET(self) -> None:
+        self._handle(self._get)
+
+    def do_HEAD(self) -> None:
+        self._handle(self._get)
+
+    def do_POST(self) -> None:
+        self._handle(self._post)
+
+    def _get(self) -> None:
+        volume, endpoint, params = self._route()
+        level = int(params.get("level", 0))
+        if endpoint == "":
+            self._send_json(200, {
+                "dtype": volume.dtype.str,
+                "levels": [{"shape": list(volume.shape(idx)), "chunks": list(volume.chunks(idx))} for idx in range(len(volume.data))],
+            })
+        elif endpoint == "roi":
+            region = tuple(parse_axis(params.get(axis)) for axis in AXES)
+            self._send_array(self._read(volume, level, region))
+        elif endpoint == "slice":
+            axis = int(params.get("axis", 0))
+            if axis not in (0, 1, 2):
+                raise ValueError("axis must be 0, 1 or 2.")
+            region = [parse_axis(params.get(name)) for name in AXES]
+            region[axis] = int(params["index"])
+            self._send_array(self._read(volume, level, tuple(region)))
+        elif endpoint == "preview":
+            axis = int(params.get("axis", 0))
+            index = int(params["index"]) if "index" in params else None
+            max_size = int(params.get("max_size", 1024))
+            if axis not in (0, 1, 2) or max_size < 1:
+                raise ValueError("axis must be 0, 1 or 2 and max_size positive.")
+            # The whole slice of the level the preview is rendered from is read
+            level = volume._preview_level(axis, max_size)
+            self._check_size(volume.dtype.itemsize * int(np.prod([size for dim, size in enumerate(volume.shape(level)) if dim != axis])))
+            if params.get("format", "png") == "png":
+                self._send(200, volume.preview(axis, index, max_size, format="png"), "image/png")
+            else:
+                self._send_array(volume.preview(axis, index, max_size))
+        else:
+            raise LookupError(f"Unknown endpoint: {endpoint}")
+
+    def _post(self) -> None:
+        # The body is read before anything can fail, so that an error response leaves no unread bytes on a kept-alive connection
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length)
+        volume, endpoint, _ = self._route()
+        request = json.loads(body or b"{}")
+        if endpoint != "batch":
+            raise LookupError(f"Unknown endpoint: {endpoint}")
+        level = int(request.get("level", 0))
+        regions = [tuple(parse_axis(None if spec.get(axis) is None else str(spec.get(axis))) for axis in AXES) for spec in request.get("regions", [])]
+        self._check_size(sum(self._region_bytes(volume, level, region) for region in regions))
+
+        # All the regions are requested at once, so TensorStore fetches the chunks they need in parallel
+        arrays = [np.ascontiguousarray(array) for array in volume._read_regions(level, regions)]
+        layout = []
+        offset = 0
+        for array in arrays:
+            layout.append({"shape": list(array.shape), "dtype": array.dtype.str, "offset": offset, "length": array.nbytes})
+            offset += array.nbytes
+        header = json.dumps({"regions": layout}).encode("utf-8") + b"\n"
+        self._send(200, header + b"".join(array.tobytes() for array in arrays), "application/octet-stream")
+
+
+class VolumeHTTPServer(ThreadingHTTPServer):
+    """
+    A threaded HTTP server serving the volumes of a `VolumeRegistry` over TCP.
+    """
+    daemon_threads = True
+
+    def __init__(self, address: Tuple[str, int], registry: VolumeRegistry, max_bytes: int = 1 << 30, verbose: bool = False) -> None:
+        self.registry = registry
+        self.max_bytes = max_bytes
+        self.verbose = verbose
+        super().__init__(address, VolumeRequestHandler)
+
+
+class UnixVolumeHTTPServer(ThreadingMixIn, UnixStreamServer):
+    """
+    A threaded HTTP server serving the volumes of a `VolumeRegistry` over a Unix socket.
+    """
+    daemon_threads = True
+
+    def __init__(self, socket_path: str, registry: VolumeRegistry, max_bytes: int = 1 << 30, verbose: bool = False) -> None:
+        self.registry = registry
+        self.max_bytes = max_bytes
+        self.verbose = verbose
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        super().__init__(socket_path, VolumeRequestHandler)
+
+    def server_close(self) -> None:
+        super().server_close()
+        try:
+            os.remove(self.server_address)
+        except OSError:
+            pass
+
+
+def make_server(host: str = "127.0.0.1", port: int = 8765, socket_path: Optional[str] = None, max_volumes: int = 64, max_bytes: int = 1 << 30, verbose: bool = False, root: Optional[str] = None, **volume_kwargs: Any) -> Union[VolumeHTTPServer, UnixVolumeHTTPServer]:
+    """
+    Create a volume server, without starting it.
+
+    Parameters
+    ----------
+    host : str, default = "127.0.0.1"
+        Address to listen on.
+    port : int, default = 8765
+        Port to listen on. Use 0 to pick a free port.
+    socket_path : Optional[str], default = None
+        If given, listen on this Unix socket instead of TCP.
+    max_volumes : int, default = 64
+        Maximum number of open volumes.
+    max_bytes : int, default = 1 GiB
+        Maximum size of a response, and of the slice read to render a preview. Larger requests get a 413 response.
+    verbose : bool, default = False
+        If True, every request is logged.
+    root : Optional[str], default = None
+        Directory of local volumes, served by file name (see `VolumeRegistry`). If None the catalog volumes are served.
+    **volume_kwargs : Any
+        Keyword arguments passed to `Volume`, e.g. `cache_pool`.
+
+    Returns
+    -------
+    Union[VolumeHTTPServer, UnixVolumeHTTPServer]
+        The server. Call `serve_forever()` to start it.
+    """
+    registry = VolumeRegistry(max_volumes=max_volumes, root=root, **volume_kwargs)
+    if socket_path is not None:
+        return UnixVolumeHTTPServer(socket_path, registry, max_bytes=max_bytes, verbose=verbose)
+    return VolumeHTTPServer((host, port), registry, max_bytes=max_bytes, verbose=verbose)
+
+
+def serve(host: str = "127.0.0.1", port: int = 8765, socket_path: Optional[str] = None, **kwargs: Any) -> None:
+    """
+    Run a volume server until interrupted. See `make_server` for the parameters.
+    """
+    server = make_server(host, port, socket_path, **kwargs)
+    where = socket_path if socket_path is not None else f"http://{server.server_address[0]}:{server.server_address[1]}"
+    print(f"Serving volumes on {where}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, socket_path: str, timeout: Optional[float] = None) -> None:
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self) -> None:
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        if self.timeout is not None:
+            self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+class VolumeClient:
+    """
+    A client of a volume server. Every thread keeps its own persistent connection.
+
+    Attributes
+    ----------
+    address : str
+        The server URL, e.g. "http://127.0.0.1:8765", or the path of its Unix socket.
+    timeout : Optional[float]
+        Timeout in seconds of the requests.
+    """
+    def __init__(self, address: str = "http://127.0.0.1:8765", timeout: Optional[float] = 300) -> None:
+        """
+        Initialize the VolumeClient object.
+
+        Parameters
+        ----------
+        address : str, default = "http://127.0.0.1:8765"
+            The server URL, or the path of its Unix socket.
+        timeout : Optional[float], default = 300
+            Timeout in seconds of the requests.
+        """
+        self.address = address
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connection(self) -> http.client.HTTPConnection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            if self.address.startswith("http://"):
+                url = urlsplit(self.address)
+                connection = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=self.timeout)
+            else:
+                connection = _UnixHTTPConnection(self.address, timeout=self.timeout)
+            self._local.connection = connection
+        return connection
+
+    def _request(self, method: str, path: str, body: Optional[bytes] = None) -> Tuple[bytes, http.client.HTTPResponse]:
+        for attempt in range(2):
+            connection = self._connection()
+            try:
+                headers = {"Content-Type": "application/json"} if body is not None else {}
+                connection.request(method, path, body=body, headers=headers)
+                response = connection.getresponse()
+                data = response.read()
+                break
+            except (ConnectionError, http.client.HTTPException):
+                # The server closed the persistent connection: reconnect once
+                connection.close()
+                self._local.connection = None
+                if attempt:
+                    raise
+        if response.status != 200:
+            try:
+                message = json.loads(data)["error"]
+            except (ValueError, KeyError):
+                message = data.decode("utf-8", "replace")
+            raise RuntimeError(f"Request {method} {path} failed with status {response.status}: {message}")
+        return data, response
+
+    @staticmethod
+    def _path(name: Union[str, int], endpoint: str, params: Dict[str, Any]) -> str:
+        query = urlencode({key: value for key, value in params.items() if value is not None})
+        path = f"/volumes/{quote(str(name))}" + (f"/{endpoint}" if endpoint else "")
+        return f"{path}?{query}" if query else path
+
+    @staticmethod
+    def _array(data: bytes, response: http.client.HTTPResponse) -> NDArray:
+        shape = tuple(int(size) for size in response.headers["X-Shape"].split(",") if size)
+        return np.frombuffer(data, dtype=np.dtype(response.headers["X-Dtype"])).reshape(shape)
+
+    def info(self, name: Union[str, int], energy: Optional[int] = None, resolution: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Get the description of a volume: its dtype and the shape and chunks of every level.
+        """
+        data, _ = self._request("GET", self._path(name, "", {"energy": energy, "resolution": resolution}))
+        return json.loads(data)
+
+    def roi(self, name: Union[str, int], z: Any = None, y: Any = None, x: Any = None, level: int = 0, energy: Optional[int] = None, resolution: Optional[float] = None, priority: Optional[str] = None) -> NDArray:
+        """
+        Read a region of a volume.
+
+        Parameters
+        ----------
+        name : Union[str, int]
+            A segment ID or a scroll name such as "scroll1".
+        z, y, x : Any, default = None
+            Selection of every axis: a slice, a (start, stop) pair, an index, or None for the whole axis.
+        level : int, default = 0
+            Multiscale level.
+        energy : Optional[int], default = None
+            Energy of the scan.
+        resolution : Optional[float], default = None
+            Resolution of the scan.
+        priority : Optional[str], default = None
+            Read priority on the server: "interactive", "default" or "bulk".
+
+        Returns
+        -------
+        NDArray
+            The region.
+        """
+        params = {"z": format_axis(z), "y": format_axis(y), "x": format_axis(x), "level": level, "energy": energy, "resolution": resolution, "priority": priority}
+        return self._array(*self._request("GET", self._path(name, "roi", params)))
+
+    def slice(self, name: Union[str, int], axis: int, index: int, level: int = 0, energy: Optional[int] = None, resolution: Optional[float] = None, priority: Optional[str] = None) -> NDArray:
+        """
+        Read a 2D slice of a volume, orthogonal to `axis`.
+        """
+        params = {"axis": axis, "index": index, "level": level, "energy": energy, "resolution": resolution, "priority": priority}
+        return self._array(*self._request("GET", self._path(name, "slice", params)))
+
+    def preview(self, name: Union[str, int], axis: int = 0, index: Optional[int] = None, max_size: int = 1024, format: str = "array", energy: Optional[int] = None, resolution: Optional[float] = None) -> Union[NDArray, bytes]:
+        """
+        Get a downsampled slice of a volume, see `Volume.preview`. With `format="png"` the encoded PNG image is returned.
+        """
+        params = {"axis": axis, "index": index, "max_size": max_size, "format": "png" if format == "png" else "raw", "energy": energy, "resolution": resolution}
+        data, response = self._request("GET", self._path(name, "preview", params))
+        return data if format == "png" else self._array(data, response)
+
+    def batch(self, name: Union[str, int], regions: Sequence[Tuple[Any, Any, Any]], level: int = 0, energy: Optional[int] = None, resolution: Optional[float] = None, priority: Optional[str] = None) -> List[NDArray]:
+        """
+        Read many regions of a volume in a single request.
+
+        Parameters
+        ----------
+        name : Union[str, int]
+            A segment ID or a scroll name such as "scroll1".
+        regions : Sequence[Tuple[Any, Any, Any]]
+            The (z, y, x) selections of the regions, as in `roi`.
+        level : int, default = 0
+            Multiscale level.
+        priority : Optional[str], default = None
+            Read priority on the server: "interactive", "default" or "bulk".
+
+        Returns
+        -------
+        List[NDArray]
+            The regions, in the same order.
+        """
+        body = json.dumps({"level": level, "regions": [dict(zip(AXES, (format_axis(axis) for axis in region))) for region in regions]}).encode("utf-8")
+        data, _ = self._request("POST", self._path(name, "batch", {"energy": energy, "resolution": resolution, "priority": priority}), body)
+        header_end = data.index(b"\n") + 1
+        layout = json.loads(data[:header_end])["regions"]
+        return [
+            np.frombuffer(data, dtype=np.dtype(item["dtype"]), count=int(np.prod(item["shape"])), offset=header_end + item["offset"]).reshape(item["shape"])
+            for item in layout
+        ]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Serve volume regions over a local HTTP API, sharing one cache between many clients')
+    parser.add_argument('--host', default='127.0.0.1', help='Address to listen on')
+    parser.add_argument('--port', type=int, default=8765, help='Port to listen on')
+    parser.add_argument('--socket', default=None, help='Listen on this Unix socket instead of TCP')
+    parser.add_argument('--cache-pool', type=float, default=None, help='Size of the shared TensorStore cache pool in bytes (default: a fraction of the memory or cgroup limit)')
+    parser.add_argument('--max-volumes', type=int, default=64, help='Maximum number of open volumes')
+    parser.add_argument('--max-bytes', type=int, default=1 << 30, help='Maximum size of a response in bytes')
+    parser.add_argument('--domain', default=None, choices=['dl.ash2txt', 'local'], help='Domain of the volumes')
+    parser.add_argument('--root', default=None, help='Serve the local OME-Zarr volumes of this directory, by file name (implies --domain local)')
+    parser.add_argument('--verbose', action='store_true', help='Log every request')
+
+    args = parser.parse_args()
+    if args.root is not None and args.domain == "dl.ash2txt":
+        parser.error("--root serves local volumes and cannot be used with --domain dl.ash2txt")
+    if args.domain == "local" and args.root is None and not is_aws_ec2_instance():
+        parser.error("--domain local requires --root, the directory of the local volumes")
+
+    volume_kwargs = {"cache_pool": None if args.cache_pool is None else int(args.cache_pool)}
+    if args.domain is not None:
+        volume_kwargs["domain"] = args.domain
+    serve(args.host, args.port, args.socket, max_volumes=args.max_volumes, max_bytes=args.max_bytes, verbose=args.verbose, root=args.root, **volume_kwargs)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+import os
+import json
+import hashlib
+import itertools
+import numpy as np
+from numpy.typing import NDArray
+from typing import Any, Dict, Iterator, Optional, Sequence, Tuple, Union
+from .sampling import CHUNK_BATCH
+from .paths.atomic import atomic_write
+from .paths.metadata import get_metadata_cache
+
+# Number of histogram bins for dtypes that cannot be counted exactly (floats, integers wider than 16 bits)
+DEFAULT_BINS = 4096
+
+# Bump when the stored statistics change meaning, so that cached results are recomputed
+STATS_VERSION = 2
+
+
+class VolumeStats:
+    """
+    Intensity statistics of a volume level or region: histogram, extrema, mean and standard deviation.
+
+    For 8 and 16 bit integer volumes the histogram has one bin per value, so percentiles are exact.
+
+    Attributes
+    ----------
+    count : int
+        Number of voxels.
+    min : float
+        Minimum value.
+    max : float
+        Maximum value.
+    mean : float
+        Mean value.
+    std : float
+        Standard deviation.
+    histogram : NDArray
+        Voxel count of every bin.
+    edges : NDArray
+        Bin edges, of length len(histogram) + 1.
+    """
+    def __init__(self, count: int, min: float, max: float, mean: float, std: float, histogram: NDArray, edges: NDArray) -> None:
+        """
+        Initialize the VolumeStats object.
+
+        Parameters
+        ----------
+        count : int
+            Number of voxels.
+        min : float
+            Minimum value.
+        max : float
+            Maximum value.
+        mean : float
+            Mean value.
+        std : float
+            Standard deviation.
+        histogram : NDArray
+            Voxel count of every bin.
+        edges : NDArray
+            Bin edges, of length len(histogram) + 1.
+        """
+        self.count = count
+        self.min = min
+        self.max = max
+        self.mean = mean
+        self.std = std
+        self.histogram = histogram
+        self.edges = edges
+
+    def __repr__(self) -> str:
+        return f"VolumeStats(count={self.count}, min={self.min}, max={self.max}, mean={self.mean:.6g}, std={self.std:.6g})"
+
+    def percentile(self, q: Union[float, Sequence[float]]) -> Union[float, NDArray]:
+        """
+        Compute percentiles from the histogram.
+
+        Parameters
+        ----------
+        q : Union[float, Sequence[float]]
+            Percentile or sequence of percentiles, in [0, 100].
+
+        Returns
+        -------
+        Union[float, NDArray]
+            The lower edge of the bin holding every percentile, i.e. the exact value for integer histograms.
+        """
+        q = np.asarray(q, dtype=np.float64)
+        if self.count == 0:
+            result = np.full(q.shape, np.nan)
+        else:
+            cdf = np.cumsum(self.histogram)
+            rank = np.clip(q, 0, 100) / 100 * (self.count - 1)
+            bins = np.minimum(np.searchsorted(cdf, rank, side='right'), len(self.histogram) - 1)
+            result = np.clip(self.edges[bins], self.min, self.max)
+        return float(result) if result.ndim == 0 else result
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Convert the statistics to a JSON-serializable dictionary. The histogram is stored sparsely.
+        """
+        nonzero = np.nonzero(self.histogram)[0]
+        return {
+            "version": STATS_VERSION,
+            "count": int(self.count), "min": float(self.min), "max": float(self.max),
+            "mean": float(self.mean), "std": float(self.std),
+            "bins": len(self.histogram), "edges": [float(self.edges[0]), float(self.edges[-1])],
+            "nonzero": nonzero.tolist(), "counts": self.histogram[nonzero].tolist(),
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "VolumeStats":
+        """
+        Build the statistics from a dictionary created by `to_dict`.
+        """
+        if data.get("version") != STATS_VERSION:
+            raise ValueError("Unsupported statistics version.")
+        histogram = np.zeros(data["bins"], dtype=np.int64)
+        histogram[np.asarray(data["nonzero"], dtype=np.int64)] = data["counts"]
+        edges = np.linspace(data["edges"][0], data["edges"][1], data["bins"] + 1)
+        return cls(data["count"], data["min"], data["max"], data["mean"], data["std"], histogram, edges)
+
+
+def _region_values(volume: Any, subvolume_idx: int, region: Tuple[range, ...]) -> Iterator[NDArray]:
+    """
+    Yield the values of every chunk overlapping a region, cropped to the region and flattened.
+    """
+    chunks = volume.chunks(subvolume_idx)
+    chunk_ranges = [range(axis.start // n, -(-axis.stop // n)) for axis, n in zip(region, chunks)]
+    chunk_indices = list(itertools.product(*chunk_ranges))
+    for batch_start in range(0, len(chunk_indices), CHUNK_BATCH):
+        batch = chunk_indices[batch_start:batch_start + CHUNK_BATCH]
+        for chunk_idx, data in zip(batch, volume._read_chunks(subvolume_idx, batch)):
+            # Crop the chunk to the region
+            crop = tuple(
+                slice(max(axis.start - c * n, 0), min(axis.stop - c * n, n))
+                for axis, c, n in zip(region, chunk_idx, chunks)
+            )
+            values = np.asarray(data)[crop].ravel()
+            if values.size:
+                yield values
+
+
+def compute_stats(volume: Any, subvolume_idx: int, region: Optional[Tuple[slice, ...]] = None) -> VolumeStats:
+    """
+    Compute the statistics of a level or region of a volume in a streaming pass over its chunks.
+
+    Chunks are read concurrently, in batches, and reduced one at a time, so memory stays bounded by a batch of chunks.
+    The mean and variance of every chunk are merged with Chan's parallel update, which stays accurate for large
+    volumes with a large mean. 8 and 16 bit integer volumes are counted in the same pass. The histogram of other
+    dtypes spans the extrema found in the first pass, so their chunks are binned in a second pass.
+
+    Parameters
+    ----------
+    volume : Volume
+        The volume.
+    subvolume_idx : int
+        Index of the sub-volume.
+    region : Optional[Tuple[slice, ...]], default = None
+        (z, y, x) slices, without step, of the region in the coordinates of the sub-volume. If None the whole sub-volume is used.
+
+    Returns
+    -------
+    VolumeStats
+        The statistics.
+    """
+    shape = volume.shape(subvolume_idx)
+    region = tuple(range(size)[axis] for size, axis in zip(shape, region or (slice(None),) * 3))
+    if any(axis.step != 1 for axis in region):
+        raise ValueError("Regions must not have a step.")
+
+    dtype = np.dtype(volume.dtype)
+    exact = np.issubdtype(dtype, np.integer) and dtype.itemsize <= 2
+    if exact:
+        info = np.iinfo(dtype)
+        low, high, bins = float(info.min), float(info.max) + 1, int(info.max) - int(info.min) + 1
+        histogram = np.zeros(bins, dtype=np.int64)
+    count, mean, m2 = 0, 0.0, 0.0
+    minimum, maximum = np.inf, -np.inf
+
+    for values in _region_values(volume, subvolume_idx, region):
+        if exact:
+            histogram += np.bincount(values.astype(np.int64) - int(low), minlength=bins)
+        as_float = values.astype(np.float64)
+        chunk_mean = float(as_float.mean())
+        chunk_m2 = float(np.square(as_float - chunk_mean).sum())
+        # Chan et al. update of (count, mean, M2) with the moments of the chunk
+        total = count + values.size
+        delta = chunk_mean - mean
+        mean += delta * values.size / total
+        m2 += chunk_m2 + delta * delta * count * values.size / total
+        count = total
+        minimum = min(minimum, float(values.min()))
+        maximum = max(maximum, float(values.max()))
+
+    if not exact:
+        # Bins spanning the extrema of the region
+        low, high, bins = (minimum, maximum, DEFAULT_BINS) if count else (0.0, 1.0, DEFAULT_BINS)
+        high = high if high > low else low + 1
+        histogram = np.zeros(bins, dtype=np.int64)
+        if count:
+            for values in _region_values(volume, subvolume_idx, region):
+                positions = ((values.astype(np.float64) - low) * (bins / (high - low))).astype(np.int64)
+                histogram += np.bincount(np.clip(positions, 0, bins - 1), minlength=bins)
+
+    mean = mean if count else float('nan')
+    std = float(np.sqrt(m2 / count)) if count else float('nan')
+    return VolumeStats(count, minimum, maximum, mean, std, histogram, np.linspace(low, high, bins + 1))
+
+
+def cached_stats(volume: Any, subvolume_idx: int, region: Optional[Tuple[slice, ...]] = None, cache: bool = True) -> VolumeStats:
+    """
+    Get the statistics of a level or region of a volume, from the metadata cache directory when already computed.
+
+    Parameters
+    ----------
+    volume : Volume
+        The volume.
+    subvolume_idx : int
+        Index of the sub-volume.
+    region : Optional[Tuple[slice, ...]], default = None
+        Region in the coordinates of the sub-volume. If None the whole sub-volume is used.
+    cache : bool, default = True
+        If True the statistics are read from and saved to $METADATA_CACHE / stats.
+
+    Returns
+    -------
+    VolumeStats
+        The statistics.
+    """
+    if not cache:
+        return compute_stats(volume, subvolume_idx, region)
+
+    shape = volume.shape(subvolume_idx)
+    bounds = [[bound.start, bound.stop] for bound in (range(size)[axis] for size, axis in zip(shape, region or (slice(None),) * 3))]
+    key = json.dumps({"url": str(volume.url), "level": subvolume_idx, "shape": list(shape), "region": bounds})
+    path = get_metadata_cache().cache_dir / 'stats' / f"{hashlib.sha1(key.encode('utf-8')).hexdigest()}.json"
+    try:
+        with open(path, 'r') as file:
+            return VolumeStats.from_dict(json.load(file))
+    except (OSError, ValueError, KeyError):
+        pass
+
+    stats = compute_stats(volume, subvolume_idx, region)
+    try:
+        os.makedirs(path.parent, exist_ok=True)
+        atomic_write(str(path), json.dumps(stats.to_dict()))
+    except OSError as e:
+        print(f"Could not save statistics to {path}: {e}")
+    return stats
@@ -0,0 +1,342 @@
+import os
+import threading
+import itertools
+import numpy as np
+import zarr
+from numpy.typing import NDArray
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+from .sampling import block_mean
+
+
+class PredictionStore:
+    """
+    A writable OME-Zarr store for results (ink predictions, segmentation masks) aligned with the geometry of a volume.
+
+    Every level has the shape, chunk shape and coordinate transformations of the matching level of the source,
+    optionally preceded by channel axes. Writes are grouped by chunk: whole chunks are written by a background
+    thread pool right away, and partially written chunks are buffered until they are complete, so regions written
+    band by band never read back the chunks they touch. Lower resolution levels are computed from the finest
+    written level by block averaging when the store is closed.
+
+    Attributes
+    ----------
+    path : str
+        Path of the zarr group.
+    group : zarr.Group
+        The zarr group.
+    channels : Tuple[int, ...]
+        Shape of the channel axes preceding the spatial axes.
+    dtype : np.dtype
+        Data type of the arrays.
+    """
+    def __init__(self, path: Union[str, os.PathLike], mode: str = "r+", max_workers: int = 8, max_pending: int = 64) -> None:
+        """
+        Open an existing prediction store.
+
+        Parameters
+        ----------
+        path : Union[str, os.PathLike]
+            Path of the zarr group.
+        mode : str, default = "r+"
+            zarr access mode.
+        max_workers : int, default = 8
+            Number of threads writing chunks.
+        max_pending : int, default = 64
+            Maximum number of chunk writes queued before `write` blocks.
+        """
+        self.path = str(path)
+        self.group = zarr.open_group(self.path, mode=mode)
+        multiscales = self.group.attrs["multiscales"][0]
+        self._paths = [dataset["path"] for dataset in multiscales["datasets"]]
+        num_channels = sum(1 for axis in multiscales["axes"] if axis.get("type") == "channel")
+        self.channels = tuple(self.group[self._paths[0]].shape[:num_channels])
+        self.dtype = self.group[self._paths[0]].dtype
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._slots = threading.BoundedSemaphore(max(max_pending, 1))
+        self._lock = threading.Lock()
+        self._buffers: Dict[Tuple[int, Tuple[int, ...]], Tuple[NDArray, NDArray]] = {}
+        self._pending = 0
+        self._idle = threading.Condition(self._lock)
+        self._errors: List[BaseException] = []
+        # Last write queued for every chunk, so that the writes of a chunk run in order
+        self._last_writes: Dict[Tuple[int, Tuple[int, ...]], Future] = {}
+        self._written_level: Optional[int] = None
+
+    @classmethod
+    def create(cls, path: Union[str, os.PathLike], shapes: Sequence[Sequence[int]], chunks: Sequence[Sequence[int]], dtype: Any = np.float32, channels: Sequence[int] = (), transforms: Optional[Sequence[List[Dict[str, Any]]]] = None, axes: Sequence[str] = ("z", "y", "x"), overwrite: bool = False, **kwargs: Any) -> "PredictionStore":
+        """
+        Create a prediction store.
+
+        Parameters
+        ----------
+        path : Union[str, os.PathLike]
+            Path of the zarr group.
+        shapes : Sequence[Sequence[int]]
+            Spatial shape of every level.
+        chunks : Sequence[Sequence[int]]
+            Spatial chunk shape of every level.
+        dtype : Any, default = np.float32
+            Data type of the arrays.
+        channels : Sequence[int], default = ()
+            Shape of the channel axes preceding the spatial axes. Every channel is stored in its own chunks.
+        transforms : Optional[Sequence[List[Dict[str, Any]]]], default = None
+            OME coordinate transformations of the spatial axes of every level. If None, scales are derived from the shapes.
+        axes : Sequence[str], default = ("z", "y", "x")
+            Names of the spatial axes.
+        overwrite : bool, default = False
+            If True an existing store at `path` is replaced.
+        **kwargs : Any
+            Arguments of the PredictionStore constructor.
+
+        Returns
+        -------
+        PredictionStore
+            The store, open for writing.
+
+        Raises
+        ------
+        FileExistsError
+            If a store exists at `path` and `overwrite` is False.
+        """
+        channels = tuple(int(c) for c in channels)
+        if os.path.exists(path) and not overwrite:
+            raise FileExistsError(f"{path} already exists.")
+        group = zarr.open_group(str(path), mode="w")
+        datasets = []
+        for level, (shape, chunk) in enumerate(zip(shapes, chunks)):
+            group.create_dataset(str(level), shape=channels + tuple(shape), chunks=(1,) * len(channels) + tuple(chunk), dtype=dtype, fill_value=0, dimension_separator="/")
+            if transforms is not None:
+                spatial = transforms[level]
+            else:
+                spatial = [{"type": "scale", "scale": [s0 / s for s0, s in zip(shapes[0], shape)]}]
+            datasets.append({
+                "path": str(level),
+                "coordinateTransformations": [
+                    {**transform, transform["type"]: [1.0] * len(channels) + list(transform[transform["type"]])} for transform in spatial
+                ],
+            })
+        group.attrs["multiscales"] = [{
+            "version": "0.4",
+            "axes": [{"name": f"c{i}", "type": "channel"} for i in range(len(channels))] + [{"name": name, "type": "space"} for name in axes],
+            "datasets": datasets,
+        }]
+        return cls(path, **kwargs)
+
+    def __enter__(self) -> "PredictionStore":
+        return self
+
+    def __exit__(self, exc_type: Any, exc: Any, traceback: Any) -> None:
+        self.close(pyramid=exc_type is None)
+
+    def __len__(self) -> int:
+        return len(self._paths)
+
+    def level(self, level: int = 0) -> zarr.Array:
+        """
+        Get the zarr array of a level.
+        """
+        return self.group[self._paths[level]]
+
+    @property
+    def shape(self) -> Tuple[int, ...]:
+        """
+        Shape of the finest level, channel axes included.
+        """
+        return tuple(self.level(0).shape)
+
+    def _spatial(self, level: int) -> Tuple[Tuple[int, ...], Tuple[int, ...]]:
+        array = self.level(level)
+        return tuple(array.shape[len(self.channels):]), tuple(array.chunks[len(self.channels):])
+
+    def _submit(self, function: Any, *args: Any, key: Optional[Tuple[int, Tuple[int, ...]]] = None) -> None:
+        """
+        Run a write in the thread pool, blocking while `max_pending` writes are queued.
+
+        Writes of the same `key` (level, chunk index) run in the order they were submitted, so that a flushed
+        partial chunk is never merged with what the store held before an earlier write of the chunk.
+        """
+        self._slots.acquire()
+        with self._lock:
+            self._pending += 1
+            previous = self._last_writes.get(key) if key is not None else None
+            try:
+                future = self._executor.submit(self._run, function, previous, *args)
+            except BaseException:
+                self._pending -= 1
+                if self._pending == 0:
+                    self._idle.notify_all()
+                self._slots.release()
+                raise
+            if key is not None:
+                self._last_writes[key] = future
+        if key is not None:
+            future.add_done_callback(lambda future: self._forget(key, future))
+
+    def _forget(self, key: Tuple[int, Tuple[int, ...]], future: Future) -> None:
+        with self._lock:
+            if self._last_writes.get(key) is future:
+                del self._last_writes[key]
+
+    def _run(self, function: Any, previous: Optional[Future], *args: Any) -> None:
+        try:
+            if previous is not None:
+                # Submitted earlier to the same FIFO pool, so it is running or ahead in the queue
+                wait([previous])
+            function(*args)
+        except BaseException as e:
+            self._finish(e)
+        else:
+            self._finish(None)
+
+    def _finish(self, error: Optional[BaseException]) -> None:
+        with self._lock:
+            if error is not None:
+                self._errors.append(error)
+            self._pending -= 1
+            if self._pending == 0:
+                self._idle.notify_all()
+        self._slots.release()
+
+    def _write_chunk(self, level: int, region: Tuple[slice, ...], data: NDArray, mask: Optional[NDArray] = None) -> None:
+        array = self.level(level)
+        target = (slice(None),) * len(self.channels) + region
+        if mask is not None and not mask.all():
+            # Incomplete chunk: merge with what is already stored
+            existing = array[target]
+            np.copyto(existing, data, where=mask)
+            data = existing
+        array[target] = data
+
+    def write(self, roi: Tuple[slice, ...], array: NDArray, level: int = 0) -> None:
+        """
+        Write a region. Whole chunks are written in the background; partial chunks are buffered until complete or until `flush`.
+
+        Parameters
+        ----------
+        roi : Tuple[slice, ...]
+            Spatial slices, without step, of the region in the coordinates of the level.
+        array : NDArray
+            Data of shape (*channels, *region_shape).
+        level : int, default = 0
+            Level written. The pyramid is built from the finest written level.
+
+        Raises
+        ------
+        ValueError
+            If the region or the data shape is invalid.
+        """
+        shape, chunks = self._spatial(level)
+        roi = tuple(range(size)[axis] for size, axis in zip(shape, roi))
+        if len(roi) != len(shape) or any(axis.step != 1 for axis in roi):
+            raise ValueError(f"The region must be {len(shape)} slices without step.")
+        array = np.asarray(array)
+        if array.shape != self.channels + tuple(len(axis) for axis in roi):
+            raise ValueError(f"Expected data of shape {self.channels + tuple(len(axis) for axis in roi)}, got {array.shape}.")
+        if self._errors:
+            raise self._errors[0]
+        self._written_level = level if self._written_level is None else min(self._written_level, level)
+        channels = (slice(None),) * len(self.channels)
+
+        ranges = [range(axis.start // n, -(-axis.stop // n)) for axis, n in zip(roi, chunks)]
+        for chunk_idx in itertools.product(*ranges):
+            chunk_region = tuple(slice(c * n, min((c + 1) * n, s)) for c, n, s in zip(chunk_idx, chunks, shape))
+            overlap = tuple(slice(max(c.start, a.start), min(c.stop, a.stop)) for c, a in zip(chunk_region, roi))
+            source = array[channels + tuple(slice(o.start - a.start, o.stop - a.start) for o, a in zip(overlap, roi))]
+            if overlap == chunk_region:
+                self._submit(self._write_chunk, level, chunk_region, source.astype(self.dtype, copy=True), key=(level, chunk_idx))
+                continue
+            local = tuple(slice(o.start - c.start, o.stop - c.start) for o, c in zip(overlap, chunk_region))
+            with self._lock:
+                key = (level, chunk_idx)
+                if key not in self._buffers:
+                    extent = tuple(c.stop - c.start for c in chunk_region)
+                    self._buffers[key] = (np.zeros(self.channels + extent, dtype=self.dtype), np.zeros(extent, dtype=bool))
+                data, mask = self._buffers[key]
+                data[channels + local] = source
+                mask[local] = True
+                complete = mask.all()
+                if complete:
+                    del self._buffers[key]
+            if complete:
+                self._submit(self._write_chunk, level, chunk_region, data, key=key)
+
+    def __setitem__(self, roi: Tuple[slice, ...], array: NDArray) -> None:
+        """
+        Write a region of the finest level, indexed by its spatial slices only.
+        """
+        self.write(roi, array)
+
+    def __getitem__(self, idx: Any) -> NDArray:
+        """
+        Read from the finest level, after flushing the pending writes.
+        """
+        self.flush()
+        return self.level(0)[idx]
+
+    def flush(self) -> None:
+        """
+        Write the buffered partial chunks and wait for all the pending writes.
+
+        Raises
+        ------
+        Exception
+            The first error raised by a background write.
+        """
+        with self._lock:
+            buffers, self._buffers = self._buffers, {}
+        for (level, chunk_idx), (data, mask) in buffers.items():
+            shape, chunks = self._spatial(level)
+            chunk_region = tuple(slice(c * n, min((c + 1) * n, s)) for c, n, s in zip(chunk_idx, chunks, shape))
+            self._submit(self._write_chunk, level, chunk_region, data, mask, key=(level, chunk_idx))
+        with self._lock:
+            self._idle.wait_for(lambda: self._pending == 0)
+        if self._errors:
+            error, self._errors = self._errors[0], []
+            raise error
+
+    def build_pyramid(self, level: Optional[int] = None) -> None:
+        """
+        Compute the levels coarser than `level` by averaging blocks of the next finer level, one chunk at a time.
+
+        Parameters
+        ----------
+        level : Optional[int], default = None
+            Finest level of the pyramid. If None the finest written level is used.
+        """
+        self.flush()
+        level = (self._written_level or 0) if level is None else level
+        channels = (slice(None),) * len(self.channels)
+        for target in range(level + 1, len(self)):
+            source_shape, _ = self._spatial(target - 1)
+            shape, chunks = self._spatial(target)
+            factors = tuple(-(-s0 // s) for s0, s in zip(source_shape, shape))
+            source = self.level(target - 1)
+
+            def downsample(chunk_idx: Tuple[int, ...]) -> None:
+                region = tuple(slice(c * n, min((c + 1) * n, s)) for c, n, s in zip(chunk_idx, chunks, shape))
+                source_region = tuple(slice(r.start * f, min(r.stop * f, s0)) for r, f, s0 in zip(region, factors, source_shape))
+                data = block_mean(source[channels + source_region], factors)
+                self._write_chunk(target, region, data[channels + tuple(slice(0, r.stop - r.start) for r in region)])
+
+            for chunk_idx in itertools.product(*(range(-(-s // n)) for s, n in zip(shape, chunks))):
+                self._submit(downsample, chunk_idx)
+            # Every level is complete before the next one is computed from it
+            self.flush()
+
+    def close(self, pyramid: bool = True) -> None:
+        """
+        Flush the pending writes, build the pyramid and stop the writer threads.
+
+        Parameters
+        ----------
+        pyramid : bool, default = True
+            If True the coarser levels are computed from the finest written level.
+        """
+        try:
+            if pyramid and self._written_level is not None:
+                self.build_pyramid()
+            else:
+                self.flush()
+        finally:
+            self._executor.shutdown(wait=True)
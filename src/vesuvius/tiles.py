@@ -0,0 +1,286 @@
+import os
+import json
+import hashlib
+import requests
+import numpy as np
+from io import BytesIO
+from numpy.typing import NDArray
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+from .paths.atomic import atomic_write
+from .paths.metadata import get_metadata_cache
+
+
+def tile_fractions(mask: NDArray, scale: int, ys: NDArray, xs: NDArray, tile_size: int) -> NDArray:
+    """
+    Compute the fraction of True pixels of a downsampled 2D mask inside every tile of a regular grid.
+
+    Parameters
+    ----------
+    mask : NDArray
+        Boolean 2D mask, downsampled by `scale` with respect to the tile coordinates.
+    scale : int
+        Downsampling factor of the mask.
+    ys : NDArray
+        Y coordinates of the tile corners, in full-resolution pixels.
+    xs : NDArray
+        X coordinates of the tile corners, in full-resolution pixels.
+    tile_size : int
+        Size of the tiles, in full-resolution pixels.
+
+    Returns
+    -------
+    NDArray
+        Array of shape (len(ys), len(xs)) with the fraction of True pixels in every tile.
+    """
+    # Summed-area table, so every tile costs four lookups
+    integral = np.pad(mask.cumsum(0).cumsum(1), ((1, 0), (1, 0)))
+    y0 = np.minimum(ys // scale, mask.shape[0])[:, None]
+    x0 = np.minimum(xs // scale, mask.shape[1])[None, :]
+    y1 = np.minimum(-(-(ys + tile_size) // scale), mask.shape[0])[:, None]
+    x1 = np.minimum(-(-(xs + tile_size) // scale), mask.shape[1])[None, :]
+    count = integral[y1, x1] - integral[y0, x1] - integral[y1, x0] + integral[y0, x0]
+    area = np.maximum((y1 - y0) * (x1 - x0), 1)
+    return count / area
+
+
+class TileIndex:
+    """
+    A precomputed index of the tiles of a segment that contain papyrus and ink.
+
+    The index is built from a downsampled multiscale level of the surface volume and from the ink label,
+    without reading the full-resolution data, and can be persisted to disk so that it is built only once.
+
+    Attributes
+    ----------
+    tile_size : int
+        Size of the tiles along the Y and X dimensions.
+    stride : int
+        Stride between tiles along the Y and X dimensions.
+    ys : NDArray
+        Y coordinates of the tile corners.
+    xs : NDArray
+        X coordinates of the tile corners.
+    papyrus_fraction : NDArray
+        Array of shape (len(ys), len(xs)) with the fraction of papyrus pixels in every tile.
+    ink_fraction : Optional[NDArray]
+        Array of shape (len(ys), len(xs)) with the fraction of ink pixels in every tile, or None if the segment has no ink label.
+    """
+    def __init__(self, tile_size: int, stride: int, ys: NDArray, xs: NDArray, papyrus_fraction: NDArray, ink_fraction: Optional[NDArray] = None) -> None:
+        """
+        Initialize the TileIndex object.
+
+        Parameters
+        ----------
+        tile_size : int
+            Size of the tiles along the Y and X dimensions.
+        stride : int
+            Stride between tiles along the Y and X dimensions.
+        ys : NDArray
+            Y coordinates of the tile corners.
+        xs : NDArray
+            X coordinates of the tile corners.
+        papyrus_fraction : NDArray
+            Fraction of papyrus pixels in every tile.
+        ink_fraction : Optional[NDArray], default = None
+            Fraction of ink pixels in every tile.
+        """
+        self.tile_size = tile_size
+        self.stride = stride
+        self.ys = ys
+        self.xs = xs
+        self.papyrus_fraction = papyrus_fraction
+        self.ink_fraction = ink_fraction
+
+    @classmethod
+    def build(cls, volume: Any, tile_size: int, stride: Optional[int] = None, subvolume_idx: Optional[int] = None, threshold: float = 0, label_scale: int = 8) -> "TileIndex":
+        """
+        Build the tile index of a segment.
+
+        Parameters
+        ----------
+        volume : Volume
+            The segment volume, of shape (Z, Y, X).
+        tile_size : int
+            Size of the tiles along the Y and X dimensions.
+        stride : Optional[int], default = None
+            Stride between tiles. If None it equals `tile_size`.
+        subvolume_idx : Optional[int], default = None
+            Multiscale level used to detect papyrus. If None the coarsest level with at least 4x4 pixels per tile is used.
+        threshold : float, default = 0
+            A pixel is papyrus if any of its layers is above this raw intensity.
+        label_scale : int, default = 8
+            Downsampling factor applied to the ink label.
+
+        Returns
+        -------
+        TileIndex
+            The tile index.
+        """
+        stride = stride if stride is not None else tile_size
+        _, height, width = volume.shape(0)
+        ys = np.arange(0, height - tile_size + 1, stride)
+        xs = np.arange(0, width - tile_size + 1, stride)
+
+        factors = [cls._level_factor(volume, idx) for idx in range(len(volume.data))]
+        if subvolume_idx is None:
+            candidates = [idx for idx, factor in enumerate(factors) if factor <= max(tile_size // 4, 1)]
+            subvolume_idx = candidates[-1] if candidates else 0
+        factor = factors[subvolume_idx]
+
+        coarse = volume._read_region(subvolume_idx, (slice(None), slice(None), slice(None)))
+        papyrus = np.asarray(coarse).max(axis=0) > threshold
+        papyrus_fraction = tile_fractions(papyrus, factor, ys, xs, tile_size)
+
+        ink = cls._label_mask(volume, label_scale)
+        ink_fraction = tile_fractions(ink, label_scale, ys, xs, tile_size) if ink is not None else None
+
+        return cls(tile_size, stride, ys, xs, papyrus_fraction, ink_fraction)
+
+    @staticmethod
+    def _label_mask(volume: Any, label_scale: int) -> Optional[NDArray]:
+        if getattr(volume, 'type', None) == "segment" and getattr(volume, '_inklabel', None) is None and hasattr(volume, '_fetch_inklabel'):
+            # Decode a label that is not loaded for the index only, without keeping the full-resolution image on the volume
+            inklabel = volume._fetch_inklabel()
+        else:
+            inklabel = getattr(volume, 'inklabel', None)
+        if inklabel is None or inklabel.ndim not in (2, 3) or tuple(inklabel.shape[:2]) != tuple(volume.shape(0)[1:]):
+            return None
+        ink = np.asarray(inklabel[::label_scale, ::label_scale])
+        if ink.ndim == 3:
+            ink = ink[..., 0]
+        return ink > 0
+
+    @classmethod
+    def _label_key(cls, volume: Any, label_scale: int) -> Any:
+        # Identify the ink label by its metadata, so that a cached index is found without downloading the label
+        if getattr(volume, 'type', None) == "segment" and hasattr(volume, '_inklabel_url'):
+            url = volume._inklabel_url()
+            if volume.domain == "local":
+                try:
+                    stat = os.stat(url)
+                except OSError:
+                    return None
+                return {"url": url, "mtime_ns": stat.st_mtime_ns, "size": stat.st_size}
+            try:
+                validator = get_metadata_cache().get_validator(url)
+            except requests.RequestException as e:
+                print(f"Could not validate the ink label {url}: {e}")
+            else:
+                return {"url": url, **validator} if validator is not None else None
+        ink = cls._label_mask(volume, label_scale)
+        if ink is None:
+            return None
+        return {"shape": list(ink.shape), "sha1": hashlib.sha1(np.packbits(ink).tobytes()).hexdigest()}
+
+    @staticmethod
+    def _level_factor(volume: Any, subvolume_idx: int) -> int:
+        scale_0, _ = volume._level_transform(0)
+        scale, _ = volume._level_transform(subvolume_idx)
+        return max(int(round(scale[-1] / scale_0[-1])), 1)
+
+    @classmethod
+    def for_volume(cls, volume: Any, tile_size: int, stride: Optional[int] = None, cache_dir: Optional[os.PathLike] = None, **kwargs: Any) -> "TileIndex":
+        """
+        Load the tile index of a segment from disk, building and saving it on the first use.
+
+        The index is keyed by the ink label metadata (`ETag`, size), so the label is only downloaded to build a missing index.
+
+        Parameters
+        ----------
+        volume : Volume
+            The segment volume.
+        tile_size : int
+            Size of the tiles along the Y and X dimensions.
+        stride : Optional[int], default = None
+            Stride between tiles. If None it equals `tile_size`.
+        cache_dir : Optional[os.PathLike], default = None
+            Directory where the indices are stored. If None they will be saved in $HOME / vesuvius / tile-index
+        **kwargs : Any
+            Additional keyword arguments passed to `build`.
+
+        Returns
+        -------
+        TileIndex
+            The tile index.
+        """
+        cache_dir = Path(cache_dir) if cache_dir is not None else Path.home() / 'vesuvius' / 'tile-index'
+        label = cls._label_key(volume, kwargs.get("label_scale", 8))
+        key: Dict[str, Any] = {"url": str(volume.url), "tile_size": tile_size, "stride": stride, "label": label, **kwargs}
+        digest = hashlib.sha1(json.dumps(key, sort_keys=True).encode('utf-8')).hexdigest()
+        path = cache_dir / f"{digest}.npz"
+        if path.exists():
+            try:
+                return cls.load(path)
+            except (OSError, ValueError, KeyError) as e:
+                print(f"Rebuilding corrupted tile index {path}: {e}")
+        index = cls.build(volume, tile_size, stride, **kwargs)
+        if label is not None and index.ink_fraction is None:
+            # The label exists but could not be read: do not cache an index without ink
+            return index
+        try:
+            index.save(path)
+        except OSError as e:
+            print(f"Could not save tile index to {path}: {e}")
+        return index
+
+    def save(self, path: os.PathLike) -> None:
+        """
+        Save the tile index to a `.npz` file.
+
+        Parameters
+        ----------
+        path : os.PathLike
+            Destination file.
+        """
+        path = Path(path)
+        os.makedirs(path.parent, exist_ok=True)
+        arrays = {"ys": self.ys, "xs": self.xs, "papyrus_fraction": self.papyrus_fraction, "tile": np.array([self.tile_size, self.stride])}
+        if self.ink_fraction is not None:
+            arrays["ink_fraction"] = self.ink_fraction
+        buffer = BytesIO()
+        np.savez_compressed(buffer, **arrays)
+        atomic_write(str(path), buffer.getvalue())
+
+    @classmethod
+    def load(cls, path: os.PathLike) -> "TileIndex":
+        """
+        Load a tile index saved with `save`.
+
+        Parameters
+        ----------
+        path : os.PathLike
+            The `.npz` file.
+
+        Returns
+        -------
+        TileIndex
+            The tile index.
+        """
+        with np.load(path) as data:
+            tile_size, stride = (int(v) for v in data["tile"])
+            ink_fraction = data["ink_fraction"] if "ink_fraction" in data else None
+            return cls(tile_size, stride, data["ys"], data["xs"], data["papyrus_fraction"], ink_fraction)
+
+    def positions(self, min_papyrus: float = 0, min_ink: Optional[float] = None) -> Tuple[NDArray, NDArray]:
+        """
+        Get the corners of the non-empty tiles.
+
+        Parameters
+        ----------
+        min_papyrus : float, default = 0
+            Tiles must have more than this fraction of papyrus pixels.
+        min_ink : Optional[float], default = None
+            If given, tiles must also have at least this fraction of ink pixels.
+
+        Returns
+        -------
+        Tuple[NDArray, NDArray]
+            Array of shape (N, 2) with the (y, x) corners of the selected tiles and array of shape (N,) with their ink fraction (zeros if the segment has no ink label).
+        """
+        keep = self.papyrus_fraction > min_papyrus
+        ink = self.ink_fraction if self.ink_fraction is not None else np.zeros_like(self.papyrus_fraction)
+        if min_ink is not None:
+            keep &= ink >= min_ink
+        iy, ix = np.nonzero(keep)
+        return np.stack([self.ys[iy], self.xs[ix]], axis=1), ink[iy, ix]
@@ -0,0 +1,214 @@
+import os
+import json
+import time
+import atexit
+import functools
+import threading
+import contextlib
+from collections import deque
+from typing import Any, Callable, Dict, Iterator, List, Optional, Union
+
+# Maximum number of finished spans kept in memory, the oldest are dropped first
+MAX_SPANS = int(os.environ.get("VESUVIUS_TRACE_MAX_SPANS", 100000))
+
+_enabled = False
+_spans: "deque[Dict[str, Any]]" = deque(maxlen=MAX_SPANS)
+_callbacks: List[Callable[[Dict[str, Any]], None]] = []
+_lock = threading.Lock()
+# Stack of the spans open in every thread, to record their parent
+_local = threading.local()
+
+
+def enable_tracing(callback: Optional[Callable[[Dict[str, Any]], None]] = None) -> None:
+    """
+    Start recording timed spans around the phases of volume and cube construction, catalog access and reads.
+
+    Parameters
+    ----------
+    callback : Optional[Callable[[Dict[str, Any]], None]], default = None
+        Function called with every finished span: a dictionary with its "name", "start" (Unix time in
+        microseconds), "duration" (microseconds), "pid", "tid", "parent" (name of the enclosing span of the same
+        thread, or None) and "args".
+    """
+    global _enabled
+    with _lock:
+        if callback is not None and callback not in _callbacks:
+            _callbacks.append(callback)
+        _enabled = True
+
+
+def disable_tracing() -> None:
+    """
+    Stop recording spans and unregister the callbacks. The recorded spans are kept until `clear_spans`.
+    """
+    global _enabled
+    with _lock:
+        _enabled = False
+        _callbacks.clear()
+
+
+def tracing_enabled() -> bool:
+    """
+    Check if spans are being recorded.
+    """
+    return _enabled
+
+
+@contextlib.contextmanager
+def span(name: str, /, **args: Any) -> Iterator[Optional[Dict[str, Any]]]:
+    """
+    Time the enclosed block as a span, if tracing is enabled.
+
+    Parameters
+    ----------
+    name : str
+        Name of the span, e.g. "Volume.load_data".
+    **args : Any
+        Values attached to the span. More can be added to the "args" of the yielded span inside the block.
+
+    Yields
+    ------
+    Optional[Dict[str, Any]]
+        The span being recorded, or None if tracing is disabled.
+    """
+    if not _enabled:
+        yield None
+        return
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    record = {
+        "name": name,
+        "start": time.time_ns() // 1000,
+        "duration": 0,
+        "pid": os.getpid(),
+        "tid": threading.get_ident(),
+        "parent": stack[-1]["name"] if stack else None,
+        "args": args,
+    }
+    stack.append(record)
+    begin = time.perf_counter_ns()
+    try:
+        yield record
+    except BaseException as e:
+        record["args"]["error"] = repr(e)
+        raise
+    finally:
+        record["duration"] = (time.perf_counter_ns() - begin) // 1000
+        stack.pop()
+        _finish(record)
+
+
+def _finish(record: Dict[str, Any]) -> None:
+    with _lock:
+        _spans.append(record)
+        callbacks = list(_callbacks)
+    for callback in callbacks:
+        try:
+            callback(record)
+        except Exception as e:
+            print(f"Error in tracing callback: {e}")
+
+
+def traced(name: str) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+    """
+    Decorate a function so that every call is recorded as a span of the given name when tracing is enabled.
+    """
+    def decorator(function: Callable[..., Any]) -> Callable[..., Any]:
+        @functools.wraps(function)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            if not _enabled:
+                return function(*args, **kwargs)
+            with span(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def get_spans() -> List[Dict[str, Any]]:
+    """
+    Get the finished spans recorded in this process, in the order they finished.
+    """
+    with _lock:
+        return list(_spans)
+
+
+def clear_spans() -> None:
+    """
+    Drop the recorded spans.
+    """
+    with _lock:
+        _spans.clear()
+
+
+def chrome_trace(spans: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+    """
+    Convert spans to the Chrome trace event format, readable by chrome://tracing and Perfetto.
+
+    Parameters
+    ----------
+    spans : Optional[List[Dict[str, Any]]], default = None
+        The spans to convert. If None the spans recorded in this process are used.
+
+    Returns
+    -------
+    Dict[str, Any]
+        The trace, with one complete ("X") event per span.
+    """
+    spans = get_spans() if spans is None else spans
+    events = [{
+        "name": record["name"],
+        "cat": "vesuvius",
+        "ph": "X",
+        "ts": record["start"],
+        "dur": record["duration"],
+        "pid": record["pid"],
+        "tid": record["tid"],
+        "args": record["args"],
+    } for record in spans]
+    return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+
+def export_trace(path: Union[str, os.PathLike], format: str = "chrome") -> None:
+    """
+    Write the spans recorded in this process to a JSON file.
+
+    Parameters
+    ----------
+    path : Union[str, os.PathLike]
+        Destination file.
+    format : str, default = "chrome"
+        "chrome" for the Chrome trace event format, "json" for the list of spans (see `enable_tracing`).
+
+    Raises
+    ------
+    ValueError
+        If the format is not "chrome" or "json".
+    """
+    if format == "chrome":
+        document: Any = chrome_trace()
+    elif format == "json":
+        document = get_spans()
+    else:
+        raise ValueError("format should be 'chrome' or 'json'.")
+    with open(path, "w") as file:
+        json.dump(document, file, default=str)
+
+
+def _export_at_exit(path: str) -> None:
+    # Every process of a multiprocessing job writes its own file
+    if os.getpid() != int(os.environ["VESUVIUS_TRACE_PID"]):
+        root, ext = os.path.splitext(path)
+        path = f"{root}.{os.getpid()}{ext}"
+    try:
+        export_trace(path)
+    except OSError as e:
+        print(f"Could not write the trace to {path}: {e}")
+
+
+# VESUVIUS_TRACE=<path> traces a whole run without changing its code, and writes a Chrome trace at exit
+if os.environ.get("VESUVIUS_TRACE"):
+    # Spawned workers inherit the pid of the process that started the run
+    os.environ.setdefault("VESUVIUS_TRACE_PID", str(os.getpid()))
+    enable_tracing()
+    atexit.register(_export_at_exit, os.environ["VESUVIUS_TRACE"])
@@ -0,0 +1,266 @@
+import math
+import numpy as np
+from numpy.typing import NDArray
+from typing import Any, List, Optional, Sequence, Tuple, Union
+
+# Selection of one axis of a level: the indices kept, or a single index for an axis dropped by integer indexing
+Selection = Union[range, int]
+
+
+class VolumeView:
+    """
+    A lazy region of a volume.
+
+    Slicing, transposing and changing the level of a view return new views without reading anything: the
+    selections are composed as index ranges over the axes of the level. Data are read only by `read` (or
+    `np.asarray`), and only the final region is fetched, with one read.
+
+    Attributes
+    ----------
+    volume : Volume
+        The volume the view reads from.
+    subvolume_idx : int
+        Index of the level (sub-volume) the selections refer to.
+    """
+    def __init__(self, volume: Any, subvolume_idx: int = 0, selections: Optional[Sequence[Selection]] = None, order: Optional[Sequence[int]] = None) -> None:
+        """
+        Create a view of a level of a volume.
+
+        Parameters
+        ----------
+        volume : Volume
+            The volume.
+        subvolume_idx : int, default = 0
+            Index of the level.
+        selections : Optional[Sequence[Union[range, int]]], default = None
+            Selection of every axis of the level. If None the whole level is selected.
+        order : Optional[Sequence[int]], default = None
+            Axes of the level, among those selected by a range, in the order of the view axes. If None they keep the order of the level.
+        """
+        self.volume = volume
+        self.subvolume_idx = subvolume_idx
+        level_shape = tuple(volume.shape(subvolume_idx))
+        self._selections: Tuple[Selection, ...] = tuple(range(size) for size in level_shape) if selections is None else tuple(selections)
+        kept = [axis for axis, selection in enumerate(self._selections) if isinstance(selection, range)]
+        self._order: Tuple[int, ...] = tuple(kept) if order is None else tuple(order)
+        if sorted(self._order) != kept:
+            raise ValueError(f"order must be a permutation of the axes {kept}.")
+
+    @property
+    def shape(self) -> Tuple[int, ...]:
+        """
+        Shape of the data the view reads.
+        """
+        return tuple(len(self._selections[axis]) for axis in self._order)
+
+    @property
+    def ndim(self) -> int:
+        return len(self._order)
+
+    @property
+    def dtype(self) -> np.dtype:
+        """
+        Data type of the data the view reads, after normalization.
+        """
+        dtype = np.dtype(self.volume.dtype)
+        # Normalization divides by a Python float
+        return (np.zeros(0, dtype=dtype) / 1.0).dtype if self.volume.normalize else dtype
+
+    @property
+    def size(self) -> int:
+        return math.prod(self.shape)
+
+    @property
+    def region(self) -> Tuple[Union[slice, int], ...]:
+        """
+        The selections as an index of the level, in the axis order of the level.
+        """
+        return tuple(_to_index(selection) for selection in self._selections)
+
+    def __len__(self) -> int:
+        if not self._order:
+            raise TypeError("len() of a 0-d view")
+        return self.shape[0]
+
+    def __repr__(self) -> str:
+        return f"VolumeView(url={getattr(self.volume, 'url', None)!r}, level={self.subvolume_idx}, region={self.region}, shape={self.shape}, order={self._order})"
+
+    def __getitem__(self, idx: Any) -> "VolumeView":
+        """
+        Select a region of the view, as a new view.
+
+        Parameters
+        ----------
+        idx : Any
+            Integers, slices (with any step) and at most one Ellipsis, over the axes of the view.
+
+        Returns
+        -------
+        VolumeView
+            The composed view. No data is read.
+
+        Raises
+        ------
+        IndexError
+            If the index has too many items, an unsupported item, or an integer out of bounds.
+        """
+        idx = idx if isinstance(idx, tuple) else (idx,)
+        if sum(item is Ellipsis for item in idx) > 1:
+            raise IndexError("An index can only have a single Ellipsis.")
+        if Ellipsis in idx:
+            position = idx.index(Ellipsis)
+            idx = idx[:position] + (slice(None),) * (self.ndim - len(idx) + 1) + idx[position + 1:]
+        if len(idx) > self.ndim:
+            raise IndexError(f"Too many indices for a view with {self.ndim} dimensions.")
+        idx = idx + (slice(None),) * (self.ndim - len(idx))
+
+        selections = list(self._selections)
+        order = []
+        for axis, item in zip(self._order, idx):
+            if isinstance(item, (int, np.integer)):
+                # Raises IndexError when out of bounds
+                selections[axis] = self._selections[axis][int(item)]
+            elif isinstance(item, slice):
+                selections[axis] = self._selections[axis][item]
+                order.append(axis)
+            else:
+                raise IndexError("Views can only be indexed with integers, slices and Ellipsis.")
+        return VolumeView(self.volume, self.subvolume_idx, selections, order)
+
+    def transpose(self, *axes: int) -> "VolumeView":
+        """
+        Permute the axes of the view, as `numpy.transpose`. No data is read.
+
+        Parameters
+        ----------
+        *axes : int
+            The new order of the view axes. If none are given the order is reversed.
+
+        Returns
+        -------
+        VolumeView
+            The transposed view.
+        """
+        if len(axes) == 1 and isinstance(axes[0], (tuple, list)):
+            axes = tuple(axes[0])
+        if not axes:
+            axes = tuple(reversed(range(self.ndim)))
+        if sorted(axes) != list(range(self.ndim)):
+            raise ValueError(f"axes must be a permutation of {tuple(range(self.ndim))}.")
+        return VolumeView(self.volume, self.subvolume_idx, self._selections, [self._order[axis] for axis in axes])
+
+    @property
+    def T(self) -> "VolumeView":
+        return self.transpose()
+
+    def level(self, subvolume_idx: int) -> "VolumeView":
+        """
+        Get the same region in another level, as a new view. No data is read.
+
+        Coordinates are mapped through the OME scale and translation of the two levels: the new view selects the
+        voxels of the level whose centers lie in the physical extent of the region (at least the nearest one).
+        Ranges keep their direction; contiguous ranges stay contiguous (at the resolution of the new level) and
+        larger steps are scaled and rounded.
+
+        Parameters
+        ----------
+        subvolume_idx : int
+            Index of the level.
+
+        Returns
+        -------
+        VolumeView
+            The view of the region in the level.
+        """
+        source_scale, source_translation = self.volume._level_transform(self.subvolume_idx)
+        target_scale, target_translation = self.volume._level_transform(subvolume_idx)
+        # Index i of the current level lies at index i * factor + offset of the new level
+        factors = source_scale / target_scale
+        offsets = (source_translation - target_translation) / target_scale
+        target_shape = tuple(self.volume.shape(subvolume_idx))
+        selections = [
+            _scale(selection, float(factor), float(offset), target)
+            for selection, factor, offset, target in zip(self._selections, factors, offsets, target_shape)
+        ]
+        return VolumeView(self.volume, subvolume_idx, selections, self._order)
+
+    def read(self) -> NDArray:
+        """
+        Read the data of the view, normalized as the volume.
+
+        The region is read once, by its strided bounding box in the level (through the chunk cache of the
+        volume when it has one), then flipped and transposed in memory.
+
+        Returns
+        -------
+        NDArray
+            The data, of shape `shape`.
+        """
+        if self.size == 0:
+            return np.zeros(self.shape, dtype=self.dtype)
+        region = []
+        flips = []
+        for axis, selection in enumerate(self._selections):
+            if isinstance(selection, int):
+                region.append(selection)
+                continue
+            if selection.step < 0:
+                # Read the same indices in increasing order, and flip them in memory
+                selection = selection[::-1]
+                flips.append(axis)
+            region.append(slice(selection.start, selection.stop, selection.step))
+        data = np.asarray(self.volume._read_region(self.subvolume_idx, tuple(region)))
+
+        # Axes of the array read, in the order of the level
+        kept = [axis for axis, selection in enumerate(self._selections) if isinstance(selection, range)]
+        if flips:
+            data = np.flip(data, axis=tuple(kept.index(axis) for axis in flips))
+        data = np.transpose(data, [kept.index(axis) for axis in self._order])
+        if self.volume.normalize:
+            # Arithmetic on 0-d arrays returns scalars
+            return np.asarray(self.volume._normalize(data))
+        return data if data.flags.c_contiguous else data.copy()
+
+    def __array__(self, dtype: Any = None, copy: Optional[bool] = None) -> NDArray:
+        data = self.read()
+        return data if dtype is None else data.astype(dtype, copy=False)
+
+
+def _to_index(selection: Selection) -> Union[slice, int]:
+    """
+    Convert a selection to an index of the level.
+    """
+    if isinstance(selection, int):
+        return selection
+    # A negative stop of a range is a position, not an offset from the end
+    return slice(selection.start, selection.stop if selection.stop >= 0 else None, selection.step)
+
+
+def _scale(selection: Selection, factor: float, offset: float, size: int) -> Selection:
+    """
+    Map a selection to a level where index i lies at index i * factor + offset, clipped to `size`.
+    """
+    def nearest(index: float) -> int:
+        return min(max(int(math.floor(round(index * factor + offset + 0.5, 9))), 0), size - 1)
+
+    if isinstance(selection, int):
+        return nearest(selection)
+    if len(selection) == 0:
+        return range(0)
+    low, high = min(selection[0], selection[-1]), max(selection[0], selection[-1])
+    if abs(selection.step) == 1:
+        # Contiguous ranges stay contiguous, at the resolution of the new level: voxels whose centers lie in
+        # [low - 0.5, high + 0.5) of the current level
+        step = 1
+        first = max(int(math.ceil(round((low - 0.5) * factor + offset, 9))), 0)
+        stop = min(int(math.ceil(round((high + 0.5) * factor + offset, 9))), size)
+        if first >= stop:
+            first = nearest((low + high) / 2)
+            stop = first + 1
+    else:
+        # Strides are scaled, from the voxel nearest to the first sample
+        step = max(int(round(abs(selection.step) * factor)), 1)
+        first, stop = nearest(low), nearest(high) + 1
+    if selection.step > 0:
+        return range(first, stop, step)
+    return range(stop - 1, first - 1, -step)
@@ -1,21 +1,171 @@
 import os
-import yaml
+import json
+import asyncio
+import hashlib
+import functools
+import threading
+import weakref
+import time
 import tensorstore as ts
 from numpy.typing import NDArray
-from typing import Any, Dict, Optional, Tuple, Union, List
+from typing import Any, Awaitable, Callable, ContextManager, Dict, Hashable, Iterable, Iterator, Optional, Tuple, Union, List
 import numpy as np
 import requests
 import zarr
-import nrrd
 import tempfile
-from PIL import Image
 from io import BytesIO
 from pathlib import Path
+from concurrent.futures import Future
 from .setup.accept_terms import get_installation_path
-from .paths.utils import list_files, is_aws_ec2_instance
+from .paths.utils import list_files, list_cubes, is_aws_ec2_instance
+from .paths.metadata import get_metadata_cache, read_multiscales, read_array_metadata
+from .paths.atomic import atomic_write
+from .sampling import sample_volume, block_mean
+from .stats import VolumeStats, cached_stats
+from .inference import sliding_window_inference
+from .store import PredictionStore
+from .views import VolumeView
+from .cache import LRUCache
+from .chunks import ChunkReader, get_chunk_cache, chunk_cache_stats
+from .memory import memory_info, get_cache_budget, on_cache_budget_change
+from .tracing import span, traced
+from .scheduler import get_read_scheduler, read_priority
+
+def _pil_image() -> Any:
+    """
+    Import PIL on first use (ink labels, previews), without its image size limit.
+    """
+    from PIL import Image
+    # Remove the PIL image size limit
+    Image.MAX_IMAGE_PIXELS = None
+    return Image
+
+# Percentiles mapped to 0 and 1 by normalize="percentile"
+DEFAULT_PERCENTILES = (0.5, 99.5)
+
+# TensorStore contexts shared by all the volumes of this process, keyed by their spec
+_contexts: Dict[str, ts.Context] = {}
+_contexts_lock = threading.Lock()
+# Keys of the contexts sized by the process-wide cache budget, dropped when the budget changes
+_auto_contexts: set = set()
+
+# Volumes and cubes alive in this process, whose handles must be dropped after a fork
+_open_objects: "weakref.WeakSet[Any]" = weakref.WeakSet()
+
+# Decoded arrays of the cubes of this process, bounded by a byte budget
+CUBE_CACHE_BYTES = int(float(os.environ.get("VESUVIUS_CUBE_CACHE_BYTES", 2 * 1024 ** 3)))
+_cube_cache = LRUCache(CUBE_CACHE_BYTES)
+# NRRD headers of the cube files read by this process, keyed by URL, to write cached arrays back unchanged
+_cube_headers = LRUCache(4096, sizeof=lambda header: 1)
+
+# True in a process forked after TensorStore started its threads, where TensorStore cannot be used anymore
+_tensorstore_forked = False
 
-# Remove the PIL image size limit
-Image.MAX_IMAGE_PIXELS = None
+def _shared_context(context_spec: Dict[str, Any], auto: bool = False) -> ts.Context:
+    """
+    Get the TensorStore context of this process for a context spec, so volumes share one cache pool.
+    """
+    key = json.dumps(context_spec, sort_keys=True)
+    with _contexts_lock:
+        if key not in _contexts:
+            _contexts[key] = ts.Context(context_spec)
+        if auto:
+            _auto_contexts.add(key)
+        return _contexts[key]
+
+def _apply_cache_budget(budget: int) -> None:
+    """
+    Move the volumes opened with cache_pool=None to a cache pool of the new budget.
+
+    TensorStore cache pools cannot be resized, so the contexts of the old budget are dropped and the handles of
+    these volumes are reopened lazily in a context of the new size. Their cached chunks are released once the
+    reads in progress finish.
+    """
+    with _contexts_lock:
+        for key in list(_auto_contexts):
+            _contexts.pop(key, None)
+        _auto_contexts.clear()
+    for obj in list(_open_objects):
+        if isinstance(obj, Volume) and obj.cache and obj.cache_pool is None and obj.chunk_cache is None and obj._data is not None:
+            with obj._lock:
+                obj._data = None
+                obj._chunk_readers = {}
+
+on_cache_budget_change(_apply_cache_budget)
+
+def _reset_after_fork() -> None:
+    """
+    Drop the handles inherited from the parent process. They are reopened lazily on first use.
+    """
+    global _contexts_lock, _tensorstore_forked
+    _tensorstore_forked = _tensorstore_forked or bool(_contexts)
+    _contexts.clear()
+    _auto_contexts.clear()
+    _contexts_lock = threading.Lock()
+    _cube_cache._reset_after_fork()
+    _cube_headers._reset_after_fork()
+    for obj in list(_open_objects):
+        obj._reset_handles()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+async def _gather_limited(factories: List[Callable[[], Awaitable[Any]]], max_concurrency: int, return_exceptions: bool) -> List[Any]:
+    """
+    Await the coroutines created by `factories`, with at most `max_concurrency` of them running at once.
+    """
+    semaphore = asyncio.Semaphore(max(max_concurrency, 1))
+
+    async def run(factory: Callable[[], Awaitable[Any]]) -> Any:
+        async with semaphore:
+            return await factory()
+
+    return list(await asyncio.gather(*(run(factory) for factory in factories), return_exceptions=return_exceptions))
+
+def set_cube_cache_size(max_bytes: int) -> None:
+    """
+    Set the byte budget of the process-wide cache of decoded cube arrays, evicting arrays beyond it.
+
+    Parameters
+    ----------
+    max_bytes : int
+        Maximum total size of the cached cube arrays in bytes.
+    """
+    _cube_cache.max_bytes = max_bytes
+
+def cache_stats() -> Dict[str, Any]:
+    """
+    Get the budgets, usage and memory pressure of the caches of this process.
+
+    Returns
+    -------
+    Dict[str, Any]
+        - "budget": the byte budget of the volumes opened with cache_pool=None (see `vesuvius.memory.get_cache_budget`);
+        - "memory": the physical memory, cgroup limit and usage, effective limit and available memory (see `vesuvius.memory.memory_info`);
+        - "pressure": the fraction of the memory limit in use, from 0 to 1, or None if unknown;
+        - "tensorstore": the hit and miss counts of the TensorStore caches and the byte limits of the shared cache pools;
+        - "chunks": the counters of the chunk caches, keyed by their [decoded, compressed] budgets;
+        - "cubes": the counters of the cube array cache.
+    """
+    info = memory_info()
+    pressure = None
+    if info["limit"] and info["available"] is not None:
+        pressure = min(max(1 - info["available"] / info["limit"], 0.0), 1.0)
+    counts = {"hit_count": 0, "miss_count": 0}
+    for metric in ts.experimental_collect_matching_metrics('/tensorstore/cache/'):
+        name = metric["name"].rsplit("/", 1)[-1]
+        if name in counts:
+            counts[name] += sum(value.get("value", 0) for value in metric.get("values", []))
+    with _contexts_lock:
+        pools = [json.loads(key).get("cache_pool", {}).get("total_bytes_limit", 0) for key in _contexts]
+    return {
+        "budget": get_cache_budget(),
+        "memory": info,
+        "pressure": pressure,
+        "tensorstore": {**counts, "pools": pools},
+        "chunks": chunk_cache_stats(),
+        "cubes": _cube_cache.stats(),
+    }
 
 # Function to get the maximum value of a dtype
 def get_max_value(dtype: np.dtype) -> Union[float, int]:
@@ -64,16 +214,18 @@ class Volume:
         ID of the segment.
     cache : bool
         Indicates if caching is enabled.
-    cache_pool : int
-        Size of the cache pool.
-    normalize : bool
-        Indicates if the data should be normalized.
+    cache_pool : Optional[int]
+        Size of the cache pool, or None if it follows the process-wide cache budget.
+    normalize : Union[bool, Tuple[float, float]]
+        Indicates if the data should be normalized, by the dtype maximum (True) or between two percentiles of the intensities.
     verbose : bool
         If True, prints additional information during initialization.
     domain : str
         The domain from where data is fetched: 'dl.ash2txt' or 'local'.
     path : Optional[str]
         Path to the local data if domain is 'local'.
+    chunk_cache : Optional[int]
+        Size of the compressed chunk cache in bytes, or None to let TensorStore cache the decoded chunks.
     configs : str
         Path to the configuration file.
     url : str
@@ -83,12 +235,18 @@ class Volume:
     data : List[ts.TensorStore]
         Loaded volume data.
     inklabel : np.ndarray
-        Ink label data (only for segments).
+        Ink label data (only for segments), downloaded on first access.
     dtype : np.dtype
         Data type of the volume.
+
+    Notes
+    -----
+    Volumes pickle by spec: the data handles and the ink label are not serialized, but reopened lazily
+    on first use, reusing the already resolved URL and metadata. Handles are also dropped in the child of
+    a fork, so volumes can be shared with multiprocessing and DataLoader workers.
     """
         
-    def __init__(self, type: Union[str,int], scroll_id: Optional[Union[int, str]] = None, energy: Optional[int] = None, resolution: Optional[float] = None, segment_id: Optional[int] = None, cache: bool = True, cache_pool: int = 1e10, normalize: bool = False, verbose : bool = False, domain: Optional[str] = None, path: Optional[str] = None) -> None:
+    def __init__(self, type: Union[str,int], scroll_id: Optional[Union[int, str]] = None, energy: Optional[int] = None, resolution: Optional[float] = None, segment_id: Optional[int] = None, cache: bool = True, cache_pool: Optional[int] = None, normalize: Union[bool, str, Tuple[float, float]] = False, verbose : bool = False, domain: Optional[str] = None, path: Optional[str] = None, chunk_cache: Optional[int] = None) -> None:
         """
         Initialize the Volume object.
 
@@ -106,16 +264,24 @@ class Volume:
             ID of the segment.
         cache : bool, default = True
             Indicates if caching is enabled.
-        cache_pool : int, default = 1e10
-            Size of the cache pool in bytes.
-        normalize : bool, default = False
-            Indicates if the data should be normalized.
+        cache_pool : Optional[int], default = None
+            Size of the cache pool in bytes. If None the volume uses the process-wide cache budget, a fraction of the
+            physical memory or of the cgroup (container) memory limit, shared with the other volumes opened with None
+            and adjustable at runtime with `vesuvius.memory.set_cache_budget` (see `cache_stats`).
+        normalize : Union[bool, str, Tuple[float, float]], default = False
+            Indicates if the data should be normalized. True divides by the dtype maximum. "percentile" or a
+            (low, high) pair of percentiles maps these percentiles of the intensities to 0 and 1, clipping
+            the values outside. The percentiles come from the cached statistics of the coarsest level (see `stats`).
         verbose : bool, default = False
             If True, prints additional information during initialization.
         domain : str, default = "dl.ash2txt"
             The domain from where data is fetched: 'dl.ash2txt' or 'local'.
         path : Optional[str], default = None
             Path to the local data if domain is 'local'.
+        chunk_cache : Optional[int], default = None
+            Size in bytes of a compressed in-memory chunk cache. If set, whole chunks are cached by vesuvius instead of
+            TensorStore: decoded in a pool of `cache_pool` bytes (if `cache` is True), and the chunks evicted from it
+            kept LZ4-compressed in a pool of `chunk_cache` bytes. Local zarr volumes are cached the same way.
 
         Raises
         ------
@@ -123,96 +289,259 @@ class Volume:
             If the provided `type` or `domain` is invalid.
         """
 
+        self._reset_handles()
+        _open_objects.add(self)
+
         try:
-            type = str(type).lower()
-            if type[0].isdigit():
-                scroll_id, energy, resolution, _ = self.find_segment_details(str(type))
-                segment_id = int(type)
-                type = "segment"
-                
-            if type.startswith("scroll") and (len(type) > 6):
-                self.type = "scroll"
-                if (type[6:].isdigit()):
-                    self.scroll_id = int(type[6:])
-                else:
-                    self.scroll_id = str(type[6:])
-            
-            else:
-                assert type in ["scroll", "segment"], "type should be either 'scroll', 'scroll#' or 'segment'"
-                self.type = type
+            with span("Volume.__init__", type=str(type)):
+                with span("Volume.configure"):
+                    self._configure(type, scroll_id, energy, resolution, segment_id, cache, cache_pool, normalize, verbose, domain, path, chunk_cache)
+                self._load()
+        except Exception as e:
+            self._report_error(e)
+            raise
 
-                if type == "segment":
-                    assert isinstance(segment_id, int), "segment_id must be an int when type is 'segment'"
-                    self.segment_id = segment_id
-                else:
-                    self.segment_id = None
-                self.scroll_id = scroll_id
+    @classmethod
+    async def open(cls, *args: Any, **kwargs: Any) -> "Volume":
+        """
+        Open a volume without blocking the event loop.
 
-            if domain is None:
-                if is_aws_ec2_instance():
-                    self.aws = True
-                    domain = "local"
-                else:
-                    self.aws = False
-                    domain = "dl.ash2txt"
-            else:
-                self.aws = False
+        The arguments are the same as for `Volume`. The catalog lookup and the metadata requests run in the
+        default executor and the multiscale levels are opened concurrently. As for `Volume`, the ink label of
+        a segment is downloaded on first access.
 
-            assert domain in ["dl.ash2txt", "local"], "domain should be dl.ash2txt or local"
+        Returns
+        -------
+        Volume
+            The opened volume.
+        """
+        loop = asyncio.get_running_loop()
+        volume = cls.__new__(cls)
+        volume._reset_handles()
+        _open_objects.add(volume)
 
-            install_path = get_installation_path()
+        try:
+            await loop.run_in_executor(None, functools.partial(volume._configure, *args, **kwargs))
+            if volume.domain != "dl.ash2txt" or _tensorstore_forked:
+                await loop.run_in_executor(None, volume._load)
+                return volume
+
+            volume.metadata = await loop.run_in_executor(None, volume.load_ome_metadata)
+            datasets = volume.metadata['zattrs']['multiscales'][0]['datasets']
+            specs = await asyncio.gather(*(loop.run_in_executor(None, volume._level_spec, dataset['path']) for dataset in datasets))
+            context = volume._context()
+            volume.data = list(await asyncio.gather(*(ts.open(spec, context=context, assume_metadata=True) for spec in specs)))
+            volume._finish_load()
+        except Exception as e:
+            volume._report_error(e)
+            raise
+        return volume
+
+    @classmethod
+    async def open_many(cls, items: Iterable[Union[str, int, Dict[str, Any]]], max_concurrency: int = 32, return_exceptions: bool = False, **kwargs: Any) -> List[Union["Volume", BaseException]]:
+        """
+        Open many volumes concurrently.
+
+        Parameters
+        ----------
+        items : Iterable[Union[str, int, Dict[str, Any]]]
+            The volumes to open: a `type` argument (e.g. a segment ID or "Scroll1") or a dictionary of keyword arguments of `Volume`.
+        max_concurrency : int, default = 32
+            Maximum number of volumes being opened at the same time.
+        return_exceptions : bool, default = False
+            If True, the exceptions of the volumes that cannot be opened are returned in place of the volumes instead of being raised.
+        **kwargs : Any
+            Keyword arguments shared by all volumes, e.g. `normalize=True`.
+
+        Returns
+        -------
+        List[Union[Volume, BaseException]]
+            The volumes, in the same order as `items`.
+        """
+        def factory(item: Union[str, int, Dict[str, Any]]) -> Awaitable["Volume"]:
+            if isinstance(item, dict):
+                return cls.open(**{**kwargs, **item})
+            return cls.open(item, **kwargs)
+        return await _gather_limited([functools.partial(factory, item) for item in items], max_concurrency, return_exceptions)
+
+    def _configure(self, type: Union[str,int], scroll_id: Optional[Union[int, str]] = None, energy: Optional[int] = None, resolution: Optional[float] = None, segment_id: Optional[int] = None, cache: bool = True, cache_pool: Optional[int] = None, normalize: Union[bool, str, Tuple[float, float]] = False, verbose : bool = False, domain: Optional[str] = None, path: Optional[str] = None, chunk_cache: Optional[int] = None) -> None:
+        """
+        Resolve the identity, the domain and the URL of the volume, without opening the data.
+        """
+        type = str(type).lower()
+        if type[0].isdigit():
+            scroll_id, energy, resolution, _ = self.find_segment_details(str(type))
+            segment_id = int(type)
+            type = "segment"
+            
+        if type.startswith("scroll") and (len(type) > 6):
+            self.type = "scroll"
+            if (type[6:].isdigit()):
+                self.scroll_id = int(type[6:])
+            else:
+                self.scroll_id = str(type[6:])
         
-            self.configs = os.path.join(install_path, 'vesuvius', 'configs', f'scrolls.yaml')
+        else:
+            assert type in ["scroll", "segment"], "type should be either 'scroll', 'scroll#' or 'segment'"
+            self.type = type
 
-            if energy:
-                self.energy = energy
+            if type == "segment":
+                assert isinstance(segment_id, int), "segment_id must be an int when type is 'segment'"
+                self.segment_id = segment_id
             else:
-                self.energy = self.grab_canonical_energy()
+                self.segment_id = None
+            self.scroll_id = scroll_id
 
-            if resolution:
-                self.resolution = resolution
+        if domain is None:
+            if is_aws_ec2_instance():
+                self.aws = True
+                domain = "local"
             else:
-                self.resolution = self.grab_canonical_resolution()
+                self.aws = False
+                domain = "dl.ash2txt"
+        else:
+            self.aws = False
 
-            self.domain = domain
-            self.cache = cache
-            self.cache_pool = cache_pool
-            self.normalize = normalize
-            self.verbose = verbose
-            
-            if self.domain == "dl.ash2txt":
-                self.url = self.get_url_from_yaml()
-                self.metadata = self.load_ome_metadata()
-                self.data = self.load_data()
-                if self.normalize:
-                    self.max_dtype = get_max_value(self.data[0].dtype.numpy_dtype)
-                self.dtype = self.data[0].dtype.numpy_dtype
-            elif self.domain == "local":
-                if self.aws is False:
-                    assert path is not None
-                    self.url = path
-                if path is None:
-                    self.url = self.get_url_from_yaml()
-                self.data = zarr.open(self.url, mode="r")
-                self.metadata = self.load_ome_metadata()
-                if self.normalize:
-                    self.max_dtype = get_max_value(self.data[0].dtype)
-                self.dtype = self.data[0].dtype
-        
-            if self.type == "segment":
-                self.inklabel = np.zeros(self.shape(0), dtype=np.uint8)
-                self.download_inklabel()
+        assert domain in ["dl.ash2txt", "local"], "domain should be dl.ash2txt or local"
 
-            if self.verbose:
-                self.meta()
+        install_path = get_installation_path()
+    
+        self.configs = os.path.join(install_path, 'vesuvius', 'configs', f'scrolls.jsonl')
+
+        if energy:
+            self.energy = energy
+        else:
+            self.energy = self.grab_canonical_energy()
+
+        if resolution:
+            self.resolution = resolution
+        else:
+            self.resolution = self.grab_canonical_resolution()
+
+        if isinstance(normalize, str):
+            assert normalize == "percentile", "normalize should be a bool, 'percentile' or a (low, high) pair of percentiles"
+            normalize = DEFAULT_PERCENTILES
+        elif not isinstance(normalize, (bool, np.bool_)):
+            normalize = tuple(float(q) for q in normalize)
+            assert len(normalize) == 2, "normalize should be a bool, 'percentile' or a (low, high) pair of percentiles"
+
+        self.domain = domain
+        self.cache = cache
+        self.cache_pool = None if cache_pool is None else int(cache_pool)
+        self.chunk_cache = chunk_cache
+        self.normalize = normalize
+        self._normalization_range: Optional[Tuple[float, float]] = None
+        self.verbose = verbose
         
-        except Exception as e:
-            print(f"An error occurred while initializing the Volume class: {e}", end="\n")
-            print('Load the canonical scroll 1 with Volume(type="scroll", scroll_id=1, energy=54, resolution=7.91)', end="\n")
-            print('If loading another part of the same physical scroll use for instance Volume(type="scroll", scroll_id="1b", energy=54, resolution=7.91)', end="\n")
-            print('Load a segment (e.g. 20230827161847) with Volume(type="segment", scroll_id=1, energy=54, resolution=7.91, segment_id=20230827161847)')
-            raise
+        if self.domain == "dl.ash2txt":
+            self.url = self.get_url_from_yaml()
+        elif self.domain == "local":
+            if self.aws is False:
+                assert path is not None
+                self.url = path
+            if path is None:
+                self.url = self.get_url_from_yaml()
+
+    def _load(self) -> None:
+        """
+        Load the metadata and open the data of a configured volume. The ink label of a segment is downloaded on first access.
+        """
+        if self.domain == "dl.ash2txt":
+            self.metadata = self.load_ome_metadata()
+            self.data = self.load_data()
+        elif self.domain == "local":
+            self.metadata = self.load_ome_metadata()
+            self.data = self.open_data()
+        self._finish_load()
+
+    def _finish_load(self) -> None:
+        if isinstance(self.data[0], ts.TensorStore):
+            self.dtype = self.data[0].dtype.numpy_dtype
+        else:
+            self.dtype = self.data[0].dtype
+        if self.normalize:
+            self.max_dtype = get_max_value(self.dtype)
+
+        if self.verbose:
+            self.meta()
+
+    @staticmethod
+    def _report_error(e: Exception) -> None:
+        print(f"An error occurred while initializing the Volume class: {e}", end="\n")
+        print('Load the canonical scroll 1 with Volume(type="scroll", scroll_id=1, energy=54, resolution=7.91)', end="\n")
+        print('If loading another part of the same physical scroll use for instance Volume(type="scroll", scroll_id="1b", energy=54, resolution=7.91)', end="\n")
+        print('Load a segment (e.g. 20230827161847) with Volume(type="segment", scroll_id=1, energy=54, resolution=7.91, segment_id=20230827161847)')
     
+    def __getstate__(self) -> Dict[str, Any]:
+        state = self.__dict__.copy()
+        state['_data'] = None
+        state['_inklabel'] = None
+        state['_chunk_readers'] = {}
+        state.pop('_lock', None)
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        self._lock = threading.RLock()
+        _open_objects.add(self)
+
+    def _reset_handles(self) -> None:
+        """
+        Drop the data handles and the ink label, so that they are reopened lazily on first use.
+        """
+        self._lock = threading.RLock()
+        self._data = None
+        self._inklabel = None
+        self._chunk_readers: Dict[int, ChunkReader] = {}
+
+    @property
+    def data(self) -> List[Union[ts.TensorStore, zarr.Array]]:
+        """
+        The sub-volume handles, opened on first access.
+        """
+        if self._data is None:
+            with self._lock:
+                if self._data is None:
+                    self._data = self.open_data()
+        return self._data
+
+    @data.setter
+    def data(self, value: List[Union[ts.TensorStore, zarr.Array]]) -> None:
+        self._data = value
+        self._chunk_readers = {}
+
+    @property
+    def inklabel(self) -> Optional[NDArray]:
+        """
+        The ink label of the segment, downloaded on first access. None for scrolls.
+        """
+        if self._inklabel is None and self.type == "segment":
+            with self._lock:
+                if self._inklabel is None:
+                    self._inklabel = np.zeros(self.shape(0), dtype=np.uint8)
+                    self.download_inklabel()
+        return self._inklabel
+
+    @inklabel.setter
+    def inklabel(self, value: NDArray) -> None:
+        self._inklabel = value
+
+    @traced("Volume.open_data")
+    def open_data(self) -> List[Union[ts.TensorStore, zarr.Array]]:
+        """
+        Open the handles of the sub-volumes.
+
+        Returns
+        -------
+        List[Union[ts.TensorStore, zarr.Array]]
+            The TensorStore handles of a remote or zarr v3 volume, or the zarr arrays of a local zarr v2 volume,
+            opened from the dataset paths of the multiscale metadata.
+        """
+        if self.domain == "dl.ash2txt" or self.metadata.get('zarr_format', 2) == 3:
+            return self.load_data()
+        group = zarr.open_group(self.url, mode="r")
+        return [group[dataset['path']] for dataset in self.metadata['zattrs']['multiscales'][0]['datasets']]
+
     def meta(self) -> None:
         """
         Print metadata information about the volume.
@@ -273,9 +602,10 @@ class Volume:
 
         return None, None, None, None
 
+    @traced("Volume.catalog_lookup")
     def get_url_from_yaml(self) -> str:
         """
-        Retrieve the URL for the volume data from the YAML configuration file.
+        Retrieve the URL for the volume data from the scrolls catalog.
 
         Returns
         -------
@@ -288,9 +618,8 @@ class Volume:
             If the URL cannot be found in the configuration.
         """
 
-        # Load the YAML file
-        with open(self.configs, 'r') as file:
-            data: Dict[str, Any] = yaml.safe_load(file)
+        # Load only the section of this scroll from the catalog
+        data: Dict[str, Any] = list_files(self.scroll_id)
         
         # Retrieve the URL for the given id, energy, and resolution
         if self.type == 'scroll':
@@ -308,14 +637,17 @@ class Volume:
             
         return url
     
+    @traced("Volume.load_ome_metadata")
     def load_ome_metadata(self) -> Dict[str, Any]:
         """
         Load the OME (Open Microscopy Environment) metadata for the volume.
 
+        The zarr format is detected from the group metadata: `.zattrs` for zarr v2, `zarr.json` for zarr v3.
+
         Returns
         -------
         Dict[str, Any]
-            The loaded metadata.
+            The loaded metadata: the OME attributes under "zattrs" and the zarr format (2 or 3) under "zarr_format".
 
         Raises
         ------
@@ -323,71 +655,104 @@ class Volume:
             If there is an error loading the metadata from the server.
         """
         try:
-            if self.domain == "dl.ash2txt":
-                # Load the .zattrs metadata
-                zattrs_url = f"{self.url}/.zattrs"
-                zattrs_response = requests.get(zattrs_url)
-                zattrs_response.raise_for_status()
-                zattrs = zattrs_response.json()
-
-            elif self.domain == "local":
-                zattrs = dict(self.data.attrs)
+            if self.domain == "dl.ash2txt" or os.path.exists(os.path.join(self.url, "zarr.json")):
+                # Remote documents are revalidated against the disk cache
+                zattrs, zarr_format = read_multiscales(self.url)
+            else:
+                zattrs, zarr_format = dict(zarr.open_group(self.url, mode="r").attrs), 2
             return {
                 "zattrs": zattrs,
+                "zarr_format": zarr_format,
             }
         except requests.RequestException as e:
             print(f"Error loading metadata: {e}")
             raise
 
-    def load_data(self) -> List[ts.TensorStore]:
+    @traced("Volume.load_data")
+    def load_data(self) -> List[Union[ts.TensorStore, zarr.Array]]:
         """
         Load the data for the volume.
 
+        Zarr v2 levels are opened with the TensorStore `zarr` driver. Zarr v3 levels, sharded or not, are opened
+        with the `zarr3` driver, which reads the chunks of a shard with HTTP byte-range requests.
+
         Returns
         -------
-        List[ts.TensorStore]
-            A list of TensorStore objects representing the sub-volumes.
+        List[Union[ts.TensorStore, zarr.Array]]
+            A list of TensorStore objects representing the sub-volumes (zarr arrays in a process forked after TensorStore was used).
 
         Raises
         ------
         Exception
             If there is an error loading the data from the server.
+        RuntimeError
+            If a zarr v3 volume is opened in a process forked after TensorStore was used.
         """
-        if self.cache:
+        datasets = self.metadata['zattrs']['multiscales'][0]['datasets']
+        if _tensorstore_forked:
+            # TensorStore aborts in a process forked after it started its threads,
+            # so forked workers read the same arrays with zarr over HTTP instead
+            if self.metadata.get('zarr_format', 2) == 3:
+                raise RuntimeError("Zarr v3 volumes cannot be read in a process forked after TensorStore was used. Use the 'spawn' or 'forkserver' multiprocessing start method.")
+            return [zarr.open(f"{self.url}/{dataset['path']}/", mode="r") for dataset in datasets]
+
+        context = self._context()
+        specs = [self._level_spec(dataset['path']) for dataset in datasets]
+        # All the levels are opened concurrently
+        with span("ts.open", levels=len(specs)):
+            futures = [ts.open(spec, context=context, assume_metadata=True) for spec in specs]
+            sub_volumes = []
+            for spec, future in zip(specs, futures):
+                try:
+                    sub_volumes.append(future.result())
+                except Exception as e:
+                    print(f"Error loading data from {spec['kvstore'].get('base_url', spec['kvstore'].get('path'))}: {e}")
+                    raise
+
+        return sub_volumes
+
+    def _context(self) -> ts.Context:
+        # With a chunk cache the decoded chunks are cached by the chunk readers, not twice
+        if self.cache and self.chunk_cache is None:
             context_spec = {
                 'cache_pool': {
-                    "total_bytes_limit": self.cache_pool
+                    "total_bytes_limit": get_cache_budget() if self.cache_pool is None else self.cache_pool
                 }
             }
         else:
             context_spec = {}
+        # Volumes of the same process share one context, and with it one cache pool
+        return _shared_context(context_spec, auto=bool(context_spec) and self.cache_pool is None)
 
-        sub_volumes = []
-        for dataset in self.metadata['zattrs']['multiscales'][0]['datasets']:
-            path = dataset['path']
-            sub_url = f"{self.url}/{path}/"                
+    def _level_spec(self, path: str) -> Dict[str, Any]:
+        """
+        Build the TensorStore spec of a multiscale level.
+        """
+        sub_url = f"{self.url}/{path}/"
+        zarr_format = self.metadata.get('zarr_format', 2)
+        if self.domain == "dl.ash2txt":
             kvstore_spec = {
                 'driver': 'http',
                 'base_url': sub_url
             }
-            
-            spec = {
-                'driver': 'zarr',
-                'kvstore': kvstore_spec,
-                'context': context_spec
+        else:
+            kvstore_spec = {
+                'driver': 'file',
+                'path': sub_url
             }
+        
+        spec = {
+            'driver': 'zarr' if zarr_format == 2 else 'zarr3',
+            'kvstore': kvstore_spec
+        }
 
-            # Print the full URL for debugging
-            #print(f"Attempting to load data from: {sub_url}.zarray")
-            
-            try:
-                data = ts.open(spec).result()
-                sub_volumes.append(data)
-            except Exception as e:
-                print(f"Error loading data from {sub_url}: {e}")
-                raise
-
-        return sub_volumes
+        try:
+            # The array header comes from the metadata cache, so TensorStore does not refetch it
+            spec['metadata'] = read_array_metadata(f"{self.url}/{path}", zarr_format)
+        except Exception as e:
+            print(f"Error loading data from {sub_url}: {e}")
+            raise
+        return spec
     
     def download_inklabel(self) -> None:
         """
@@ -401,27 +766,39 @@ class Volume:
             If the volume type is not 'segment'.
         """
         assert self.type == "segment", "Can download ink label only for segments."
+        inklabel = self._fetch_inklabel()
+        if inklabel is not None:
+            self.inklabel = inklabel
+
+    def _inklabel_url(self) -> str:
+        """
+        Get the URL (or local path) of the ink label image of the segment.
+        """
         if self.url[-1] == "/":
-            inklabel_url = self.url[:-6]+"_inklabels.png"
-        else:
-            inklabel_url = self.url[:-5]+"_inklabels.png"
+            return self.url[:-6]+"_inklabels.png"
+        return self.url[:-5]+"_inklabels.png"
+
+    @traced("Volume.inklabel")
+    def _fetch_inklabel(self) -> Optional[NDArray]:
+        """
+        Read the ink label image of the segment, or return None if it is not available.
+        """
+        inklabel_url = self._inklabel_url()
         if self.domain == "local":
             # If domain is local, open the image from the local file path
             if os.path.exists(inklabel_url):
-                self.inklabel = np.array(Image.open(inklabel_url))
-            else:
-                print(f"File not found: {inklabel_url}")
+                return np.array(_pil_image().open(inklabel_url))
+            print(f"File not found: {inklabel_url}")
         else:
             # Make a GET request to the URL to download the image
-            response = requests.get(inklabel_url)
+            response = get_metadata_cache().session.get(inklabel_url)
 
             # Check if the request was successful
             if response.status_code == 200:
                 # Open the image directly from the response content using PIL
-                self.inklabel = np.array(Image.open(BytesIO(response.content)))
-            else:
-                print(f"Failed to download inklabel. Status code: {response.status_code}")
-        
+                return np.array(_pil_image().open(BytesIO(response.content)))
+            print(f"Failed to download inklabel. Status code: {response.status_code}")
+        return None
 
     def __getitem__(self, idx: Union[Tuple[int, ...],int]) -> NDArray:
         """
@@ -446,86 +823,33 @@ class Volume:
         """
         if isinstance(idx, tuple) and len(idx) == 4:
             x, y, z, subvolume_idx  = idx
-
             assert 0 <= subvolume_idx < len(self.data), "Invalid subvolume index."
-            if self.domain == "dl.ash2txt":
-                if self.normalize:
-                    return self.data[subvolume_idx][x, y, z].read().result()/self.max_dtype
-                else:
-                    return self.data[subvolume_idx][x,y,z].read().result()
-                
-            elif self.domain == "local":
-                if self.normalize:
-                    return self.data[subvolume_idx][x, y, z]/self.max_dtype
-                else:
-                    return self.data[subvolume_idx][x,y,z]
-            else:
-                raise ValueError("Invalid domain.")
-            
         elif isinstance(idx, tuple) and len(idx) == 3:
             x, y, z = idx
-
             subvolume_idx = 0
-
-            if self.domain == "dl.ash2txt":
-                if self.normalize:
-                    return self.data[subvolume_idx][x, y, z].read().result()/self.max_dtype
-                
-                else:
-                    return self.data[subvolume_idx][x,y,z].read().result()
-                
-            elif self.domain == "local":
-                if self.normalize:
-                    return self.data[subvolume_idx][x, y, z]/self.max_dtype
-                
-                else:
-                    return self.data[subvolume_idx][x,y,z]
-            else:
-                raise ValueError("Invalid domain.")
-            
         elif isinstance(idx, tuple) and len(idx) == 2:
             x, y = idx
-
+            z = slice(None)
             subvolume_idx = 0
-
-            if self.domain == "dl.ash2txt":
-                if self.normalize:
-                    return self.data[subvolume_idx][x, y, :].read().result()/self.max_dtype
-                
-                else:
-                    return self.data[subvolume_idx][x,y,:].read().result()
-                
-            elif self.domain == "local":
-                if self.normalize:
-                    return self.data[subvolume_idx][x, y, :]/self.max_dtype
-                
-                else:
-                    return self.data[subvolume_idx][x,y,:]
-                
-        elif (isinstance(idx, tuple) and len(idx) == 1) or isinstance(idx, int):
-            x = idx
-
+        elif (isinstance(idx, tuple) and len(idx) == 1) or isinstance(idx, (int, np.integer, slice)):
+            x = idx[0] if isinstance(idx, tuple) else idx
+            y, z = slice(None), slice(None)
             subvolume_idx = 0
-
-            if self.domain == "dl.ash2txt":
-                if self.normalize:
-                    return self.data[subvolume_idx][x, :, :].read().result()/self.max_dtype
-                
-                else:
-                    return self.data[subvolume_idx][x,:,:].read().result()
-                
-            elif self.domain == "local":
-                if self.normalize:
-                    return self.data[subvolume_idx][x,:, :]/self.max_dtype
-                
-                else:
-                    return self.data[subvolume_idx][x,:,:]
-                
-            else:
-                raise ValueError("Invalid domain.")
-            
         else:
             raise IndexError("Invalid index. Must be a tuple of three elements (coordinates) or four elements (subvolume id and coordinates).")
+
+        if self.domain not in ["dl.ash2txt", "local"]:
+            raise ValueError("Invalid domain.")
+
+        with span("Volume.__getitem__", subvolume=subvolume_idx) as record:
+            with span("Volume.read"):
+                data = self._read_region(subvolume_idx, (x, y, z))
+            if record is not None:
+                record["args"]["nbytes"] = data.nbytes
+            if self.normalize:
+                with span("Volume.normalize"):
+                    return self._normalize(data)
+            return data
         
     def grab_canonical_energy(self) -> int:
         """
@@ -619,6 +943,494 @@ class Volume:
         assert 0 <= subvolume_idx < len(self.data), "Invalid subvolume index"
         return self.data[subvolume_idx].shape
 
+    def chunks(self, subvolume_idx: int = 0) -> Tuple[int, ...]:
+        """
+        Get the chunk shape of a specific sub-volume.
+
+        Parameters
+        ----------
+        subvolume_idx : int, default = 0
+            Index of the sub-volume to get the chunk shape of.
+
+        Returns
+        -------
+        Tuple[int, ...]
+            The shape of the chunks the sub-volume is stored in.
+
+        Raises
+        ------
+        AssertionError
+            If the sub-volume index is invalid.
+        """
+        assert 0 <= subvolume_idx < len(self.data), "Invalid subvolume index"
+        data = self.data[subvolume_idx]
+        if isinstance(data, ts.TensorStore):
+            return tuple(data.chunk_layout.read_chunk.shape)
+        return tuple(data.chunks)
+
+    def sample(self, points: NDArray, order: int = 0, subvolume_idx: int = 0, fill_value: Union[int, float] = 0) -> NDArray:
+        """
+        Sample the volume at arbitrary (z, y, x) positions, e.g. along the coordinate map of a segment surface.
+
+        Points are grouped by chunk, every needed chunk is fetched once and the interpolation is vectorized.
+
+        Parameters
+        ----------
+        points : NDArray
+            Array of shape (N, 3) or (H, W, 3) with (z, y, x) coordinates in full-resolution voxel units.
+        order : int, default = 0
+            Interpolation order: 0 for nearest-neighbour, 1 for trilinear.
+        subvolume_idx : int, default = 0
+            Index of the sub-volume to sample from.
+        fill_value : Union[int, float], default = 0
+            Value returned for points outside the volume.
+
+        Returns
+        -------
+        NDArray
+            Array of shape points.shape[:-1] with the sampled values.
+        """
+        values = sample_volume(self, points, order=order, subvolume_idx=subvolume_idx, fill_value=fill_value)
+        if self.normalize:
+            return self._normalize(values)
+        return values
+
+    def preview(self, axis: int = 0, index: Optional[int] = None, max_size: int = 1024, format: str = "array", cache: bool = True, cache_dir: Optional[os.PathLike] = None) -> Union[NDArray, bytes]:
+        """
+        Render a downsampled 2D slice of the volume.
+
+        The coarsest multiscale level still at least `max_size` pixels wide is read, and block-mean downsampled
+        so that the preview fits in `max_size` x `max_size` pixels. Rendered previews are cached on disk.
+
+        Parameters
+        ----------
+        axis : int, default = 0
+            Axis orthogonal to the slice: 0 (z), 1 (y) or 2 (x).
+        index : Optional[int], default = None
+            Position of the slice along `axis`, in full-resolution voxels. If None the middle slice is rendered.
+        max_size : int, default = 1024
+            Maximum size of the preview along both dimensions.
+        format : str, default = "array"
+            "array" to get the slice with the volume dtype, "png" to get an 8-bit PNG image as bytes.
+        cache : bool, default = True
+            If True previews are read from and saved to the cache directory.
+        cache_dir : Optional[os.PathLike], default = None
+            Directory where previews are stored. If None they will be saved in $HOME / vesuvius / previews
+
+        Returns
+        -------
+        Union[NDArray, bytes]
+            The preview as an array of shape at most (max_size, max_size), or the encoded PNG image.
+
+        Raises
+        ------
+        ValueError
+            If `axis` or `format` is invalid, or `index` is outside the volume.
+        """
+        if axis not in (0, 1, 2):
+            raise ValueError("axis must be 0, 1 or 2.")
+        if format not in ("array", "png"):
+            raise ValueError("format must be 'array' or 'png'.")
+        shape = self.shape(0)
+        if index is None:
+            index = shape[axis] // 2
+        if not 0 <= index < shape[axis]:
+            raise ValueError(f"index {index} is outside the volume along axis {axis}.")
+
+        cache_path = None
+        if cache:
+            cache_dir = Path(cache_dir) if cache_dir is not None else Path.home() / 'vesuvius' / 'previews'
+            key = json.dumps({"url": str(self.url), "axis": axis, "index": int(index), "max_size": max_size})
+            cache_path = cache_dir / f"{hashlib.sha1(key.encode('utf-8')).hexdigest()}.{'png' if format == 'png' else 'npy'}"
+            try:
+                if format == "png":
+                    return cache_path.read_bytes()
+                image = np.load(cache_path)
+                return self._normalize(image) if self.normalize else image
+            except (OSError, ValueError):
+                pass
+
+        image = self._render_preview(axis, int(index), max_size)
+
+        if format == "png":
+            buffer = BytesIO()
+            _pil_image().fromarray(self._to_uint8(image)).save(buffer, format="PNG")
+            result = buffer.getvalue()
+        else:
+            result = image
+
+        if cache_path is not None:
+            try:
+                os.makedirs(cache_path.parent, exist_ok=True)
+                if format == "png":
+                    atomic_write(str(cache_path), result)
+                else:
+                    buffer = BytesIO()
+                    np.save(buffer, image)
+                    atomic_write(str(cache_path), buffer.getvalue())
+            except OSError as e:
+                print(f"Could not save preview to {cache_path}: {e}")
+
+        if format == "array" and self.normalize:
+            return self._normalize(result)
+        return result
+
+    def stats(self, subvolume_idx: Optional[int] = None, region: Optional[Tuple[slice, ...]] = None, cache: bool = True) -> VolumeStats:
+        """
+        Compute the intensity statistics (histogram, percentiles, mean, std) of a level or region.
+
+        The chunks are read concurrently and reduced in a single streaming pass. Results are cached
+        next to the metadata cache, so every level or region is scanned only once.
+
+        Parameters
+        ----------
+        subvolume_idx : Optional[int], default = None
+            Index of the sub-volume. If None the coarsest level is used, which is usually enough for global statistics.
+        region : Optional[Tuple[slice, ...]], default = None
+            (z, y, x) slices of a region, in the coordinates of the sub-volume. If None the whole sub-volume is used.
+        cache : bool, default = True
+            If True cached statistics are reused and new ones are saved.
+
+        Returns
+        -------
+        VolumeStats
+            The statistics, e.g. `stats.percentile([1, 99])`, `stats.mean` or `stats.histogram`.
+        """
+        if subvolume_idx is None:
+            subvolume_idx = len(self.data) - 1
+        assert 0 <= subvolume_idx < len(self.data), "Invalid subvolume index"
+        return cached_stats(self, subvolume_idx, region, cache=cache)
+
+    def predict(self, model: Callable[[NDArray], Any], tile_shape: Tuple[int, int, int], overlap: Union[int, Tuple[int, int, int]] = 0, region: Optional[Tuple[slice, ...]] = None, subvolume_idx: int = 0, blend: str = "gaussian", batch_size: int = 8, output: Optional[Any] = None, output_dtype: Any = np.float32, prefetch: int = 2) -> Any:
+        """
+        Run a model over a region tile by tile, blending the overlapping tile predictions.
+
+        Tiles are read and normalized in background threads while the model runs. The block of every tile,
+        up to the start of the next tile, is written to `output` as soon as no later tile overlaps it, so only
+        the parts of the output still overlapped by upcoming tiles are held in memory.
+
+        Parameters
+        ----------
+        model : Callable[[NDArray], Any]
+            Function mapping a batch of tiles of shape (B, z, y, x) to predictions of shape (B, *channels, z, y, x),
+            or (B, *channels, y, x) for 2D predictions (tiles must then span the whole z range of the region).
+        tile_shape : Tuple[int, int, int]
+            (z, y, x) shape of the tiles.
+        overlap : Union[int, Tuple[int, int, int]], default = 0
+            Overlap of consecutive tiles.
+        region : Optional[Tuple[slice, ...]], default = None
+            (z, y, x) slices of the region, in the coordinates of the sub-volume. If None the whole sub-volume is used.
+        subvolume_idx : int, default = 0
+            Index of the sub-volume.
+        blend : str, default = "gaussian"
+            Blend window: "constant", "linear" or "gaussian".
+        batch_size : int, default = 8
+            Number of tiles per call of `model`.
+        output : Optional[Any], default = None
+            Array (NumPy, memory map or zarr) of shape (*channels, *prediction_shape) receiving the predictions, a `PredictionStore`
+            from `create_store` (written at the position of the region), or a path where a new store with the geometry of the volume
+            is created and closed with its pyramid. If None a NumPy array of `output_dtype` is allocated.
+        output_dtype : Any, default = np.float32
+            Data type of the allocated output array or created store.
+        prefetch : int, default = 2
+            Number of batches read ahead of the model.
+
+        Returns
+        -------
+        Any
+            The blended predictions: the output array or store.
+        """
+        assert 0 <= subvolume_idx < len(self.data), "Invalid subvolume index"
+        return sliding_window_inference(self, model, tile_shape, overlap, region, subvolume_idx, blend, batch_size, output, output_dtype, prefetch)
+
+    def view(self, roi: Optional[Tuple[Union[slice, int], ...]] = None, subvolume_idx: int = 0) -> VolumeView:
+        """
+        Get a lazy view of a region, which composes further slicing, transposes and level changes without reading data.
+
+        Parameters
+        ----------
+        roi : Optional[Tuple[Union[slice, int], ...]], default = None
+            Integers, slices and Ellipsis selecting the region, in the coordinates of the sub-volume. If None the whole sub-volume is viewed.
+        subvolume_idx : int, default = 0
+            Index of the sub-volume.
+
+        Returns
+        -------
+        VolumeView
+            The view. Its data are read by `read()` or `np.asarray`, once, for the final composed region.
+
+        Examples
+        --------
+        >>> view = volume.view((slice(1000, 2000), slice(None), slice(None)))
+        >>> patch = view[::2, 500:756, 500:756].transpose(2, 1, 0)
+        >>> data = patch.read()
+        """
+        assert 0 <= subvolume_idx < len(self.data), "Invalid subvolume index."
+        view = VolumeView(self, subvolume_idx)
+        return view if roi is None else view[roi]
+
+    def to_dask(self, level: int = 0, chunks: Optional[Union[int, Tuple[int, ...]]] = None) -> Any:
+        """
+        Wrap a sub-volume in a lazy dask array whose blocks line up with its zarr chunks. Requires dask.
+
+        Parameters
+        ----------
+        level : int, default = 0
+            Index of the sub-volume.
+        chunks : Optional[Union[int, Tuple[int, ...]]], default = None
+            Block shape, rounded up to a multiple of the chunk shape. If None every block is one chunk.
+
+        Returns
+        -------
+        dask.array.Array
+            The lazy array, normalized as the volume. Every worker process opens the volume once and shares it between its blocks.
+        """
+        from .adapters import to_dask
+        return to_dask(self, level, chunks)
+
+    def to_xarray(self, level: int = 0, chunks: Optional[Union[int, Tuple[int, ...]]] = None, name: Optional[str] = None) -> Any:
+        """
+        Wrap a sub-volume in a lazy xarray DataArray backed by `to_dask`. Requires xarray and dask.
+
+        Parameters
+        ----------
+        level : int, default = 0
+            Index of the sub-volume.
+        chunks : Optional[Union[int, Tuple[int, ...]]], default = None
+            Block shape of the dask array.
+        name : Optional[str], default = None
+            Name of the DataArray. If None it is derived from the volume.
+
+        Returns
+        -------
+        xarray.DataArray
+            The lazy array, with dimensions named after the OME axes and physical coordinates from the OME coordinate transformations.
+        """
+        from .adapters import to_xarray
+        return to_xarray(self, level, chunks, name)
+
+    @staticmethod
+    def priority(priority: str, group: Optional[Hashable] = None, timeout: Optional[float] = None) -> ContextManager[None]:
+        """
+        Give a priority class to the reads of the current thread in a `with` block, for all the volumes of the process.
+
+        Chunk fetches of all the volumes go through one scheduler: "interactive" reads are served first,
+        "bulk" reads (prefetching, exports, inference) are limited to a few concurrent fetches and use the
+        spare slots. Reads run outside a block have the "default" priority.
+
+        Parameters
+        ----------
+        priority : str
+            Priority class: "interactive", "default" or "bulk".
+        group : Optional[Hashable], default = None
+            Group of the reads, to cancel them with `cancel`.
+        timeout : Optional[float], default = None
+            Seconds after which the fetches of the block that have not started are dropped with `CancelledError`.
+
+        Returns
+        -------
+        ContextManager[None]
+            The context manager.
+
+        Examples
+        --------
+        >>> with Volume.priority("bulk"):
+        ...     volume.predict(model, tile_shape=(64, 256, 256))
+        """
+        return read_priority(priority, group, timeout)
+
+    def submit(self, idx: Union[Tuple[int, ...], int], priority: str = "default", group: Optional[Hashable] = None, timeout: Optional[float] = None) -> Future:
+        """
+        Read a region in the background with a priority class, as `volume[idx]`.
+
+        Parameters
+        ----------
+        idx : Union[Tuple[int, ...], int]
+            The index, as for `__getitem__`.
+        priority : str, default = "default"
+            Priority class: "interactive", "default" or "bulk".
+        group : Optional[Hashable], default = None
+            Group of the read, e.g. the viewport it is displayed in, to cancel it with `cancel` once it is stale.
+        timeout : Optional[float], default = None
+            Seconds after which the fetches of the read that have not started are dropped.
+
+        Returns
+        -------
+        Future
+            The data. Its `result()` raises `CancelledError` if the read was cancelled or timed out.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        return get_read_scheduler().submit(self.__getitem__, idx, priority=priority, group=group, deadline=deadline)
+
+    @staticmethod
+    def cancel(group: Hashable) -> int:
+        """
+        Cancel the fetches of a group that have not started, e.g. for the slices of a viewport that scrolled away.
+        Reads of the group waiting for them raise `CancelledError`; chunks already being fetched are still cached.
+
+        Parameters
+        ----------
+        group : Hashable
+            The group given to `submit` or `priority`.
+
+        Returns
+        -------
+        int
+            The number of reads and fetches cancelled.
+        """
+        return get_read_scheduler().cancel(group)
+
+    def create_store(self, path: Union[str, os.PathLike], dtype: Any = np.float32, channels: Tuple[int, ...] = (), ndim: int = 3, levels: Optional[int] = None, overwrite: bool = False) -> PredictionStore:
+        """
+        Create a writable OME-Zarr store with the shape, chunking and multiscale layout of the volume, e.g. for predictions.
+
+        Parameters
+        ----------
+        path : Union[str, os.PathLike]
+            Path of the new zarr group.
+        dtype : Any, default = np.float32
+            Data type of the stored values.
+        channels : Tuple[int, ...], default = ()
+            Shape of channel axes preceding the spatial axes.
+        ndim : int, default = 3
+            Number of spatial axes: 3 for (z, y, x) results, 2 for (y, x) results such as ink predictions.
+        levels : Optional[int], default = None
+            Number of multiscale levels. If None all the levels of the volume are created.
+        overwrite : bool, default = False
+            If True an existing store at `path` is replaced.
+
+        Returns
+        -------
+        PredictionStore
+            The store. Regions are written with `store.write(roi, array)` and the pyramid is built by `store.close()`.
+        """
+        assert ndim in (2, 3), "ndim should be 2 or 3"
+        levels = len(self.data) if levels is None else min(levels, len(self.data))
+        multiscales = self.metadata['zattrs']['multiscales'][0]
+        transforms = []
+        for dataset in multiscales['datasets'][:levels]:
+            transforms.append([
+                {**transform, transform['type']: list(transform[transform['type']])[-ndim:]}
+                for transform in dataset.get('coordinateTransformations', [])
+                if transform['type'] in ('scale', 'translation')
+            ] or [{"type": "scale", "scale": [1.0] * ndim}])
+        axes = [axis['name'] if isinstance(axis, dict) else axis for axis in multiscales.get('axes', ['z', 'y', 'x'])][-ndim:]
+        return PredictionStore.create(
+            path,
+            [self.shape(level)[-ndim:] for level in range(levels)],
+            [self.chunks(level)[-ndim:] for level in range(levels)],
+            dtype=dtype, channels=channels, transforms=transforms, axes=axes, overwrite=overwrite,
+        )
+
+    def _normalize(self, data: NDArray) -> NDArray:
+        """
+        Scale raw values to [0, 1], by the dtype maximum or by the percentile range of the volume.
+        """
+        if not isinstance(self.normalize, tuple):
+            return data/self.max_dtype
+        if self._normalization_range is None:
+            with self._lock:
+                if self._normalization_range is None:
+                    low, high = self.stats().percentile(self.normalize)
+                    self._normalization_range = (float(low), float(high) if high > low else float(low) + 1)
+        low, high = self._normalization_range
+        return np.clip((data - low) / (high - low), 0, 1)
+
+    def _preview_level(self, axis: int, max_size: int) -> int:
+        """
+        Get the level read by `preview`: the coarsest one that still has at least `max_size` pixels along the longest dimension of the slice.
+        """
+        plane_axes = [dim for dim in range(3) if dim != axis]
+        for idx in range(len(self.data) - 1, -1, -1):
+            if max(self.shape(idx)[dim] for dim in plane_axes) >= max_size:
+                return idx
+        return 0
+
+    def _render_preview(self, axis: int, index: int, max_size: int) -> NDArray:
+        level = self._preview_level(axis, max_size)
+        position = index
+        if level != 0:
+            scale_0, translation_0 = self._level_transform(0)
+            scale, translation = self._level_transform(level)
+            position = int(np.floor((index * scale_0[axis] + translation_0[axis] - translation[axis]) / scale[axis] + 0.5))
+        position = min(max(position, 0), self.shape(level)[axis] - 1)
+
+        region = [slice(None)] * 3
+        region[axis] = position
+        image = np.asarray(self._read_region(level, tuple(region)))
+        factor = -(-max(image.shape) // max_size)
+        return block_mean(image, factor)
+
+    def _to_uint8(self, image: NDArray) -> NDArray:
+        if image.dtype == np.uint8:
+            return image
+        if np.issubdtype(image.dtype, np.integer):
+            return (image.astype(np.float64) * (255 / get_max_value(image.dtype))).astype(np.uint8)
+        return (np.clip(image, 0, 1) * 255).astype(np.uint8)
+
+    def _level_transform(self, subvolume_idx: int) -> Tuple[NDArray, NDArray]:
+        """
+        Get the scale and translation of a sub-volume from the OME coordinate transformations.
+        """
+        dataset = self.metadata['zattrs']['multiscales'][0]['datasets'][subvolume_idx]
+        scale = np.ones(3)
+        translation = np.zeros(3)
+        for transform in dataset.get('coordinateTransformations', []):
+            if transform['type'] == 'scale':
+                scale = np.asarray(transform['scale'][-3:], dtype=np.float64)
+            elif transform['type'] == 'translation':
+                translation = np.asarray(transform['translation'][-3:], dtype=np.float64)
+        return scale, translation
+
+    def _chunk_region(self, subvolume_idx: int, chunk_idx: Tuple[int, ...]) -> Tuple[slice, ...]:
+        """
+        Get the region covered by a chunk, clipped to the sub-volume bounds.
+        """
+        shape = self.shape(subvolume_idx)
+        chunks = self.chunks(subvolume_idx)
+        return tuple(slice(c * n, min((c + 1) * n, s)) for c, n, s in zip(chunk_idx, chunks, shape))
+
+    def _chunk_reader(self, subvolume_idx: int) -> ChunkReader:
+        """
+        Get the chunk reader of a sub-volume.
+
+        Without a chunk cache the sub-volume is still read through a reader with empty budgets: every chunk
+        fetch then goes through the read scheduler (priority classes, class limits and cancellation), and
+        the fetches of chunks read by several threads at the same time are shared. TensorStore volumes
+        keep caching the chunks in their cache pool.
+        """
+        reader = self._chunk_readers.get(subvolume_idx)
+        if reader is None:
+            data = self.data[subvolume_idx]
+            with self._lock:
+                reader = self._chunk_readers.get(subvolume_idx)
+                if reader is None:
+                    if self.chunk_cache is None:
+                        cache = get_chunk_cache(0, 0)
+                    else:
+                        cache = get_chunk_cache(self.cache_pool if self.cache else 0, self.chunk_cache)
+                    reader = ChunkReader(data, (str(self.url), subvolume_idx), cache)
+                    self._chunk_readers[subvolume_idx] = reader
+        return reader
+
+    def _read_region(self, subvolume_idx: int, region: Tuple[slice, ...]) -> NDArray:
+        """
+        Read a region of a sub-volume as a NumPy array, without normalization.
+        """
+        return self._chunk_reader(subvolume_idx).read(region)
+
+    def _read_chunks(self, subvolume_idx: int, chunk_indices: List[Tuple[int, ...]]) -> Iterator[NDArray]:
+        """
+        Read whole chunks of a sub-volume concurrently, yielding them in the order requested.
+        """
+        yield from self._chunk_reader(subvolume_idx).read_chunks(chunk_indices)
+
+    def _read_regions(self, subvolume_idx: int, regions: List[Tuple[Union[slice, int], ...]]) -> List[NDArray]:
+        """
+        Read several regions of a sub-volume concurrently, without normalization.
+        """
+        return self._chunk_reader(subvolume_idx).read_many(regions)
+
   
 class Cube:
     """
@@ -656,6 +1468,15 @@ class Cube:
         Loaded mask data.
     max_dtype : Union[float, int]
         Maximum value of the dtype if normalization is enabled.
+
+    Notes
+    -----
+    Cubes pickle by spec: `volume` and `mask` are not serialized, but reloaded lazily on first use
+    (from the cache directory when caching is enabled).
+
+    The arrays of all the cubes of a process live in one LRU cache bounded by `CUBE_CACHE_BYTES`
+    (2 GiB by default, set with `VESUVIUS_CUBE_CACHE_BYTES` or `set_cube_cache_size`). Evicted arrays
+    are reloaded on the next access, so iterating over many cubes keeps memory bounded.
     """
     def __init__(self, scroll_id: int, energy: int, resolution: float, z: int, y: int, x: int, cache: bool = False, cache_dir : Optional[os.PathLike] = None, normalize: bool = False) -> None:
         """
@@ -687,14 +1508,76 @@ class Cube:
         ValueError
             If the URL cannot be found in the configuration.
         """
+        self._reset_handles()
+        _open_objects.add(self)
+
+        self._configure(scroll_id, energy, resolution, z, y, x, cache, cache_dir, normalize)
+        self._finish_load(*_cube_cache.get_or_load(self._cache_key, self.load_data))
+
+    @classmethod
+    async def open(cls, *args: Any, **kwargs: Any) -> "Cube":
+        """
+        Open a cube without blocking the event loop.
+
+        The arguments are the same as for `Cube`. The volume and the mask are downloaded concurrently in the default executor.
+
+        Returns
+        -------
+        Cube
+            The opened cube.
+        """
+        loop = asyncio.get_running_loop()
+        cube = cls.__new__(cls)
+        cube._reset_handles()
+        _open_objects.add(cube)
+        await loop.run_in_executor(None, functools.partial(cube._configure, *args, **kwargs))
+        arrays = _cube_cache.get(cube._cache_key)
+        if arrays is None:
+            arrays = await asyncio.gather(*(loop.run_in_executor(None, cube._load_array, url) for url in (cube.volume_url, cube.mask_url)))
+        cube._finish_load(*arrays)
+        return cube
+
+    @classmethod
+    async def open_many(cls, items: Iterable[Union[Tuple[Any, ...], Dict[str, Any]]], max_concurrency: int = 32, return_exceptions: bool = False, **kwargs: Any) -> List[Union["Cube", BaseException]]:
+        """
+        Open many cubes concurrently.
+
+        Parameters
+        ----------
+        items : Iterable[Union[Tuple[Any, ...], Dict[str, Any]]]
+            The cubes to open: tuples of positional arguments of `Cube`, e.g. (scroll_id, energy, resolution, z, y, x), or dictionaries of keyword arguments.
+        max_concurrency : int, default = 32
+            Maximum number of cubes being opened at the same time.
+        return_exceptions : bool, default = False
+            If True, the exceptions of the cubes that cannot be opened are returned in place of the cubes instead of being raised.
+        **kwargs : Any
+            Keyword arguments shared by all cubes, e.g. `cache=True`.
+
+        Returns
+        -------
+        List[Union[Cube, BaseException]]
+            The cubes, in the same order as `items`.
+        """
+        def factory(item: Union[Tuple[Any, ...], Dict[str, Any]]) -> Awaitable["Cube"]:
+            if isinstance(item, dict):
+                return cls.open(**{**kwargs, **item})
+            return cls.open(*item, **kwargs)
+        return await _gather_limited([functools.partial(factory, item) for item in items], max_concurrency, return_exceptions)
+
+    def _configure(self, scroll_id: int, energy: int, resolution: float, z: int, y: int, x: int, cache: bool = False, cache_dir : Optional[os.PathLike] = None, normalize: bool = False) -> None:
+        """
+        Resolve the URLs and the cache directory of the cube, without downloading the data.
+        """
         self.scroll_id = scroll_id
         install_path = get_installation_path()
-        self.configs = os.path.join(install_path, 'vesuvius', 'configs', f'cubes.yaml')
+        self.configs = os.path.join(install_path, 'vesuvius', 'configs', f'cubes.jsonl')
         self.energy = energy
         self.resolution = resolution
         self.z, self.y, self.x = z, y, x
         self.volume_url, self.mask_url = self.get_url_from_yaml()
         self.aws = is_aws_ec2_instance()
+        # Cubes are read directly from the local mount on AWS, without cache
+        self.cache = False
         if self.aws is False:
             self.cache = cache
             if self.cache:
@@ -705,14 +1588,72 @@ class Cube:
                 os.makedirs(self.cache_dir, exist_ok=True)
         self.normalize = normalize
 
-        self.volume, self.mask = self.load_data()
+    def _finish_load(self, volume: NDArray, mask: NDArray) -> None:
+        _cube_cache.put(self._cache_key, (volume, mask))
 
         if self.normalize:
-            self.max_dtype = get_max_value(self.volume.dtype)
+            self.max_dtype = get_max_value(volume.dtype)
         
+    def __getstate__(self) -> Dict[str, Any]:
+        state = self.__dict__.copy()
+        state['_volume'] = None
+        state['_mask'] = None
+        state.pop('_lock', None)
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        self._lock = threading.RLock()
+        _open_objects.add(self)
+
+    def _reset_handles(self) -> None:
+        """
+        Drop the arrays assigned to this cube, so that they are taken from the process-wide cube cache again.
+        """
+        self._lock = threading.RLock()
+        self._volume = None
+        self._mask = None
+
+    @property
+    def _cache_key(self) -> Tuple[str, str]:
+        return (self.volume_url, self.mask_url)
+
+    def _arrays(self) -> Tuple[NDArray, NDArray]:
+        """
+        Get the volume and the mask from the process-wide cube cache, reloading them if they were evicted.
+        """
+        volume, mask = self._volume, self._mask
+        if volume is not None and mask is not None:
+            return volume, mask
+        volume, mask = _cube_cache.get_or_load(self._cache_key, self.load_data)
+        return self._volume if self._volume is not None else volume, self._mask if self._mask is not None else mask
+
+    @property
+    def volume(self) -> NDArray:
+        """
+        The volume data. It is kept in the process-wide cube cache and reloaded (from the cache directory when caching is enabled) after an eviction.
+        """
+        return self._arrays()[0]
+
+    @volume.setter
+    def volume(self, value: NDArray) -> None:
+        # Assigned arrays belong to this cube and are never evicted
+        self._volume = value
+
+    @property
+    def mask(self) -> NDArray:
+        """
+        The mask data. It is kept in the process-wide cube cache and reloaded (from the cache directory when caching is enabled) after an eviction.
+        """
+        return self._arrays()[1]
+
+    @mask.setter
+    def mask(self, value: NDArray) -> None:
+        self._mask = value
+
     def get_url_from_yaml(self) -> str:
         """
-        Retrieve the URLs for the volume and mask data from the YAML configuration file.
+        Retrieve the URLs for the volume and mask data from the cubes catalog.
 
         Returns
         -------
@@ -724,9 +1665,8 @@ class Cube:
         ValueError
             If the URLs cannot be found in the configuration.
         """
-        # Load the YAML file
-        with open(self.configs, 'r') as file:
-            data: Dict[str, Any] = yaml.safe_load(file)
+        # Load the catalog
+        data: Dict[str, Any] = list_cubes()
         
         # Retrieve the URL for the given id, energy, and resolution
         base_url: str = data.get(self.scroll_id, {}).get(self.energy, {}).get(self.resolution, {}).get(f"{self.z:05d}_{self.y:05d}_{self.x:05d}")
@@ -740,6 +1680,7 @@ class Cube:
         mask_url = os.path.join(base_url, mask_filename)
         return volume_url, mask_url
     
+    @traced("Cube.load_data")
     def load_data(self) -> Tuple[NDArray, NDArray]:
         """
         Load the data for the cube.
@@ -754,54 +1695,63 @@ class Cube:
         requests.RequestException
             If there is an error downloading the data from the server.
         """
-        output = []
-        for url in [self.volume_url, self.mask_url]:
-            if self.aws:
-                array, _ = nrrd.read(url)
-            else:
-                if self.cache:
-                    # Extract the relevant path after "instance-annotated-cubes"
-                    path_after_finished_cubes = url.split('instance-annotated-cubes/')[1]
-                    # Extract the directory structure and the filename
-                    dir_structure, filename = os.path.split(path_after_finished_cubes)
+        return self._load_array(self.volume_url), self._load_array(self.mask_url)
 
-                    # Create the full directory path in the temp_dir
-                    full_temp_dir_path = os.path.join(self.cache_dir, dir_structure)
+    def _cache_file(self, url: str) -> str:
+        """
+        Get the path of a file of the cube in the cache directory, creating its parent directories.
+        """
+        # Extract the relevant path after "instance-annotated-cubes"
+        path_after_finished_cubes = url.split('instance-annotated-cubes/')[1]
+        # Extract the directory structure and the filename
+        dir_structure, filename = os.path.split(path_after_finished_cubes)
 
-                    # Make sure the directory structure exists
-                    os.makedirs(full_temp_dir_path, exist_ok=True)
+        # Create the full directory path in the temp_dir
+        full_temp_dir_path = os.path.join(self.cache_dir, dir_structure)
 
-                    # Create the full path for the temporary file
-                    temp_file_path = os.path.join(full_temp_dir_path, filename)
+        # Make sure the directory structure exists
+        os.makedirs(full_temp_dir_path, exist_ok=True)
 
-                    # Check if the file already exists in the cache
-                    if os.path.exists(temp_file_path):
-                        # Read the NRRD file from the cache
-                        array, _ = nrrd.read(temp_file_path)
+        # Create the full path for the temporary file
+        return os.path.join(full_temp_dir_path, filename)
 
-                    else:
-                        # Download the remote file
-                        response = requests.get(url)
-                        response.raise_for_status()  # Ensure we notice bad responses
-                        # Write the downloaded content to the temporary file with the same directory structure and filename
-                        with open(temp_file_path, 'wb') as tmp_file:
-                            tmp_file.write(response.content)
+    def _load_array(self, url: str) -> NDArray:
+        """
+        Read one NRRD file of the cube, from the cache directory when available.
+        """
+        import nrrd
+        if self.aws:
+            array, _ = nrrd.read(url)
+            return array
 
-                            array, _ = nrrd.read(temp_file_path)
+        if self.cache:
+            temp_file_path = self._cache_file(url)
 
-                else:
-                    response = requests.get(url)
+            # Check if the file already exists in the cache
+            if not os.path.exists(temp_file_path):
+                # Download the remote file
+                with span("Cube.download", url=url):
+                    response = get_metadata_cache().session.get(url)
                     response.raise_for_status()  # Ensure we notice bad responses
-                    with tempfile.NamedTemporaryFile(delete=False) as tmp_file:
-                        tmp_file.write(response.content)
-                        temp_file_path = tmp_file.name
-                        # Read the NRRD file from the temporary file
-
-                        array, _ = nrrd.read(temp_file_path)
-
-            output.append(array)
-
-        return output[0], output[1]
+                # Write the downloaded content with the same directory structure and filename,
+                # atomically so that concurrent downloads of the same cube never see a partial file
+                atomic_write(temp_file_path, response.content)
+
+            # Read the NRRD file from the cache
+            array, header = nrrd.read(temp_file_path)
+            _cube_headers.put(url, header)
+            return array
+
+        with span("Cube.download", url=url):
+            response = get_metadata_cache().session.get(url)
+            response.raise_for_status()  # Ensure we notice bad responses
+        with tempfile.NamedTemporaryFile(suffix='.nrrd') as tmp_file:
+            tmp_file.write(response.content)
+            tmp_file.flush()
+            # Read the NRRD file from the temporary file
+            array, header = nrrd.read(tmp_file.name)
+        _cube_headers.put(url, header)
+        return array
 
 
     def __getitem__(self, idx: Tuple[int, ...]) -> NDArray:
@@ -839,24 +1789,40 @@ class Cube:
         """
         Activate caching for the cube data.
 
+        Arrays already in memory are written to the cache directory, with the NRRD header of the downloaded
+        files, instead of being downloaded again. On AWS cubes are read from the local mount and never cached.
+
         Parameters
         ----------
         cache_dir : Optional[os.PathLike], default = None
             Directory where cached files are stored.
         """
-        if not self.cache:
-            if cache_dir is None:
-                self.cache_dir = Path.home() / 'vesuvius' / 'annotated-instances'
-            else:
-                self.cache_dir = Path(cache_dir)
-            self.cache = True
-            self.volume, self.mask = self.load_data()
+        if self.cache or self.aws:
+            return
+        if cache_dir is None:
+            self.cache_dir = Path.home() / 'vesuvius' / 'annotated-instances'
+        else:
+            self.cache_dir = Path(cache_dir)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.cache = True
+        arrays = (self._volume, self._mask)
+        if arrays[0] is None or arrays[1] is None:
+            arrays = _cube_cache.get(self._cache_key)
+        if arrays is None:
+            return
+        for url, array in zip((self.volume_url, self.mask_url), arrays):
+            path = self._cache_file(url)
+            header = _cube_headers.get(url)
+            # Without the original header the file is downloaded on the next load instead
+            if header is not None and not os.path.exists(path):
+                import nrrd
+                buffer = BytesIO()
+                nrrd.write(buffer, array, header)
+                atomic_write(path, buffer.getvalue())
 
     def deactivate_caching(self) -> None:
         """
-        Deactivate caching for the cube data.
+        Deactivate caching for the cube data. Arrays already in memory are kept.
         """
         if self.cache:
             self.cache = False
-            self.volume, self.mask = self.load_data()
-
@@ -0,0 +1,227 @@
+import os
+import re
+import threading
+import functools
+import numpy as np
+import pytest
+import zarr
+import nrrd
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+from PIL import Image
+
+SEGMENT_ID = 20230827161847
+LEVELS = 3
+CHUNKS = 16
+CUBES = [(0, 0, 0), (256, 0, 0)]
+
+
+def write_ome_zarr(path: str, array: np.ndarray, levels: int = LEVELS, chunks: int = CHUNKS) -> str:
+    """
+    Write a zarr v2 OME-Zarr group whose level k is `array[::2**k, ::2**k, ::2**k]`.
+    """
+    root = zarr.open_group(path, mode='w')
+    datasets = []
+    for level in range(levels):
+        step = 2 ** level
+        root.create_dataset(str(level), data=array[::step, ::step, ::step], chunks=(chunks,) * 3)
+        datasets.append({"path": str(level), "coordinateTransformations": [{"type": "scale", "scale": [float(step)] * 3}]})
+    root.attrs["multiscales"] = [{
+        "version": "0.4",
+        "axes": [{"name": name, "type": "space"} for name in "zyx"],
+        "datasets": datasets,
+    }]
+    return path
+
+
+@pytest.fixture(scope="session")
+def reference() -> np.ndarray:
+    """
+    The full-resolution data of the scroll fixture: random papyrus in the top half, empty background below.
+    """
+    rng = np.random.default_rng(0)
+    array = rng.integers(1, 256, size=(64, 80, 96), dtype=np.uint8)
+    array[:, 48:, :] = 0
+    return array
+
+
+def cube_name(z: int, y: int, x: int) -> str:
+    return f"{z:05d}_{y:05d}_{x:05d}"
+
+
+@pytest.fixture(scope="session")
+def cube_arrays():
+    """
+    The (volume, mask) arrays of the annotated cubes, by cube name.
+    """
+    arrays = {}
+    for i, position in enumerate(CUBES):
+        volume = np.random.default_rng(10 + i).integers(0, 65536, size=(12, 10, 8), dtype=np.uint16)
+        arrays[cube_name(*position)] = (volume, (volume > 30000).astype(np.uint8))
+    return arrays
+
+
+@pytest.fixture(scope="session")
+def data_dir(tmp_path_factory: pytest.TempPathFactory, reference: np.ndarray, cube_arrays) -> str:
+    """
+    A directory holding a scroll volume, a segment volume with its ink label and annotated cubes, laid out as on the data server.
+    """
+    root = str(tmp_path_factory.mktemp("data"))
+    write_ome_zarr(os.path.join(root, "scroll.zarr"), reference)
+    os.makedirs(os.path.join(root, "segments"))
+    write_ome_zarr(os.path.join(root, "segments", f"{SEGMENT_ID}.zarr"), reference[:8])
+    label = np.zeros(reference.shape[1:], dtype=np.uint8)
+    label[8:24, 16:48] = 255
+    Image.fromarray(label).save(os.path.join(root, "segments", f"{SEGMENT_ID}_inklabels.png"))
+    header = {"encoding": "gzip", "space": "left-posterior-superior", "space directions": np.eye(3) * 7.91, "kinds": ["domain"] * 3}
+    for name, (volume, mask) in cube_arrays.items():
+        os.makedirs(os.path.join(root, "instance-annotated-cubes", "s1", name))
+        nrrd.write(os.path.join(root, "instance-annotated-cubes", "s1", name, f"{name}_volume.nrrd"), volume, header)
+        nrrd.write(os.path.join(root, "instance-annotated-cubes", "s1", name, f"{name}_mask.nrrd"), mask, header)
+    return root
+
+
+@pytest.fixture(scope="session")
+def scroll_path(data_dir: str) -> str:
+    return os.path.join(data_dir, "scroll.zarr")
+
+
+@pytest.fixture(scope="session")
+def segment_path(data_dir: str) -> str:
+    return os.path.join(data_dir, "segments", f"{SEGMENT_ID}.zarr")
+
+
+@pytest.fixture(autouse=True)
+def isolated_state(tmp_path_factory: pytest.TempPathFactory, monkeypatch: pytest.MonkeyPatch):
+    """
+    Keep the catalogs and the metadata cache in a fresh directory, and never probe EC2 or refresh the catalogs over the network.
+    """
+    from vesuvius.paths import local, metadata, utils
+    state = tmp_path_factory.mktemp("state")
+    configs = str(state / "configs")
+    os.makedirs(configs)
+    monkeypatch.setattr(utils, "_aws_ec2_instance", False)
+    monkeypatch.setattr(utils, "_catalog_checked", True)
+    monkeypatch.setattr(utils, "get_configs_path", lambda: configs)
+    monkeypatch.setattr(local, "get_configs_path", lambda: configs)
+    metadata.configure_metadata_cache(state / "metadata")
+
+
+@pytest.fixture
+def scroll(scroll_path: str):
+    from vesuvius import Volume
+    return Volume(type="scroll", scroll_id=1, energy=54, resolution=7.91, domain="local", path=scroll_path)
+
+
+@pytest.fixture
+def segment(segment_path: str):
+    from vesuvius import Volume
+    return Volume(type="segment", scroll_id=1, energy=54, resolution=7.91, segment_id=SEGMENT_ID, domain="local", path=segment_path)
+
+
+class _Handler(SimpleHTTPRequestHandler):
+    """
+    Static file handler with byte ranges and ETags, counting the GET requests of every path.
+    """
+    def log_message(self, *args) -> None:
+        pass
+
+    def _file(self):
+        path = self.translate_path(self.path)
+        if not os.path.isfile(path):
+            self.send_error(404)
+            return None
+        return path
+
+    def _etag(self, path: str) -> str:
+        stat = os.stat(path)
+        return f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+
+    def do_HEAD(self) -> None:
+        path = self._file()
+        if path is None:
+            return
+        self.send_response(200)
+        self.send_header("Content-Length", str(os.path.getsize(path)))
+        self.send_header("ETag", self._etag(path))
+        self.end_headers()
+
+    def do_GET(self) -> None:
+        server = self.server
+        with server.lock:
+            server.requests.append(self.path)
+        path = self._file()
+        if path is None:
+            return
+        etag = self._etag(path)
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        with open(path, "rb") as file:
+            data = file.read()
+        match = re.match(r"bytes=(\d*)-(\d*)", self.headers.get("Range", ""))
+        if match:
+            start, end = match.groups()
+            if start == "":
+                start, end = len(data) - int(end), len(data) - 1
+            else:
+                start, end = int(start), int(end) if end else len(data) - 1
+            body = data[start:end + 1]
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{len(data)}")
+        else:
+            body = data
+            self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture(scope="session")
+def http_server(data_dir: str):
+    """
+    An HTTP server over `data_dir`. `server.url` is its base URL, `server.requests` the paths of the GET requests.
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", 0), functools.partial(_Handler, directory=data_dir))
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.requests = []
+    server.url = f"http://127.0.0.1:{server.server_address[1]}"
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def remote_catalog(http_server, monkeypatch: pytest.MonkeyPatch):
+    """
+    Point the scrolls catalog at the HTTP server, so volumes are opened with `domain="dl.ash2txt"`.
+    """
+    import vesuvius.volume
+    catalog = {"1": {"54": {"7.91": {
+        "volume": f"{http_server.url}/scroll.zarr",
+        "segments": {str(SEGMENT_ID): f"{http_server.url}/segments/{SEGMENT_ID}.zarr/"},
+    }}}}
+    monkeypatch.setattr(vesuvius.volume, "list_files", lambda scroll_id=None: catalog)
+    with http_server.lock:
+        http_server.requests.clear()
+    return catalog
+
+
+@pytest.fixture
+def remote_cubes(http_server, monkeypatch: pytest.MonkeyPatch):
+    """
+    Point the cubes catalog at the HTTP server, and start from an empty cube cache.
+    """
+    import vesuvius.volume
+    catalog = {1: {54: {7.91: {cube_name(*position): f"{http_server.url}/instance-annotated-cubes/s1/{cube_name(*position)}" for position in CUBES}}}}
+    monkeypatch.setattr(vesuvius.volume, "list_cubes", lambda: catalog)
+    vesuvius.volume._cube_cache.clear()
+    with http_server.lock:
+        http_server.requests.clear()
+    yield catalog
+    vesuvius.volume._cube_cache.clear()
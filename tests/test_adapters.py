@@ -0,0 +1,60 @@
+import pickle
+import numpy as np
+import pytest
+from vesuvius import Volume
+from vesuvius import adapters
+from vesuvius.adapters import block_shape
+
+pytest.importorskip("dask.array")
+
+
+def test_blocks_cover_whole_chunks(scroll):
+    assert block_shape(scroll) == (16, 16, 16)
+    assert block_shape(scroll, chunks=20) == (32, 32, 32)
+    assert block_shape(scroll, chunks=(1, 64, 1000)) == (16, 64, 96)
+    assert block_shape(scroll, level=2, chunks=64) == (16, 20, 24)
+    with pytest.raises(ValueError):
+        block_shape(scroll, chunks=(16, 16))
+
+
+def test_dask_arrays_read_the_volume(scroll, reference):
+    array = scroll.to_dask()
+    assert array.shape == reference.shape and array.dtype == np.uint8
+    assert array.chunksize == (16, 16, 16)
+    assert np.array_equal(array[5:40, 3, 10:90:3].compute(), reference[5:40, 3, 10:90:3])
+    assert int(array.sum().compute()) == int(reference.sum(dtype=np.int64))
+    assert scroll.to_dask().name == array.name and scroll.to_dask(level=1).name != array.name
+
+    coarse = scroll.to_dask(level=1, chunks=32)
+    assert coarse.chunks == ((32,), (32, 8), (32, 16))
+    assert np.array_equal(coarse.compute(), reference[::2, ::2, ::2])
+
+
+def test_normalized_dask_arrays(scroll_path, reference):
+    volume = Volume(type="scroll", scroll_id=1, energy=54, resolution=7.91, domain="local", path=scroll_path, normalize=True)
+    array = volume.to_dask(level=2)
+    assert array.dtype == np.float64
+    assert np.allclose(array.compute(), reference[::4, ::4, ::4] / 255)
+
+
+def test_blocks_share_one_volume_per_process(scroll, reference):
+    blocks = adapters._VolumeBlocks(scroll, 0)
+    first, second = pickle.loads(pickle.dumps(blocks)), pickle.loads(pickle.dumps(blocks))
+    assert first.volume is second.volume and first.key == blocks.key
+    assert np.array_equal(first[(slice(0, 4), slice(0, 4), slice(0, 4))], reference[0:4, 0:4, 0:4])
+
+
+def test_process_scheduler(scroll, reference):
+    array = scroll.to_dask(chunks=32)
+    total = array.astype(np.int64).sum().compute(scheduler="processes", num_workers=2)
+    assert total == reference.sum(dtype=np.int64)
+
+
+def test_xarray_coordinates(scroll, reference):
+    pytest.importorskip("xarray")
+    array = scroll.to_xarray(level=1)
+    assert array.dims == ("z", "y", "x") and array.name == "scroll_1"
+    assert np.array_equal(array.coords["z"].values, np.arange(32) * 2.0)
+    assert array.attrs["level"] == 1 and array.attrs["scale"] == [2.0, 2.0, 2.0]
+    # Selections by physical coordinates
+    assert np.array_equal(array.sel(z=10.0, y=slice(0, 6)).values, reference[10, 0:7:2, ::2])
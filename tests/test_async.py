@@ -0,0 +1,57 @@
+import asyncio
+import numpy as np
+from vesuvius import Volume, Cube
+from conftest import SEGMENT_ID, CUBES, cube_name
+
+
+def test_open_matches_the_constructor(remote_catalog, reference):
+    volume = asyncio.run(Volume.open(type="scroll", scroll_id=1, energy=54, resolution=7.91, domain="dl.ash2txt"))
+    assert volume.shape(0) == reference.shape and len(volume.data) == 3
+    assert np.array_equal(volume[3:9, 10:20, 40:50], reference[3:9, 10:20, 40:50])
+
+    segment = asyncio.run(Volume.open(SEGMENT_ID))
+    assert segment.type == "segment"
+    assert segment.inklabel.shape == reference.shape[1:] and segment.inklabel.max() == 255
+
+
+def test_open_local_volumes(scroll_path, reference):
+    volume = asyncio.run(Volume.open(type="scroll", scroll_id=1, energy=54, resolution=7.91, domain="local", path=scroll_path))
+    assert np.array_equal(volume[0:4, 0:4, 0:4], reference[0:4, 0:4, 0:4])
+
+
+def test_open_many_keeps_the_order_and_reports_failures(remote_catalog, reference):
+    items = [SEGMENT_ID, 123, {"type": "scroll", "scroll_id": 1, "energy": 54, "resolution": 7.91}]
+    volumes = asyncio.run(Volume.open_many(items, max_concurrency=2, return_exceptions=True, domain="dl.ash2txt"))
+    assert volumes[0].segment_id == SEGMENT_ID
+    assert isinstance(volumes[1], Exception)
+    assert volumes[2].type == "scroll" and volumes[2].shape(0) == reference.shape
+
+
+def test_open_many_bounds_the_concurrency(monkeypatch):
+    running = []
+    peak = []
+
+    async def fake_open(cls, *args, **kwargs):
+        running.append(1)
+        peak.append(len(running))
+        await asyncio.sleep(0.01)
+        running.pop()
+        return args
+
+    monkeypatch.setattr(Volume, "open", classmethod(fake_open))
+    opened = asyncio.run(Volume.open_many(range(10), max_concurrency=3))
+    assert opened == [(i,) for i in range(10)]
+    assert max(peak) == 3
+
+
+def test_cubes_open_concurrently(remote_cubes, cube_arrays):
+    cubes = asyncio.run(Cube.open_many([(1, 54, 7.91, *position) for position in CUBES] + [(1, 54, 7.91, 1, 2, 3)], return_exceptions=True))
+    for cube, position in zip(cubes, CUBES):
+        volume, mask = cube_arrays[cube_name(*position)]
+        assert np.array_equal(cube.volume, volume) and np.array_equal(cube.mask, mask)
+    assert isinstance(cubes[-1], ValueError)
+
+    cube = asyncio.run(Cube.open(1, 54, 7.91, *CUBES[0]))
+    volume, mask = cube[1:3, 2:4, 5]
+    assert np.array_equal(volume, cube_arrays[cube_name(*CUBES[0])][0][1:3, 2:4, 5])
+    assert np.array_equal(mask, cube_arrays[cube_name(*CUBES[0])][1][1:3, 2:4, 5])
@@ -0,0 +1,111 @@
+import os
+import stat
+import time
+import threading
+import multiprocessing
+import pytest
+from vesuvius.paths import utils
+from vesuvius.paths import atomic
+from vesuvius.paths.atomic import FileLock, atomic_write
+
+
+def test_atomic_write_replaces_the_file(tmp_path):
+    path = str(tmp_path / "catalog.jsonl")
+    atomic_write(path, "old")
+    atomic_write(path, b"new")
+    with open(path) as file:
+        assert file.read() == "new"
+    assert os.listdir(tmp_path) == ["catalog.jsonl"]
+
+
+@pytest.mark.skipif(os.name != "posix", reason="POSIX permissions")
+def test_atomic_write_keeps_the_permissions(tmp_path, monkeypatch):
+    path = str(tmp_path / "catalog.jsonl")
+    monkeypatch.setattr(atomic, "_umask", None)
+    umask = os.umask(0o022)
+    try:
+        atomic_write(path, "old")
+        assert stat.S_IMODE(os.stat(path).st_mode) == 0o644
+        os.chmod(path, 0o664)
+        atomic_write(path, "new")
+        assert stat.S_IMODE(os.stat(path).st_mode) == 0o664
+    finally:
+        os.umask(umask)
+
+
+def test_failed_writes_keep_the_old_file(tmp_path, monkeypatch):
+    path = str(tmp_path / "catalog.jsonl")
+    atomic_write(path, "old")
+
+    def fail(*args):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(os, "replace", fail)
+    with pytest.raises(OSError):
+        atomic_write(path, "new")
+    with open(path) as file:
+        assert file.read() == "old"
+    assert os.listdir(tmp_path) == ["catalog.jsonl"]
+
+
+def test_readers_never_see_a_partial_file(tmp_path):
+    path = str(tmp_path / "catalog.jsonl")
+    versions = ["a" * 1_000_000, "b" * 2_000_000]
+    atomic_write(path, versions[0])
+    stop = threading.Event()
+
+    def writer():
+        i = 0
+        while not stop.is_set():
+            i += 1
+            atomic_write(path, versions[i % 2])
+
+    thread = threading.Thread(target=writer)
+    thread.start()
+    try:
+        for _ in range(200):
+            with open(path) as file:
+                assert file.read() in versions
+    finally:
+        stop.set()
+        thread.join()
+
+
+def hold_lock(path, held, release):
+    with FileLock(path):
+        held.set()
+        release.wait(10)
+
+
+def test_file_lock_excludes_other_processes(tmp_path):
+    path = str(tmp_path / "catalog.lock")
+    context = multiprocessing.get_context("fork" if hasattr(os, "fork") else "spawn")
+    held, release = context.Event(), context.Event()
+    process = context.Process(target=hold_lock, args=(path, held, release))
+    process.start()
+    try:
+        assert held.wait(10)
+        lock = FileLock(path)
+        assert not lock.acquire(blocking=False)
+        release.set()
+        process.join(10)
+        assert lock.acquire(blocking=False)
+        lock.release()
+    finally:
+        release.set()
+        process.join(10)
+
+
+def test_concurrent_refreshes_wait_for_the_running_one(monkeypatch):
+    scraped = []
+    monkeypatch.setattr(utils, "scrape_website", lambda *args: scraped.append(args))
+    lock = utils.catalog_lock()
+    os.makedirs(os.path.dirname(lock.lock_path), exist_ok=True)
+    assert lock.acquire()
+    threading.Timer(0.3, lock.release).start()
+
+    start = time.monotonic()
+    utils.update_list("https://example.invalid/", "https://example.invalid/cubes/")
+    # The second caller waited for the first refresh and reused its result instead of scraping
+    assert time.monotonic() - start >= 0.25
+    assert scraped == []
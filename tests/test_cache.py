@@ -0,0 +1,113 @@
+import os
+import time
+import threading
+import nrrd
+import numpy as np
+import pytest
+import vesuvius.volume
+from vesuvius import Cube
+from vesuvius.volume import set_cube_cache_size
+from vesuvius.cache import LRUCache, nbytes
+from conftest import CUBES, cube_name
+
+
+def test_sizes_of_cached_values():
+    assert nbytes(np.zeros((4, 5), dtype=np.uint16)) == 40
+    assert nbytes((np.zeros(3, dtype=np.uint8), b"abcd", [bytearray(2)])) == 9
+    assert nbytes("not an array") == 0
+
+
+def test_least_recently_used_values_are_evicted():
+    evicted = []
+    cache = LRUCache(100, on_evict=lambda key, value: evicted.append(key))
+    for key in "abc":
+        cache.put(key, bytes(40))
+    # "a" was evicted to make room for "c"
+    assert evicted == ["a"] and list(cache._entries) == ["b", "c"] and cache.nbytes == 80
+    cache.get("b")
+    cache.put("d", bytes(40))
+    assert evicted == ["a", "c"] and "b" in cache
+
+    # Replacing a value updates the accounting, values larger than the budget are not cached
+    cache.put("b", bytes(10))
+    assert cache.nbytes == 50
+    cache.put("e", bytes(101))
+    assert "e" not in cache and cache.nbytes == 50
+
+    # Popped values are not reported as evicted
+    assert len(cache.pop("b")) == 10
+    cache.max_bytes = 0
+    assert evicted == ["a", "c", "d"] and len(cache) == 0 and cache.nbytes == 0
+    assert cache.stats() == {"entries": 0, "nbytes": 0, "max_bytes": 0, "hits": 1, "misses": 0, "evictions": 3}
+
+
+def test_concurrent_loads_of_a_key_run_once():
+    cache = LRUCache(1 << 20)
+    calls = []
+
+    def loader():
+        calls.append(1)
+        time.sleep(0.05)
+        return np.arange(10)
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_load("key", loader))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1 and all(result is results[0] for result in results)
+    assert cache._loading == {}
+
+    def fail():
+        raise RuntimeError("load failed")
+
+    with pytest.raises(RuntimeError):
+        cache.get_or_load("failing", fail)
+    assert cache._loading == {} and "failing" not in cache
+
+
+def cube_downloads(http_server):
+    with http_server.lock:
+        return [path for path in http_server.requests if path.endswith(".nrrd")]
+
+
+def test_cubes_are_shared_and_reloaded_after_eviction(remote_cubes, http_server, cube_arrays):
+    volume, mask = cube_arrays[cube_name(*CUBES[0])]
+    first = Cube(1, 54, 7.91, *CUBES[0])
+    second = Cube(1, 54, 7.91, *CUBES[0])
+    assert second.volume is first.volume
+    assert len(cube_downloads(http_server)) == 2
+    assert vesuvius.volume._cube_cache.nbytes == volume.nbytes + mask.nbytes
+
+    # A budget of one cube evicts the other on every switch
+    set_cube_cache_size(volume.nbytes + mask.nbytes)
+    try:
+        other = Cube(1, 54, 7.91, *CUBES[1])
+        assert len(vesuvius.volume._cube_cache) == 1
+        assert np.array_equal(first.volume, volume) and np.array_equal(first.mask, mask)
+        assert len(cube_downloads(http_server)) == 6
+        assert np.array_equal(other.volume, cube_arrays[cube_name(*CUBES[1])][0])
+        assert vesuvius.volume.cache_stats()["cubes"]["evictions"] >= 2
+    finally:
+        set_cube_cache_size(vesuvius.volume.CUBE_CACHE_BYTES)
+
+
+def test_activate_caching_writes_the_arrays_in_memory(remote_cubes, http_server, data_dir, tmp_path):
+    name = cube_name(*CUBES[0])
+    # The first load reads the files from a cache directory, which records their NRRD headers
+    cached = Cube(1, 54, 7.91, *CUBES[0], cache=True, cache_dir=tmp_path / "first")
+    cube = Cube(1, 54, 7.91, *CUBES[0])
+    downloads = len(cube_downloads(http_server))
+
+    cube.activate_caching(tmp_path / "second")
+    assert len(cube_downloads(http_server)) == downloads
+    for suffix in ("volume", "mask"):
+        original = os.path.join(data_dir, "instance-annotated-cubes", "s1", name, f"{name}_{suffix}.nrrd")
+        written = tmp_path / "second" / "s1" / name / f"{name}_{suffix}.nrrd"
+        array, header = nrrd.read(str(written))
+        original_array, original_header = nrrd.read(original)
+        assert np.array_equal(array, original_array)
+        assert header["encoding"] == original_header["encoding"]
+        assert np.array_equal(header["space directions"], original_header["space directions"])
+    assert np.array_equal(cached.volume, cube.volume)
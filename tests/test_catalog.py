@@ -0,0 +1,97 @@
+import os
+import json
+import threading
+import pytest
+import yaml
+from vesuvius.paths.catalog import (
+    CATALOG_FORMAT, CATALOG_VERSION, export_yaml, load_catalog, load_section, read_catalog, save_catalog, write_catalog,
+)
+
+CATALOG = {
+    "1": {"54": {"7.91": {"volume": "https://example.org/1.zarr", "segments": {"20230827161847": "https://example.org/s.zarr"}}}},
+    "1b": {"70": {"3.24": {"volume": None, "segments": {}}}},
+    2: {54: {7.91: {"cube": "https://example.org/cube"}}},
+}
+
+
+def test_header_points_at_every_section(tmp_path):
+    path = str(tmp_path / "scrolls.jsonl")
+    save_catalog(path, CATALOG)
+    with open(path, "rb") as file:
+        content = file.read()
+    header = json.loads(content.split(b"\n", 1)[0])
+    assert header["format"] == CATALOG_FORMAT and header["version"] == CATALOG_VERSION
+    assert [key for key, _, _ in header["sections"]] == ["1", "1b", 2]
+    for key, offset, length in header["sections"]:
+        assert content[offset + length:offset + length + 1] == b"\n"
+        assert json.loads(content[offset:offset + length]) is not None
+    assert load_catalog(path) == CATALOG
+
+
+def test_sections_are_loaded_alone(tmp_path):
+    path = str(tmp_path / "scrolls.jsonl")
+    save_catalog(path, CATALOG)
+    assert load_section(path, 1) == CATALOG["1"]
+    assert load_section(path, "2") == CATALOG[2]
+    assert load_section(path, "missing", default={}) == {}
+
+    # Corrupt the section of scroll 1b: the others are still readable, so it is never parsed
+    header = json.loads(open(path, "rb").readline())
+    _, offset, length = header["sections"][1]
+    with open(path, "r+b") as file:
+        file.seek(offset)
+        file.write(b"#" * length)
+    assert load_section(path, "1") == CATALOG["1"]
+    with pytest.raises(ValueError):
+        load_section(path, "1b")
+
+
+def test_other_files_are_rejected(tmp_path):
+    path = str(tmp_path / "scrolls.jsonl")
+    with open(path, "w") as file:
+        file.write(json.dumps({"format": CATALOG_FORMAT, "version": CATALOG_VERSION + 1, "sections": []}) + "\n")
+    with pytest.raises(ValueError):
+        load_catalog(path)
+
+
+def test_sections_match_the_file_being_replaced(tmp_path):
+    path = str(tmp_path / "scrolls.jsonl")
+    small = {"1": {"a": "x"}, "2": {"b": "y"}}
+    large = {"0": {"padding": "z" * 5000}, "1": {"a": "x" * 100}, "2": {"b": "y" * 100}}
+    save_catalog(path, small)
+    stop = threading.Event()
+    errors = []
+
+    def writer():
+        i = 0
+        while not stop.is_set():
+            i += 1
+            save_catalog(path, large if i % 2 else small)
+
+    thread = threading.Thread(target=writer)
+    thread.start()
+    try:
+        for _ in range(500):
+            try:
+                assert load_section(path, "2") in (small["2"], large["2"])
+            except ValueError as e:
+                errors.append(e)
+    finally:
+        stop.set()
+        thread.join()
+    assert errors == []
+
+
+def test_yaml_catalogs_are_converted_once(tmp_path):
+    configs = str(tmp_path)
+    with open(tmp_path / "scrolls.yaml", "w") as file:
+        yaml.safe_dump({1: {54: {7.91: {"volume": "v"}}}}, file)
+    assert read_catalog(configs, "scrolls", section=1) == {54: {7.91: {"volume": "v"}}}
+    assert os.path.exists(tmp_path / "scrolls.jsonl")
+
+    # Exporting over the shipped YAML file keeps the JSON lines file as the newer one
+    write_catalog(configs, "scrolls", {1: {54: {7.91: {"volume": "w"}}}})
+    export_yaml(configs, "scrolls", str(tmp_path / "scrolls.yaml"))
+    assert os.path.getmtime(tmp_path / "scrolls.jsonl") >= os.path.getmtime(tmp_path / "scrolls.yaml")
+    with open(tmp_path / "scrolls.yaml") as file:
+        assert yaml.safe_load(file) == {1: {54: {7.91: {"volume": "w"}}}}
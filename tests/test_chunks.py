@@ -0,0 +1,126 @@
+import time
+import numpy as np
+import pytest
+import zarr
+from concurrent.futures import ThreadPoolExecutor
+from vesuvius import Volume
+from vesuvius.chunks import ChunkCache, ChunkReader, compress_chunk, decompress_chunk, get_chunk_cache
+
+
+def chunk(value, size=16):
+    return np.full((size, size, size), value, dtype=np.uint8)
+
+
+def chunk_requests(http_server):
+    # Chunk files of zarr v2 levels are named "z.y.x"
+    with http_server.lock:
+        return [path for path in http_server.requests if path.rsplit("/", 1)[-1].count(".") == 2]
+
+
+def test_compression_round_trip():
+    array = np.arange(4096, dtype=np.uint16).reshape(16, 16, 16)
+    entry = compress_chunk(array[:, :, ::2])
+    assert len(entry[0]) < array.nbytes // 2
+    restored = decompress_chunk(entry)
+    assert np.array_equal(restored, array[:, :, ::2]) and not restored.flags.writeable
+
+
+def test_evicted_chunks_are_kept_compressed():
+    cache = ChunkCache(2 * 4096, 1 << 20)
+    for i in range(4):
+        cache.put(i, chunk(i))
+    assert list(cache.decoded._entries) == [2, 3]
+    assert list(cache.compressed._entries) == [0, 1]
+    # Compressed entries are far smaller than the decoded chunks
+    assert cache.compressed.nbytes < 4096
+
+    # A hit in the compressed tier moves the chunk back to the decoded tier, demoting the oldest one
+    restored = cache.get(0)
+    assert np.array_equal(restored, chunk(0)) and not restored.flags.writeable
+    assert list(cache.decoded._entries) == [3, 0]
+    assert set(cache.compressed._entries) == {0, 1, 2}
+    assert cache.get(9) is None
+    stats = cache.stats()
+    assert stats["decoded"]["hits"] == 0 and stats["compressed"]["hits"] == 1
+
+
+def test_chunks_larger_than_the_decoded_tier():
+    cache = ChunkCache(1000, 1 << 20)
+    cache.put("large", chunk(7))
+    assert "large" not in cache.decoded and "large" in cache.compressed
+    cache = ChunkCache(1000, 0)
+    cache.put("large", chunk(7))
+    assert cache.get("large") is None
+
+
+def test_reader_assembles_regions_from_chunks(scroll_path, reference):
+    cache = ChunkCache(1 << 20, 1 << 20)
+    reader = ChunkReader(zarr.open(f"{scroll_path}/0", mode="r"), "reference", cache)
+    assert np.array_equal(reader.read((slice(5, 40), slice(3, 70, 4), 17)), reference[5:40, 3:70:4, 17])
+    assert np.array_equal(reader.read((slice(40, 5, -3), -1, slice(None))), reference[40:5:-3, -1, :])
+    first, second = reader.read_many([(slice(0, 4), slice(0, 4), slice(0, 4)), (slice(60, 64), 79, slice(90, 96))])
+    assert np.array_equal(first, reference[0:4, 0:4, 0:4]) and np.array_equal(second, reference[60:64, 79, 90:96])
+    chunks = list(reader.read_chunks([(3, 4, 5), (0, 0, 0)]))
+    assert np.array_equal(chunks[0], reference[48:64, 64:80, 80:96]) and np.array_equal(chunks[1], reference[:16, :16, :16])
+
+
+def test_volumes_read_through_both_tiers(remote_catalog, http_server, reference):
+    get_chunk_cache(8192, 1 << 20).clear()
+    volume = Volume(type="scroll", scroll_id=1, energy=54, resolution=7.91, domain="dl.ash2txt", cache_pool=8192, chunk_cache=1 << 20)
+    region = (slice(0, 32), slice(0, 32), slice(0, 32))
+    assert np.array_equal(volume[region], reference[region])
+    fetched = len(chunk_requests(http_server))
+    assert fetched == 8
+
+    # Two chunks fit in the decoded tier, the other six are served from the compressed tier
+    assert np.array_equal(volume[region], reference[region])
+    assert len(chunk_requests(http_server)) == fetched
+    stats = volume._chunk_reader(0).cache.stats()
+    assert stats["decoded"]["entries"] == 2 and stats["compressed"]["hits"] >= 6
+    assert volume._chunk_reader(0).cache is get_chunk_cache(8192, 1 << 20)
+
+
+def test_claims_share_a_fetch():
+    cache = ChunkCache(1 << 20, 0)
+    future, owner = cache.claim("a")
+    assert owner
+    shared, other = cache.claim("a")
+    assert shared is future and not other
+    cache.resolve("a", future, chunk(1))
+    assert np.array_equal(shared.result(), chunk(1))
+    assert cache.stats()["in_flight"] == {"pending": 0, "shared": 1}
+
+    # A chunk cached since it was missed is not fetched again
+    cached, owner = cache.claim("a")
+    assert not owner and np.array_equal(cached.result(), chunk(1))
+
+    # Failed fetches reach every waiting reader, and the next claim fetches again
+    future, _ = cache.claim("b")
+    waiting, _ = cache.claim("b")
+    cache.resolve("b", future, error=OSError("unreachable"))
+    with pytest.raises(OSError):
+        waiting.result()
+    assert cache.claim("b")[1]
+
+
+def test_concurrent_readers_fetch_every_chunk_once(scroll_path, reference):
+    array = zarr.open(f"{scroll_path}/0", mode="r")
+    cache = ChunkCache(1 << 20, 0)
+    reader = ChunkReader(array, "scroll", cache)
+    fetched = []
+    fetch = reader._fetch
+
+    def slow_fetch(chunk_indices):
+        fetched.extend(chunk_indices)
+        time.sleep(0.1)
+        return fetch(chunk_indices)
+
+    reader._fetch = slow_fetch
+    regions = [(slice(0, 32), slice(0, 32), slice(0, 32)), (slice(16, 48), slice(16, 48), slice(16, 48))]
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        results = list(executor.map(reader.read, regions * 2))
+    for region, result in zip(regions * 2, results):
+        assert np.array_equal(result, reference[region])
+    # The regions overlap in one chunk, fetched once by whichever reader claimed it first
+    assert len(fetched) == len(set(fetched)) == 8 + 8 - 1
+    assert cache.stats()["in_flight"]["pending"] == 0 and cache.shared_fetches > 0
@@ -0,0 +1,63 @@
+import pickle
+import numpy as np
+from conftest import SEGMENT_ID
+from vesuvius import SegmentDataset
+
+
+def make_dataset(tmp_path, **kwargs):
+    options = dict(tile_size=16, z_start=2, z_depth=4, label_scale=4, min_ink=0.25, cache_dir=tmp_path / "tiles", num_workers=2)
+    return SegmentDataset([SEGMENT_ID, 999], **{**options, **kwargs})
+
+
+def test_tiles_skip_background_and_find_ink(remote_catalog, tmp_path):
+    dataset = make_dataset(tmp_path)
+    # The unknown segment is skipped, the empty bottom half of the segment is never indexed
+    assert dataset.segment_ids == [SEGMENT_ID]
+    assert len(dataset) == 3 * 6
+    assert set(dataset.tiles[:, 1]) == {0, 16, 32}
+    ink = {tuple(tile[1:]) for tile in dataset.tiles[dataset.ink_tiles]}
+    assert ink == {(0, 16), (0, 32), (16, 16), (16, 32)}
+    assert np.allclose(dataset.ink_fraction[dataset.ink_tiles], 0.5)
+
+
+def test_patches_and_labels(remote_catalog, tmp_path, reference):
+    dataset = make_dataset(tmp_path)
+    idx = int(dataset.ink_tiles[0])
+    _, y, x = dataset.tiles[idx]
+    patch, label = dataset[idx]
+    assert np.array_equal(patch, reference[2:6, y:y + 16, x:x + 16])
+    assert label.shape == (16, 16) and label.max() == 1 and label.min() == 0
+
+
+def test_balanced_sampling_and_prefetch(remote_catalog, tmp_path):
+    dataset = make_dataset(tmp_path)
+    indices = dataset.sample_indices(40, ink_ratio=0.25, seed=0)
+    assert len(indices) == 40
+    assert np.isin(indices, dataset.ink_tiles).sum() == 10
+
+    pairs = list(dataset.iterate(indices[:12], prefetch=3))
+    assert len(pairs) == 12
+    for idx, (patch, label) in zip(indices[:12], pairs):
+        expected_patch, expected_label = dataset[int(idx)]
+        assert np.array_equal(patch, expected_patch) and np.array_equal(label, expected_label)
+
+
+def test_labels_are_read_lazily_within_a_budget(remote_catalog, http_server, tmp_path, reference):
+    make_dataset(tmp_path)
+    with http_server.lock:
+        http_server.requests.clear()
+    # With the tile index cached, opening the dataset only checks that the label exists
+    dataset = make_dataset(tmp_path, label_cache=reference.shape[1] * reference.shape[2])
+    assert not [path for path in http_server.requests if path.endswith("_inklabels.png")]
+    assert dataset.volumes[0]._inklabel is None
+
+    idx = int(dataset.ink_tiles[0])
+    dataset[idx]
+    dataset[idx]
+    assert len([path for path in http_server.requests if path.endswith("_inklabels.png")]) == 1
+    assert dataset._labels.stats()["entries"] == 1 and dataset.volumes[0]._inklabel is None
+
+    # Labels larger than the budget are not kept, and workers start with an empty cache
+    small = pickle.loads(pickle.dumps(make_dataset(tmp_path, label_cache=1024)))
+    assert np.array_equal(small[idx][1], dataset[idx][1])
+    assert small._labels.stats()["nbytes"] == 0
@@ -0,0 +1,93 @@
+import os
+import pickle
+import signal
+import threading
+import multiprocessing
+import numpy as np
+import pytest
+from vesuvius import Volume
+from vesuvius.chunks import get_chunk_cache
+from vesuvius.paths import metadata
+
+pytestmark = pytest.mark.skipif(not hasattr(os, "fork"), reason="fork is not available")
+
+
+def run_in_child(function) -> int:
+    """
+    Run `function` in a forked child, killed after 20 seconds, and return its exit code (0 if it returned True).
+    """
+    pid = os.fork()
+    if pid == 0:
+        code = 1
+        try:
+            signal.alarm(20)
+            code = 0 if function() else 1
+        finally:
+            os._exit(code)
+    _, status = os.waitpid(pid, 0)
+    return os.waitstatus_to_exitcode(status)
+
+
+def read_region(volume):
+    return volume[5:9, 3:7, 2:30]
+
+
+def test_pickled_volumes_leave_the_data_out(remote_catalog, http_server, reference):
+    volume = Volume(type="scroll", scroll_id=1, energy=54, resolution=7.91, domain="dl.ash2txt")
+    volume[0:32, 0:32, 0:32]
+    state = pickle.dumps(volume)
+    assert len(state) < 20000
+
+    with http_server.lock:
+        http_server.requests.clear()
+    copy = pickle.loads(state)
+    assert np.array_equal(copy[0:20, 40:60, 50:70], reference[0:20, 40:60, 50:70])
+    # The copy reuses the resolved URL and metadata: only chunks are requested
+    assert not [path for path in http_server.requests if path.endswith((".zattrs", ".zarray"))]
+
+
+@pytest.mark.parametrize("domain", ["local", "dl.ash2txt"])
+def test_forked_workers_read_volumes_opened_by_the_parent(domain, remote_catalog, scroll_path, reference):
+    volume = Volume(type="scroll", scroll_id=1, energy=54, resolution=7.91, domain=domain, path=scroll_path)
+    assert np.array_equal(read_region(volume), reference[5:9, 3:7, 2:30])
+    with multiprocessing.get_context("fork").Pool(2) as pool:
+        results = pool.map(read_region, [volume] * 4)
+    assert all(np.array_equal(result, reference[5:9, 3:7, 2:30]) for result in results)
+
+
+def test_locks_held_by_parent_threads_are_reset_in_the_child(scroll, reference):
+    chunk_cache = get_chunk_cache(1 << 20, 0)
+    release = threading.Event()
+    held = threading.Event()
+
+    def hold():
+        with metadata._metadata_cache_lock, chunk_cache.decoded._lock, chunk_cache._in_flight_lock:
+            held.set()
+            release.wait()
+
+    thread = threading.Thread(target=hold)
+    thread.start()
+    held.wait()
+    try:
+        def child():
+            metadata.get_metadata_cache()
+            chunk_cache.put(("key", 0), np.zeros(4))
+            return np.array_equal(scroll[0:4, 0:4, 0:4], reference[0:4, 0:4, 0:4])
+        assert run_in_child(child) == 0
+    finally:
+        release.set()
+        thread.join()
+
+
+def test_in_flight_fetches_are_dropped_in_the_child():
+    cache = get_chunk_cache(1 << 20, 0)
+    future, owner = cache.claim(("pending", 0))
+    assert owner
+    try:
+        def child():
+            # The parent's fetch never completes in the child: the child fetches the chunk itself
+            _, child_owner = cache.claim(("pending", 0))
+            return child_owner
+        assert run_in_child(child) == 0
+    finally:
+        cache.resolve(("pending", 0), future, np.zeros(1))
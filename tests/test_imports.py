@@ -0,0 +1,62 @@
+import os
+import sys
+import json
+import subprocess
+import pytest
+from vesuvius.paths import utils
+
+SOURCE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+HEAVY_MODULES = ["tensorstore", "zarr", "numcodecs", "nrrd", "PIL", "requests", "aiohttp", "yaml", "numpy"]
+
+
+def loaded_modules(code):
+    probe = f"import sys, json\n{code}\nprint(json.dumps([m for m in {HEAVY_MODULES!r} if m in sys.modules]))"
+    result = subprocess.run([sys.executable, "-c", probe], env={**os.environ, "PYTHONPATH": SOURCE}, capture_output=True, text=True, check=True, timeout=120)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def test_import_loads_no_heavy_dependency():
+    assert loaded_modules("import vesuvius, vesuvius.paths\nfrom vesuvius import list_files") == []
+    # Names are resolved on first access
+    assert "tensorstore" in loaded_modules("import vesuvius\nvesuvius.Volume")
+
+
+def test_lazy_names():
+    import vesuvius
+    from vesuvius.volume import Volume
+    assert vesuvius.Volume is Volume
+    assert {"Volume", "query_catalog", "refresh_catalog", "tracing"} <= set(dir(vesuvius))
+    with pytest.raises(AttributeError):
+        vesuvius.missing
+
+
+@pytest.fixture
+def refreshes(monkeypatch):
+    calls = []
+    monkeypatch.setattr(utils, "update_list", lambda *urls: (calls.append(urls), utils.mark_catalog_refreshed()))
+    monkeypatch.setattr(utils, "_catalog_checked", False)
+    return calls
+
+
+def test_catalog_is_refreshed_once_per_process(refreshes):
+    utils.refresh_catalog()
+    utils.refresh_catalog()
+    assert len(refreshes) == 1
+    # A fresh catalog is not refreshed by the next process
+    utils._catalog_checked = False
+    utils.refresh_catalog()
+    assert len(refreshes) == 1 and utils.catalog_age() < 60
+
+
+def test_refresh_with_a_max_age(refreshes, monkeypatch):
+    utils.refresh_catalog()
+    utils.refresh_catalog(max_age=3600)
+    assert len(refreshes) == 1
+    utils.refresh_catalog(max_age=0)
+    assert len(refreshes) == 2
+
+    # An old catalog is refreshed on first use
+    monkeypatch.setattr(utils, "catalog_age", lambda: utils.CATALOG_MAX_AGE + 1)
+    utils._catalog_checked = False
+    utils.refresh_catalog()
+    assert len(refreshes) == 3
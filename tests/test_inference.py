@@ -0,0 +1,105 @@
+import numpy as np
+import pytest
+from vesuvius import inference
+from vesuvius.inference import blend_window, sliding_window_inference, tile_starts
+
+
+def identity(tiles):
+    return tiles.astype(np.float32)
+
+
+def test_tiles_cover_the_axis():
+    assert tile_starts(10, 16, 8) == [0]
+    assert tile_starts(64, 16, 16) == [0, 16, 32, 48]
+    assert tile_starts(40, 16, 12) == [0, 12, 24]
+    assert tile_starts(41, 16, 12) == [0, 12, 24, 25]
+
+
+def test_blend_windows():
+    window = blend_window((4, 6, 8))
+    assert window.shape == (4, 6, 8) and window.dtype == np.float32
+    assert window.min() > 0 and window[2, 3, 4] == window.max()
+    assert np.all(blend_window((3, 3), "constant") == 1)
+    with pytest.raises(ValueError):
+        blend_window((3,), "cubic")
+
+
+@pytest.mark.parametrize("blend", ["constant", "linear", "gaussian"])
+def test_overlapping_tiles_are_blended_in_place(scroll, reference, blend):
+    region = (slice(3, 50), slice(10, 47), slice(20, 90))
+    output = scroll.predict(identity, (16, 16, 24), overlap=(6, 4, 8), region=region, blend=blend, batch_size=5)
+    assert output.shape == (47, 37, 70)
+    assert np.allclose(output, reference[region], atol=1e-3)
+
+
+def test_channels_and_batches(scroll, reference):
+    calls = []
+
+    def model(tiles):
+        calls.append(len(tiles))
+        return np.stack([tiles, 2 * tiles.astype(np.float32)], axis=1)
+
+    output = sliding_window_inference(scroll, model, (32, 32, 32), overlap=8, batch_size=4)
+    assert output.shape == (2,) + reference.shape
+    assert np.allclose(output[0], reference, atol=1e-3) and np.allclose(output[1], 2 * reference.astype(np.float32), atol=1e-2)
+    assert max(calls) == 4 and sum(calls) == 3 * 3 * 4
+
+
+def test_tiles_larger_than_the_region_are_padded(scroll, reference):
+    region = (slice(0, 5), slice(0, 7), slice(0, 9))
+    output = scroll.predict(identity, (8, 8, 16), region=region)
+    assert np.allclose(output, reference[region], atol=1e-3)
+
+
+def test_two_dimensional_predictions(scroll, reference):
+    region = (slice(4, 12), slice(0, 48), slice(0, 96))
+    output = scroll.predict(lambda tiles: tiles.max(axis=1)[:, None], (8, 16, 32), overlap=(0, 4, 4), region=region, blend="constant")
+    assert output.shape == (1, 48, 96)
+    assert np.allclose(output[0], reference[region].max(axis=0), atol=1e-3)
+    with pytest.raises(ValueError):
+        scroll.predict(lambda tiles: tiles.max(axis=1), (4, 16, 32), region=region)
+
+
+def test_finished_blocks_are_written_once(scroll, reference, monkeypatch):
+    written = np.zeros(reference.shape, dtype=np.int64)
+    accumulators = []
+
+    class Recorder:
+        shape = reference.shape
+        dtype = np.float32
+
+        def __setitem__(self, key, value):
+            written[key] += 1
+
+    class Accumulator(inference._TileAccumulator):
+        def __init__(self, *args):
+            super().__init__(*args)
+            accumulators.append(self)
+
+    monkeypatch.setattr(inference, "_TileAccumulator", Accumulator)
+    sliding_window_inference(scroll, identity, (16, 16, 16), overlap=4, output=Recorder())
+    # Every voxel is written once
+    assert np.all(written == 1)
+    accumulator, = accumulators
+    assert accumulator.cells == {} and accumulator.nbytes == 0
+    # At most the overlap with the next band (4 slices) and one row of tiles are held, values and weights in float32
+    assert 0 < accumulator.peak_nbytes <= (4 * 80 * 96 + 16 * 16 * 96) * 8
+
+
+def test_output_dtype(scroll, reference):
+    region = (slice(0, 16), slice(0, 16), slice(0, 16))
+    output = scroll.predict(identity, (8, 8, 8), region=region, blend="constant", output_dtype=np.uint8, prefetch=1)
+    assert output.dtype == np.uint8 and np.array_equal(output, reference[region])
+
+
+def test_invalid_arguments(scroll):
+    with pytest.raises(ValueError):
+        scroll.predict(identity, (8, 8, 8), overlap=8)
+    with pytest.raises(ValueError):
+        scroll.predict(identity, (8, 8))
+    with pytest.raises(ValueError):
+        scroll.predict(identity, (8, 8, 8), region=(slice(0, 8, 2), slice(None), slice(None)))
+    with pytest.raises(ValueError):
+        scroll.predict(lambda tiles: tiles[:, :, :4, :4], (8, 8, 8), region=(slice(0, 8),) * 3)
+    with pytest.raises(ValueError):
+        scroll.predict(identity, (8, 8, 8), output=np.zeros((4, 4, 4)))
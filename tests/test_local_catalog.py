@@ -0,0 +1,81 @@
+import os
+import shutil
+import pytest
+from vesuvius import list_files, cubes
+from vesuvius.paths import local
+from vesuvius.paths.local import update_local_list, scan_directories
+
+
+@pytest.fixture
+def mounts(tmp_path):
+    scrolls = tmp_path / "scrolls"
+    for path in [
+        "1/volumes/54keV_7.91um.zarr/0/0",
+        "1/segments/54keV_7.91um/20230827161847.zarr/0",
+        "2/volumes/88keV_3.24um.zarr/0",
+        "2/paths/ignored",
+    ]:
+        os.makedirs(scrolls / path)
+    annotated = tmp_path / "annotated"
+    os.makedirs(annotated / "s1" / "00000_00000_00000")
+    return str(scrolls), str(annotated)
+
+
+def count_listings(monkeypatch):
+    listed = []
+    scandir = os.scandir
+
+    def counting(path):
+        listed.append(path)
+        return scandir(path)
+
+    monkeypatch.setattr(local.os, "scandir", counting)
+    return listed
+
+
+def test_catalog_of_local_mounts(mounts):
+    scrolls, annotated = mounts
+    update_local_list(scrolls, annotated)
+    catalog = list_files()
+    assert catalog["1"]["54"]["7.91"]["volume"] == os.path.join(scrolls, "1/volumes/54keV_7.91um.zarr")
+    assert catalog["1"]["54"]["7.91"]["segments"] == {"20230827161847": os.path.join(scrolls, "1/segments/54keV_7.91um/20230827161847.zarr")}
+    assert catalog["2"]["88"]["3.24"]["volume"] == os.path.join(scrolls, "2/volumes/88keV_3.24um.zarr")
+    assert cubes()[1][54][7.91]["00000_00000_00000"] == os.path.join(annotated, "s1/00000_00000_00000")
+
+
+def test_zarr_directories_are_not_descended(mounts, monkeypatch):
+    scrolls, _ = mounts
+    listed = count_listings(monkeypatch)
+    found = scan_directories(scrolls)
+    assert "1/volumes/54keV_7.91um.zarr" in found
+    assert not any(".zarr/" in path for path in found)
+    assert not any(".zarr" in os.path.basename(path) for path in listed)
+
+
+def test_unchanged_directories_are_not_listed_again(mounts, monkeypatch):
+    scrolls, annotated = mounts
+    update_local_list(scrolls, annotated)
+
+    listed = count_listings(monkeypatch)
+    update_local_list(scrolls, annotated)
+    assert listed == []
+
+    # Only the directory that changed is listed again
+    os.makedirs(os.path.join(scrolls, "1/segments/54keV_7.91um/20231005123336.zarr"))
+    update_local_list(scrolls, annotated)
+    assert listed == [os.path.join(scrolls, "1/segments/54keV_7.91um")]
+    assert set(list_files(1)["1"]["54"]["7.91"]["segments"]) == {"20230827161847", "20231005123336"}
+
+
+def test_removed_directories_leave_the_index(mounts):
+    scrolls, annotated = mounts
+    update_local_list(scrolls, annotated)
+    removed = os.path.join(scrolls, "2/paths/ignored")
+    index_path = os.path.join(local.get_configs_path(), "local_index.json")
+    assert removed in local.load_index(index_path)
+
+    shutil.rmtree(os.path.join(scrolls, "2"))
+    update_local_list(scrolls, annotated)
+    index = local.load_index(index_path)
+    assert not [path for path in index if path.startswith(os.path.join(scrolls, "2"))]
+    assert "2" not in list_files()
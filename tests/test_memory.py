@@ -0,0 +1,106 @@
+import numpy as np
+import pytest
+from vesuvius import Volume, memory
+from vesuvius.chunks import get_chunk_cache
+from vesuvius.volume import cache_stats
+
+
+@pytest.fixture
+def cgroup(tmp_path, monkeypatch):
+    """
+    A cgroup v2 hierarchy mounted at the root, as inside a container.
+    """
+    monkeypatch.setattr(memory, "CGROUP_ROOT", str(tmp_path))
+    return tmp_path
+
+
+@pytest.fixture
+def budget():
+    yield
+    memory.set_cache_budget(None)
+    memory.set_cache_processes(None)
+
+
+def test_cgroup_limits(cgroup, monkeypatch):
+    monkeypatch.setattr(memory, "physical_memory", lambda: 16 << 30)
+    (cgroup / "memory.max").write_text("max\n")
+    assert memory.cgroup_memory_limit() is None
+    assert memory.memory_limit() == 16 << 30
+
+    (cgroup / "memory.max").write_text(f"{2 << 30}\n")
+    (cgroup / "memory.current").write_text(f"{512 << 20}\n")
+    assert memory.cgroup_memory_limit() == 2 << 30
+    assert memory.cgroup_memory_usage() == 512 << 20
+    assert memory.memory_limit() == 2 << 30
+    assert memory.available_memory() <= (2 << 30) - (512 << 20)
+    info = memory.memory_info()
+    assert info["cgroup_limit"] == 2 << 30 and info["limit"] == 2 << 30
+
+
+def test_cgroup_v1_limits(cgroup):
+    (cgroup / "memory").mkdir()
+    (cgroup / "memory" / "memory.limit_in_bytes").write_text(f"{1 << 30}\n")
+    assert memory.cgroup_memory_limit() == 1 << 30
+    # cgroup v1 reports a huge number for "no limit"
+    (cgroup / "memory" / "memory.limit_in_bytes").write_text(f"{(1 << 63) - 4096}\n")
+    assert memory.cgroup_memory_limit() is None
+
+
+def test_budget_follows_the_memory_limit(monkeypatch, budget):
+    monkeypatch.setattr(memory, "memory_limit", lambda: 8 << 30)
+    assert memory.get_cache_budget() == int((8 << 30) * memory.CACHE_FRACTION)
+    monkeypatch.setattr(memory, "memory_limit", lambda: None)
+    assert memory.get_cache_budget() == memory.FALLBACK_CACHE_BYTES
+
+    budgets = []
+    memory.on_cache_budget_change(budgets.append)
+    assert memory.set_cache_budget(1 << 20) == 1 << 20 and memory.get_cache_budget() == 1 << 20
+    assert memory.set_cache_budget(None) == memory.FALLBACK_CACHE_BYTES
+    assert budgets[-2:] == [1 << 20, memory.FALLBACK_CACHE_BYTES]
+    memory._budget_listeners.remove(budgets.append)
+
+
+def test_volumes_follow_budget_changes(remote_catalog, reference, budget):
+    memory.set_cache_budget(32 << 20)
+    volume = Volume(type="scroll", scroll_id=1, energy=54, resolution=7.91, domain="dl.ash2txt")
+    sized = Volume(type="scroll", scroll_id=1, energy=54, resolution=7.91, domain="dl.ash2txt", cache_pool=1 << 20)
+    assert np.array_equal(volume[0:4, 0:4, 0:4], reference[0:4, 0:4, 0:4])
+    sized[0:4, 0:4, 0:4]
+    assert {32 << 20, 1 << 20} <= set(cache_stats()["tensorstore"]["pools"])
+    chunks = get_chunk_cache(None, 1 << 20)
+
+    memory.set_cache_budget(16 << 20)
+    # Volumes of the process-wide budget reopen their handles in a pool of the new size, others keep theirs
+    assert volume._data is None and sized._data is not None
+    assert np.array_equal(volume[4:8, 0:4, 0:4], reference[4:8, 0:4, 0:4])
+    stats = cache_stats()
+    assert stats["budget"] == 16 << 20
+    assert 16 << 20 in stats["tensorstore"]["pools"] and 32 << 20 not in stats["tensorstore"]["pools"]
+    assert chunks.decoded.max_bytes == 16 << 20
+
+
+def test_budget_is_split_among_worker_processes(remote_catalog, reference, monkeypatch, budget):
+    from test_fork import run_in_child
+    monkeypatch.setattr(memory, "memory_limit", lambda: 8 << 30)
+    full = int((8 << 30) * memory.CACHE_FRACTION)
+    assert memory.set_cache_processes(4) == full // 4 and memory.cache_processes() == 4
+    # An explicit budget is already per process
+    assert memory.set_cache_budget(1 << 20) == 1 << 20
+    memory.set_cache_budget(None)
+    memory.set_cache_processes(None)
+
+    # The decoded chunks of this volume go to the chunk cache of the process-wide budget
+    volume = Volume(type="scroll", scroll_id=1, energy=54, resolution=7.91, domain="dl.ash2txt", chunk_cache=1 << 20)
+    volume[0:4, 0:4, 0:4]
+    assert volume._chunk_reader(0).cache.decoded.max_bytes == full
+
+    def worker():
+        # What a DataLoader worker_init_fn does, for a main process and 8 workers
+        split = memory.set_cache_processes(9)
+        return (split == int(full / 9) and memory.get_cache_budget() == split
+                and np.array_equal(volume[4:8, 0:4, 0:4], reference[4:8, 0:4, 0:4])
+                and volume._chunk_reader(0).cache.decoded.max_bytes == split)
+
+    assert run_in_child(worker) == 0
+    # The parent keeps its own budget
+    assert memory.get_cache_budget() == full and volume._chunk_reader(0).cache.decoded.max_bytes == full
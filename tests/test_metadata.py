@@ -0,0 +1,59 @@
+import os
+import json
+import numpy as np
+import pytest
+import requests
+from vesuvius import Volume
+from vesuvius.paths.metadata import MetadataCache
+
+
+def metadata_requests(server):
+    with server.lock:
+        return [path for path in server.requests if path.endswith((".zattrs", ".zarray", "zarr.json"))]
+
+
+def test_volume_metadata_is_read_from_the_cache(remote_catalog, http_server, reference):
+    first = Volume(type="scroll", scroll_id=1, energy=54, resolution=7.91, domain="dl.ash2txt")
+    fetched = len(metadata_requests(http_server))
+    assert fetched > 0
+
+    second = Volume(type="scroll", scroll_id=1, energy=54, resolution=7.91, domain="dl.ash2txt")
+    assert len(metadata_requests(http_server)) == fetched
+    assert second.shape(0) == first.shape(0) == reference.shape
+    assert np.array_equal(second[10:20, 5:9, 30:60], reference[10:20, 5:9, 30:60])
+
+
+def test_expired_entries_are_revalidated(http_server, tmp_path):
+    url = f"{http_server.url}/scroll.zarr/.zattrs"
+    cache = MetadataCache(tmp_path / "revalidate", max_age=0)
+    document = cache.get_json(url)
+    entry = cache._load_entry(url)
+    assert entry["etag"]
+
+    # An unchanged document is revalidated with a 304, and served from a new cache over the same directory
+    fresh = MetadataCache(tmp_path / "revalidate", max_age=0)
+    assert fresh.get_json(url) == document
+    assert fresh._load_entry(url)["validated"] >= entry["validated"]
+
+
+def test_server_errors_serve_the_stale_copy(data_dir, http_server, tmp_path):
+    path = os.path.join(data_dir, "stale.json")
+    with open(path, "w") as file:
+        json.dump({"value": 1}, file)
+    url = f"{http_server.url}/stale.json"
+    try:
+        cache = MetadataCache(tmp_path / "stale", max_age=0)
+        assert cache.get_json(url) == {"value": 1}
+
+        # An unreachable server serves the stale copy
+        unreachable = url.replace(http_server.url, "http://127.0.0.1:9")
+        cache._store_entry(unreachable, dict(cache._load_entry(url), url=unreachable))
+        assert cache.get_json(unreachable) == {"value": 1}
+    finally:
+        os.remove(path)
+
+    # A missing document is not served stale: the error propagates and the entry is dropped
+    with pytest.raises(requests.HTTPError):
+        cache.get_json(url)
+    assert cache._load_entry(url) is None
+
@@ -0,0 +1,50 @@
+from io import BytesIO
+import numpy as np
+import pytest
+from PIL import Image
+from vesuvius import Volume
+from vesuvius.sampling import block_mean
+
+
+def test_preview_reads_the_coarsest_sufficient_level(scroll, reference, tmp_path):
+    # Level 1 is the coarsest level at least 40 pixels wide, its 40 x 48 slice is halved to fit
+    image = scroll.preview(axis=0, index=32, max_size=40, cache_dir=tmp_path)
+    assert image.dtype == np.uint8
+    assert np.array_equal(image, block_mean(reference[::2, ::2, ::2][16], 2))
+
+    # The full resolution slice is used when no level is coarse enough
+    assert np.array_equal(scroll.preview(axis=2, index=10, max_size=1024, cache=False), reference[:, :, 10])
+    # The middle slice by default
+    assert np.array_equal(scroll.preview(axis=1, max_size=20, cache=False), block_mean(reference[::4, ::4, ::4][:, 10, :], 2))
+
+
+def test_png_previews(scroll, tmp_path):
+    image = scroll.preview(axis=0, index=5, max_size=40, cache_dir=tmp_path)
+    png = scroll.preview(axis=0, index=5, max_size=40, format="png", cache_dir=tmp_path)
+    assert png.startswith(b"\x89PNG")
+    assert np.array_equal(np.asarray(Image.open(BytesIO(png))), image)
+
+
+def test_previews_are_cached(scroll, tmp_path, monkeypatch):
+    first = scroll.preview(axis=1, index=7, max_size=40, cache_dir=tmp_path)
+    png = scroll.preview(axis=1, index=7, max_size=40, format="png", cache_dir=tmp_path)
+    assert sorted(path.suffix for path in tmp_path.iterdir()) == [".npy", ".png"]
+
+    def fail(*args):
+        raise AssertionError("the preview was rendered again")
+
+    monkeypatch.setattr(Volume, "_render_preview", fail)
+    assert np.array_equal(scroll.preview(axis=1, index=7, max_size=40, cache_dir=tmp_path), first)
+    assert scroll.preview(axis=1, index=7, max_size=40, format="png", cache_dir=tmp_path) == png
+    # Other slices and sizes have their own entries
+    with pytest.raises(AssertionError):
+        scroll.preview(axis=1, index=8, max_size=40, cache_dir=tmp_path)
+
+
+def test_invalid_previews(scroll):
+    with pytest.raises(ValueError):
+        scroll.preview(axis=3, cache=False)
+    with pytest.raises(ValueError):
+        scroll.preview(index=64, cache=False)
+    with pytest.raises(ValueError):
+        scroll.preview(format="jpeg", cache=False)
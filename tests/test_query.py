@@ -0,0 +1,51 @@
+import os
+import numpy as np
+import pytest
+from vesuvius import query_catalog
+from vesuvius.paths import utils
+from vesuvius.paths.catalog import write_catalog
+from conftest import SEGMENT_ID
+
+
+@pytest.fixture
+def catalog(data_dir, scroll_path, segment_path):
+    write_catalog(utils.get_configs_path(), "scrolls", {
+        "1": {"54": {
+            "7.91": {"volume": scroll_path, "segments": {str(SEGMENT_ID): segment_path, "20240101000000": os.path.join(data_dir, "missing.zarr")}},
+            "3.24": {"volume": os.path.join(data_dir, "missing.zarr"), "segments": {}},
+        }},
+        "1b": {"70": {"7.91": {"volume": None, "segments": {"20230101000000": segment_path}}}},
+    })
+
+
+def test_filters(catalog):
+    assert [entry.segment_id for entry in query_catalog()] == [None, None, SEGMENT_ID, 20240101000000, 20230101000000]
+    assert [entry.resolution for entry in query_catalog(scroll_id=1, type="scroll")] == [3.24, 7.91]
+    segments = query_catalog(energy=54, segment_range=(SEGMENT_ID, None))
+    assert [entry.segment_id for entry in segments] == [SEGMENT_ID, 20240101000000]
+    assert [entry.scroll_id for entry in query_catalog(scroll_id="1b")] == ["1b"]
+    assert query_catalog(resolution=1.0) == []
+
+
+def test_metadata_without_opening_the_data(catalog, reference):
+    entries = query_catalog(scroll_id=1, with_metadata=True)
+    # Entries whose metadata cannot be read are dropped
+    assert [entry.segment_id for entry in entries] == [None, SEGMENT_ID]
+    scroll, segment = entries
+    assert scroll.shape == reference.shape and segment.shape == (8,) + reference.shape[1:]
+    assert scroll.dtype == np.uint8 and scroll.chunks == (16, 16, 16)
+    assert scroll.levels == 3 and scroll.metadata()["zarr_format"] == 2
+
+
+def test_entries_open_as_volumes(catalog, reference):
+    scroll = query_catalog(scroll_id=1, resolution=7.91, type="scroll")[0]
+    volume = scroll.open()
+    assert np.array_equal(volume[1:5, 2:6, 3:7], reference[1:5, 2:6, 3:7])
+
+
+def test_trailing_zero_resolutions_reopen(http_server, reference):
+    write_catalog(utils.get_configs_path(), "scrolls", {"1": {"54": {"8.00": {"volume": f"{http_server.url}/scroll.zarr", "segments": {}}}}})
+    entry = query_catalog(resolution=8)[0]
+    assert entry.resolution == 8.0 and entry.resolution_key == "8.00"
+    volume = entry.open()
+    assert np.array_equal(volume[0:4, 0:4, 0:4], reference[0:4, 0:4, 0:4])
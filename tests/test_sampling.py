@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+
+
+def test_nearest_sampling_matches_indexing(scroll, reference):
+    rng = np.random.default_rng(1)
+    points = rng.uniform(-4, [68, 84, 100], size=(20, 30, 3))
+    values = scroll.sample(points)
+
+    indices = np.floor(points + 0.5).astype(np.int64)
+    inside = np.all((indices >= 0) & (indices < reference.shape), axis=-1)
+    expected = np.zeros(points.shape[:-1], dtype=reference.dtype)
+    expected[inside] = reference[tuple(indices[inside].T)]
+    assert values.shape == (20, 30)
+    assert values.dtype == reference.dtype
+    assert np.array_equal(values, expected)
+
+
+def test_trilinear_sampling_interpolates_between_voxels(scroll, reference):
+    points = np.array([[10, 20, 30.5], [10.25, 20, 30], [63, 47, 95], [63.5, 0, 0]])
+    values = scroll.sample(points, order=1, fill_value=-1)
+    a = reference.astype(np.float32)
+    assert values.dtype == np.float32
+    assert values[0] == pytest.approx((a[10, 20, 30] + a[10, 20, 31]) / 2)
+    assert values[1] == pytest.approx(0.75 * a[10, 20, 30] + 0.25 * a[11, 20, 30])
+    assert values[2] == pytest.approx(a[63, 47, 95])
+    assert values[3] == -1
+
+
+def test_every_chunk_is_read_once(scroll, reference, monkeypatch):
+    reads = []
+    read_chunks = scroll._read_chunks
+
+    def counting(subvolume_idx, chunk_indices):
+        reads.extend(chunk_indices)
+        return read_chunks(subvolume_idx, chunk_indices)
+
+    monkeypatch.setattr(scroll, "_read_chunks", counting)
+    z, y, x = np.meshgrid(np.arange(0, 32), np.arange(0, 32), np.arange(0, 32), indexing="ij")
+    points = np.stack([z, y, x], axis=-1).reshape(-1, 3)
+    assert np.array_equal(scroll.sample(points), reference[:32, :32, :32].ravel())
+    assert len(reads) == len(set(reads)) == 8
+
+
+def test_sampling_a_coarser_level(scroll, reference):
+    points = np.array([[0, 0, 0], [8, 16, 32], [62, 46, 94]])
+    assert np.array_equal(scroll.sample(points, subvolume_idx=1), reference[tuple(points.T)])
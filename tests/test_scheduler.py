@@ -0,0 +1,192 @@
+import os
+import time
+import threading
+from concurrent.futures import CancelledError, ThreadPoolExecutor
+import numpy as np
+import pytest
+from vesuvius import Volume, scheduler
+from vesuvius.scheduler import ReadScheduler, bind_read_priority, current_read_priority, read_priority
+
+
+def wait_until(condition, timeout=5.0):
+    end = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < end, "timed out"
+        time.sleep(0.005)
+
+
+def waiting(scheduler, priority):
+    return lambda: scheduler.stats()[priority]["waiting"] >= 1
+
+
+@pytest.fixture
+def pool():
+    with ThreadPoolExecutor(4) as executor:
+        yield executor
+
+
+@pytest.fixture
+def process_scheduler(monkeypatch):
+    """
+    Replace the scheduler of the process with one of a single slot, restored after the test.
+    """
+    monkeypatch.setattr(scheduler, "_scheduler", None)
+    return scheduler.configure_read_scheduler(1)
+
+
+def test_urgent_classes_are_served_first(pool):
+    reads = ReadScheduler(1)
+    held = reads.acquire("default")
+    order = []
+
+    def read(priority):
+        ticket = reads.acquire(priority)
+        order.append(priority)
+        reads.release(ticket)
+
+    futures = [pool.submit(read, "bulk")]
+    wait_until(waiting(reads, "bulk"))
+    futures += [pool.submit(read, "default")]
+    wait_until(waiting(reads, "default"))
+    futures += [pool.submit(read, "interactive")]
+    wait_until(waiting(reads, "interactive"))
+    reads.release(held)
+    for future in futures:
+        future.result(timeout=5)
+    assert order == ["interactive", "default", "bulk"]
+    stats = reads.stats()
+    assert stats["default"]["granted"] == 2 and stats["bulk"]["max_wait_seconds"] > 0
+
+
+def test_class_limits(pool):
+    reads = ReadScheduler(4)
+    assert reads.limits == {"interactive": 4, "default": 3, "bulk": 1}
+    bulk = reads.acquire("bulk")
+    blocked = pool.submit(reads.acquire, "bulk")
+    wait_until(waiting(reads, "bulk"))
+    # Free slots are left to the other classes
+    interactive = [reads.acquire("interactive") for _ in range(3)]
+    assert reads.stats()["interactive"]["active"] == 3 and not blocked.done()
+    reads.release(bulk)
+    reads.release(blocked.result(timeout=5))
+    for ticket in interactive:
+        reads.release(ticket)
+    assert all(stats["active"] == 0 and stats["waiting"] == 0 for stats in reads.stats().values())
+
+    assert ReadScheduler(8, {"bulk": 2}).limits["bulk"] == 2
+    with pytest.raises(ValueError):
+        ReadScheduler(8, {"urgent": 2})
+    with pytest.raises(ValueError):
+        reads.acquire("urgent")
+
+
+def test_cancel_waiting_requests(pool):
+    reads = ReadScheduler(1)
+    held = reads.acquire()
+    stale = [pool.submit(reads.acquire, "default", "viewport") for _ in range(2)]
+    other = pool.submit(reads.acquire, "default", "other")
+    wait_until(lambda: reads.stats()["default"]["waiting"] == 3)
+
+    assert reads.cancel("viewport") == 2
+    for future in stale:
+        with pytest.raises(CancelledError):
+            future.result(timeout=5)
+    assert reads.cancel("viewport") == 0
+    reads.release(held)
+    reads.release(other.result(timeout=5))
+    assert reads.stats()["default"]["cancelled"] == 2
+
+
+def test_deadlines():
+    reads = ReadScheduler(1)
+    held = reads.acquire()
+    start = time.monotonic()
+    with pytest.raises(CancelledError):
+        reads.acquire(deadline=start + 0.05)
+    assert time.monotonic() - start >= 0.04
+    # A passed deadline drops the request only if it has to wait
+    with pytest.raises(CancelledError):
+        reads.acquire(deadline=start)
+    reads.release(held)
+    reads.release(reads.acquire(deadline=start))
+    assert reads.stats()["default"]["cancelled"] == 2
+
+
+def test_submitted_reads_are_cancelled_by_group():
+    reads = ReadScheduler(1)
+    started = threading.Event()
+    release = threading.Event()
+    running = reads.submit(lambda: (started.set(), release.wait(5)), priority="bulk", group="export")
+    started.wait(5)
+    queued = reads.submit(current_read_priority, priority="bulk", group="export")
+    assert reads.cancel("export") == 1 and queued.cancelled()
+    release.set()
+    running.result(timeout=5)
+    assert reads.submit(current_read_priority, priority="bulk", group="tile").result(timeout=5)[:2] == ("bulk", "tile")
+
+
+def test_priority_of_the_thread(pool):
+    assert current_read_priority() == ("default", None, None)
+    with read_priority("interactive", "viewport", timeout=10):
+        priority, group, deadline = current_read_priority()
+        assert (priority, group) == ("interactive", "viewport") and deadline > time.monotonic()
+        # Pools do not inherit the priority unless functions are bound to it
+        assert pool.submit(current_read_priority).result()[0] == "default"
+        assert pool.submit(bind_read_priority(current_read_priority)).result()[:2] == ("interactive", "viewport")
+    assert current_read_priority() == ("default", None, None)
+    with pytest.raises(ValueError):
+        with read_priority("urgent"):
+            pass
+
+
+def test_volume_reads_go_through_the_scheduler(process_scheduler, scroll_path, reference):
+    volume = Volume(type="scroll", scroll_id=1, energy=54, resolution=7.91, domain="local", path=scroll_path, chunk_cache=1 << 20)
+    assert np.array_equal(volume.submit((slice(0, 4), 0), priority="interactive").result(timeout=5), reference[0:4, 0])
+    assert process_scheduler.stats()["interactive"]["granted"] >= 1
+    volume._chunk_reader(0).cache.clear()
+
+    held = process_scheduler.acquire("interactive")
+    with pytest.raises(CancelledError):
+        with Volume.priority("default", timeout=0.05):
+            volume[0:4, 0]
+    future = volume.submit((slice(0, 4), 0), group="viewport")
+    wait_until(waiting(process_scheduler, "default"))
+    assert Volume.cancel("viewport") == 1
+    with pytest.raises(CancelledError):
+        future.result(timeout=5)
+    process_scheduler.release(held)
+    assert np.array_equal(volume[0:4, 0], reference[0:4, 0])
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="fork is not available")
+def test_forked_children_get_a_new_scheduler(process_scheduler):
+    from test_fork import run_in_child
+    held = process_scheduler.acquire()
+    # The slot held by the parent is not held in the child
+    assert run_in_child(lambda: scheduler.get_read_scheduler() is not process_scheduler and scheduler.get_read_scheduler().acquire(deadline=time.monotonic()) is not None) == 0
+    process_scheduler.release(held)
+
+
+def test_remote_chunk_fetches_are_scheduled(process_scheduler, remote_catalog, reference, pool):
+    # The default configuration: TensorStore, no chunk cache
+    volume = Volume(type="scroll", scroll_id=1, energy=54, resolution=7.91, domain="dl.ash2txt")
+    with Volume.priority("bulk"):
+        assert np.array_equal(volume[:, :, :], reference)
+    # Every group of chunks of a large read takes its own slot: 4 * 5 * 6 chunks of 16 voxels, 16 per group
+    assert process_scheduler.stats()["bulk"]["granted"] == 8
+    assert np.array_equal(volume[0:4, 0:4, 0:4], reference[0:4, 0:4, 0:4])
+    assert process_scheduler.stats()["default"]["granted"] == 1
+
+    held = process_scheduler.acquire("interactive")
+
+    def export():
+        with Volume.priority("bulk", group="export"):
+            return volume[:, :, :]
+
+    future = pool.submit(export)
+    wait_until(waiting(process_scheduler, "bulk"))
+    assert Volume.cancel("export") == 1
+    with pytest.raises(CancelledError):
+        future.result(timeout=5)
+    process_scheduler.release(held)
+    assert np.array_equal(volume[0:4, 0], reference[0:4, 0])
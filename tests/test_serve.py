@@ -0,0 +1,139 @@
+import os
+import re
+import socket
+import threading
+import numpy as np
+import pytest
+from vesuvius.serve import VolumeClient, VolumeRegistry, make_server, parse_axis, format_axis
+
+
+@pytest.fixture
+def root(tmp_path, scroll_path):
+    root = tmp_path / "volumes"
+    root.mkdir()
+    os.symlink(scroll_path, root / "scroll1")
+    return str(root)
+
+
+@pytest.fixture
+def server(root):
+    server = make_server(port=0, root=root, max_bytes=64 * 1024)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def client(server):
+    host, port = server.server_address[:2]
+    return VolumeClient(f"http://{host}:{port}", timeout=10)
+
+
+def test_axis_selections_round_trip():
+    for value in ["10:20", "5", "::4", "1:9:2", ":"]:
+        assert format_axis(parse_axis(value)) in (value, ":")
+    assert parse_axis("") == slice(None)
+    with pytest.raises(ValueError):
+        parse_axis("1:2:3:4")
+
+
+def test_regions_match_the_volume(client, reference):
+    info = client.info("scroll1")
+    assert info["dtype"] == "|u1"
+    assert info["levels"][0] == {"shape": list(reference.shape), "chunks": [16, 16, 16]}
+    assert len(info["levels"]) == 3
+
+    assert np.array_equal(client.roi("scroll1", z=(3, 20), y=slice(5, 40), x=7), reference[3:20, 5:40, 7])
+    assert np.array_equal(client.roi("scroll1", z=slice(0, 8), level=1), reference[::2, ::2, ::2][0:8])
+    assert np.array_equal(client.slice("scroll1", axis=1, index=30), reference[:, 30, :])
+
+    regions = [((0, 4), (0, 4), (0, 4)), (slice(10, 30, 3), 2, None)]
+    first, second = client.batch("scroll1", regions)
+    assert np.array_equal(first, reference[0:4, 0:4, 0:4])
+    assert np.array_equal(second, reference[10:30:3, 2, :])
+
+
+def test_errors_keep_the_connection_usable(client, reference):
+    with pytest.raises(RuntimeError, match="404"):
+        client.batch("missing", [((0, 4), (0, 4), (0, 4))])
+    with pytest.raises(RuntimeError, match="413"):
+        client.roi("scroll1")
+    with pytest.raises(RuntimeError, match="400"):
+        client.roi("scroll1", level=7)
+    # The same persistent connection still serves requests
+    connection = client._local.connection
+    assert np.array_equal(client.roi("scroll1", z=1, y=(0, 2), x=(0, 2)), reference[1, 0:2, 0:2])
+    assert client._local.connection is connection
+
+
+def test_error_responses_consume_the_request_body(server):
+    body = b'{"regions": []}'
+    with socket.create_connection(server.server_address[:2], timeout=10) as connection:
+        connection.sendall(
+            b"POST /volumes/missing/batch HTTP/1.1\r\nHost: x\r\nContent-Length: %d\r\n\r\n" % len(body) + body
+            + b"GET /volumes/missing HTTP/1.1\r\nHost: x\r\n\r\n"
+        )
+        data = b""
+        while data.count(b"HTTP/1.1 ") < 2:
+            chunk = connection.recv(65536)
+            assert chunk
+            data += chunk
+    assert re.findall(rb"HTTP/1\.1 \d+", data) == [b"HTTP/1.1 404"] * 2
+
+
+def test_names_cannot_leave_the_root(root, client, tmp_path, scroll_path):
+    os.symlink(scroll_path, tmp_path / "scroll2")
+    for name in ["..", ".hidden", "../scroll2"]:
+        with pytest.raises(RuntimeError, match="404"):
+            client.info(name)
+
+    registry = VolumeRegistry(root=root)
+    for name in ["", "..", "a/b"]:
+        with pytest.raises(ValueError):
+            registry._location(name)
+
+
+def test_registry_opens_volumes_once(root):
+    registry = VolumeRegistry(max_volumes=1, root=root)
+    volume = registry.get("scroll1")
+    assert registry.get("scroll1") is volume
+    for i in range(5):
+        with pytest.raises(Exception):
+            registry.get(f"missing{i}")
+    # Failed opens leave nothing behind
+    assert registry._opening == {}
+    assert list(registry._volumes) == [("scroll1", None, None)]
+
+
+def test_unix_socket(root, tmp_path, reference):
+    path = str(tmp_path / "volumes.sock")
+    server = make_server(socket_path=path, root=root)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        client = VolumeClient(path, timeout=10)
+        assert np.array_equal(client.roi("scroll1", z=(0, 2), y=(0, 3), x=(0, 4)), reference[0:2, 0:3, 0:4])
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert not os.path.exists(path)
+
+
+def test_previews_respect_the_size_limit(root, tmp_path, monkeypatch, reference):
+    monkeypatch.setenv("HOME", str(tmp_path))
+    server = make_server(port=0, root=root, max_bytes=4096)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        host, port = server.server_address[:2]
+        client = VolumeClient(f"http://{host}:{port}", timeout=10)
+        # A full-resolution slice of 80 x 96 bytes is over the limit, a slice of level 1 is not
+        with pytest.raises(RuntimeError, match="413"):
+            client.preview("scroll1", axis=0, index=10, max_size=96)
+        assert client.preview("scroll1", axis=0, index=10, max_size=48).shape == (40, 48)
+        with pytest.raises(RuntimeError, match="400"):
+            client.preview("scroll1", max_size=0)
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,85 @@
+import os
+import json
+import numpy as np
+import pytest
+import tensorstore as ts
+import vesuvius.volume
+from vesuvius import Volume
+from vesuvius.paths.metadata import array_geometry, read_array_metadata, read_multiscales
+
+
+@pytest.fixture(scope="module")
+def sharded_path(data_dir, reference):
+    """
+    A zarr v3 OME-Zarr 0.5 copy of the scroll fixture, in shards of 32^3 voxels made of 16^3 chunks.
+    """
+    root = os.path.join(data_dir, "sharded.zarr")
+    if os.path.exists(root):
+        return root
+    datasets = []
+    for level in range(3):
+        step = 2 ** level
+        array = reference[::step, ::step, ::step]
+        store = ts.open({
+            "driver": "zarr3",
+            "kvstore": {"driver": "file", "path": f"{root}/{level}/"},
+            "metadata": {
+                "shape": list(array.shape),
+                "data_type": "uint8",
+                "chunk_grid": {"name": "regular", "configuration": {"chunk_shape": [32, 32, 32]}},
+                "codecs": [{"name": "sharding_indexed", "configuration": {
+                    "chunk_shape": [16, 16, 16],
+                    "codecs": [{"name": "bytes"}, {"name": "blosc", "configuration": {"cname": "lz4", "clevel": 5, "shuffle": "shuffle", "typesize": 1}}],
+                    "index_codecs": [{"name": "bytes", "configuration": {"endian": "little"}}, {"name": "crc32c"}],
+                }}],
+            },
+            "create": True,
+        }).result()
+        store[...] = array
+        datasets.append({"path": str(level), "coordinateTransformations": [{"type": "scale", "scale": [float(step)] * 3}]})
+    with open(os.path.join(root, "zarr.json"), "w") as file:
+        json.dump({"zarr_format": 3, "node_type": "group", "attributes": {"ome": {
+            "version": "0.5",
+            "multiscales": [{"axes": [{"name": name, "type": "space"} for name in "zyx"], "datasets": datasets}],
+        }}}, file)
+    return root
+
+
+@pytest.fixture
+def remote_sharded(sharded_path, remote_catalog, monkeypatch, http_server):
+    catalog = {"1": {"54": {"7.91": {"volume": f"{http_server.url}/sharded.zarr", "segments": {}}}}}
+    monkeypatch.setattr(vesuvius.volume, "list_files", lambda scroll_id=None: catalog)
+    return catalog
+
+
+def shard_requests(http_server):
+    with http_server.lock:
+        return [path for path in http_server.requests if "/c/" in path]
+
+
+def test_v3_metadata(sharded_path):
+    attributes, zarr_format = read_multiscales(sharded_path)
+    assert zarr_format == 3 and len(attributes["multiscales"][0]["datasets"]) == 3
+    geometry = array_geometry(read_array_metadata(f"{sharded_path}/0", 3), 3)
+    assert geometry == {"shape": (64, 80, 96), "dtype": np.dtype(np.uint8), "chunks": (16, 16, 16), "shards": (32, 32, 32)}
+    assert array_geometry({"shape": [4], "dtype": "<u2", "chunks": [2]}, 2)["shards"] is None
+
+
+def test_local_sharded_volumes(sharded_path, reference):
+    volume = Volume(type="scroll", scroll_id=1, energy=54, resolution=7.91, domain="local", path=sharded_path)
+    assert volume.metadata["zarr_format"] == 3
+    assert volume.shape(1) == (32, 40, 48) and volume.chunks(0) == (16, 16, 16)
+    assert np.array_equal(volume[10:50, 5:70, 33], reference[10:50, 5:70, 33])
+
+
+def test_remote_shards_are_read_by_ranges(remote_sharded, http_server, reference):
+    volume = Volume(type="scroll", scroll_id=1, energy=54, resolution=7.91, domain="dl.ash2txt")
+    region = (slice(0, 32), slice(0, 32), slice(0, 32))
+    assert np.array_equal(volume[region], reference[region])
+    # The 8 chunks of the shard are read with its index and coalesced ranges, not one request per chunk
+    requests = shard_requests(http_server)
+    assert set(requests) == {"/sharded.zarr/0/c/0/0/0"} and len(requests) < 8
+
+    first, second = volume._read_regions(1, [(slice(0, 8), slice(0, 8), slice(0, 8)), (slice(16, 32), 39, slice(40, 48))])
+    assert np.array_equal(first, reference[::2, ::2, ::2][0:8, 0:8, 0:8])
+    assert np.array_equal(second, reference[::2, ::2, ::2][16:32, 39, 40:48])
@@ -0,0 +1,76 @@
+import numpy as np
+import pytest
+from vesuvius import Volume
+from vesuvius import stats as stats_module
+from vesuvius.stats import VolumeStats
+from conftest import write_ome_zarr
+
+
+def test_integer_statistics_are_exact(scroll, reference):
+    stats = scroll.stats(subvolume_idx=0, cache=False)
+    values = reference.astype(np.float64)
+    assert stats.count == reference.size
+    assert (stats.min, stats.max) == (reference.min(), reference.max())
+    assert stats.mean == pytest.approx(values.mean(), rel=1e-12)
+    assert stats.std == pytest.approx(values.std(), rel=1e-12)
+    assert np.array_equal(stats.histogram, np.bincount(reference.ravel(), minlength=256))
+    q = [0, 1, 25, 50, 99, 100]
+    assert np.array_equal(stats.percentile(q), np.percentile(reference, q, method="lower"))
+
+
+def test_regions_and_levels(scroll, reference):
+    # The region crosses chunk boundaries on every axis
+    region = (slice(5, 37), slice(10, 60), slice(17, 18))
+    stats = scroll.stats(subvolume_idx=0, region=region, cache=False)
+    assert stats.count == reference[region].size
+    assert stats.mean == pytest.approx(reference[region].mean(), rel=1e-12)
+
+    # The coarsest level by default
+    coarse = reference[::4, ::4, ::4]
+    assert scroll.stats(cache=False).count == coarse.size
+    with pytest.raises(ValueError):
+        scroll.stats(subvolume_idx=0, region=(slice(0, 10, 2), slice(None), slice(None)), cache=False)
+
+
+def test_float_statistics_with_a_large_mean(tmp_path):
+    rng = np.random.default_rng(1)
+    array = (1e6 + rng.standard_normal((40, 40, 40))).astype(np.float32)
+    array[0, 0, 0] = 1e6 + 10
+    path = write_ome_zarr(str(tmp_path / "float.zarr"), array, levels=1)
+    volume = Volume(type="scroll", scroll_id=1, energy=54, resolution=7.91, domain="local", path=path)
+
+    stats = volume.stats(cache=False)
+    values = array.astype(np.float64)
+    assert stats.mean == pytest.approx(values.mean(), rel=1e-12)
+    # Far tighter than a single pass over the sum of squares allows with this mean
+    assert stats.std == pytest.approx(values.std(), rel=1e-9)
+    # The bins span the extrema, so percentiles are within one bin of the exact ones
+    assert (stats.edges[0], stats.edges[-1]) == (values.min(), values.max())
+    assert stats.histogram.sum() == array.size
+    width = stats.edges[1] - stats.edges[0]
+    assert abs(stats.percentile(50) - np.median(values)) <= width
+
+
+def test_statistics_are_cached(scroll, monkeypatch):
+    first = scroll.stats(subvolume_idx=1)
+
+    def fail(*args):
+        raise AssertionError("the statistics were computed again")
+
+    monkeypatch.setattr(stats_module, "compute_stats", fail)
+    cached = scroll.stats(subvolume_idx=1)
+    assert (cached.count, cached.mean, cached.std) == (first.count, first.mean, first.std)
+    assert np.array_equal(cached.histogram, first.histogram)
+    with pytest.raises(AssertionError):
+        scroll.stats(subvolume_idx=1, region=(slice(0, 4), slice(None), slice(None)))
+
+
+def test_dictionaries_round_trip():
+    histogram = np.zeros(10, dtype=np.int64)
+    histogram[[2, 7]] = [3, 5]
+    stats = VolumeStats(8, 2.0, 7.5, 5.0, 2.0, histogram, np.linspace(0, 10, 11))
+    copy = VolumeStats.from_dict(stats.to_dict())
+    assert np.array_equal(copy.histogram, histogram) and np.allclose(copy.edges, stats.edges)
+    assert copy.percentile([0, 100]).tolist() == [2.0, 7.0]
+    with pytest.raises(ValueError):
+        VolumeStats.from_dict({**stats.to_dict(), "version": 1})
@@ -0,0 +1,109 @@
+import time
+import numpy as np
+import pytest
+import zarr
+from vesuvius import Volume
+from vesuvius.store import PredictionStore
+from vesuvius.sampling import block_mean
+
+
+def record_writes(store, monkeypatch):
+    writes = []
+    write_chunk = store._write_chunk
+
+    def recording(level, region, data, mask=None):
+        writes.append((level, tuple((r.start, r.stop) for r in region), mask is not None))
+        write_chunk(level, region, data, mask)
+
+    monkeypatch.setattr(store, "_write_chunk", recording)
+    return writes
+
+
+def test_stores_have_the_geometry_of_the_volume(scroll, tmp_path):
+    store = scroll.create_store(tmp_path / "predictions.zarr", dtype=np.uint8, channels=(2,))
+    assert len(store) == 3 and store.channels == (2,) and store.dtype == np.uint8
+    for level in range(3):
+        assert store.level(level).shape == (2,) + scroll.shape(level)
+        assert store.level(level).chunks == (1, 16, 16, 16)
+    datasets = store.group.attrs["multiscales"][0]["datasets"]
+    assert datasets[1]["coordinateTransformations"] == [{"type": "scale", "scale": [1.0, 2.0, 2.0, 2.0]}]
+    store.close()
+
+    # 2D stores take the (y, x) axes of the volume
+    ink = scroll.create_store(tmp_path / "ink.zarr", ndim=2, levels=2)
+    assert [ink.level(level).shape for level in range(len(ink))] == [(80, 96), (40, 48)]
+    ink.close()
+    with pytest.raises(FileExistsError):
+        scroll.create_store(tmp_path / "ink.zarr")
+
+
+def test_partial_chunks_are_buffered_until_complete(scroll, tmp_path, monkeypatch, reference):
+    store = scroll.create_store(tmp_path / "predictions.zarr", dtype=np.uint8)
+    writes = record_writes(store, monkeypatch)
+
+    # Bands of 4 rows: nothing is written until 16 rows complete the first row of chunks
+    for start in range(0, 12, 4):
+        store.write((slice(start, start + 4), slice(None), slice(None)), reference[start:start + 4])
+    assert writes == [] and len(store._buffers) == 5 * 6
+    store.write((slice(12, 20), slice(None), slice(None)), reference[12:20])
+    store.flush()
+    # Completed chunks are written once, without reading them back; the flush writes the started chunks of the next row
+    assert sorted(writes)[:30] == [(0, ((0, 16), (y, y + 16), (x, x + 16)), False) for y in range(0, 80, 16) for x in range(0, 96, 16)]
+    assert len(writes) == 60 and all(partial for _, region, partial in writes if region[0] == (16, 32))
+    assert np.array_equal(store.level(0)[0:20], reference[0:20])
+    assert not store.level(0)[20:].any()
+
+
+def test_flushed_partial_chunks_keep_the_stored_data(tmp_path, monkeypatch):
+    store = PredictionStore.create(tmp_path / "store.zarr", [(8, 8)], [(8, 8)], dtype=np.int16)
+    write_chunk = store._write_chunk
+
+    def slow_whole_chunks(level, region, data, mask=None):
+        # The merge of the partial chunk must still wait for the earlier write of the whole chunk
+        if mask is None:
+            time.sleep(0.1)
+        write_chunk(level, region, data, mask)
+
+    monkeypatch.setattr(store, "_write_chunk", slow_whole_chunks)
+    store[0:8, 0:8] = np.full((8, 8), 3, dtype=np.int16)
+    store[2:4, 2:4] = np.full((2, 2), 7, dtype=np.int16)
+    expected = np.full((8, 8), 3, dtype=np.int16)
+    expected[2:4, 2:4] = 7
+    assert np.array_equal(store[:], expected)
+    store.close()
+    assert np.array_equal(zarr.open(str(tmp_path / "store.zarr/0"), mode="r")[:], expected)
+
+
+def test_pyramid_is_built_from_the_written_level(scroll, tmp_path, reference):
+    path = tmp_path / "predictions.zarr"
+    with scroll.create_store(path, channels=(1,)) as store:
+        store.write((slice(None),) * 3, reference[None].astype(np.float32))
+    reopened = PredictionStore(path, mode="r")
+    assert np.array_equal(reopened.level(1)[0], block_mean(reference.astype(np.float32), (2, 2, 2)))
+    assert np.array_equal(reopened.level(2)[0], block_mean(block_mean(reference.astype(np.float32), (2, 2, 2)), (2, 2, 2)))
+
+    # The pyramid of a store written at level 1 starts there
+    with scroll.create_store(tmp_path / "coarse.zarr") as store:
+        store.write((slice(None),) * 3, np.ones(scroll.shape(1), dtype=np.float32), level=1)
+    coarse = Volume(type="scroll", scroll_id=1, energy=54, resolution=7.91, domain="local", path=str(tmp_path / "coarse.zarr"))
+    assert coarse[0:4, 0:4, 0:4].max() == 0 and coarse.shape(2) == scroll.shape(2)
+    assert np.all(PredictionStore(tmp_path / "coarse.zarr", mode="r").level(2)[:] == 1)
+
+
+def test_errors(tmp_path, monkeypatch):
+    store = PredictionStore.create(tmp_path / "store.zarr", [(8, 8)], [(4, 4)])
+    with pytest.raises(ValueError):
+        store.write((slice(0, 4), slice(0, 4)), np.zeros((4, 5)))
+    with pytest.raises(ValueError):
+        store.write((slice(0, 4, 2), slice(0, 4)), np.zeros((2, 4)))
+
+    def fail(*args):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(store, "_write_chunk", fail)
+    store.write((slice(0, 4), slice(0, 4)), np.zeros((4, 4)))
+    # Errors of the background writes are raised by the next flush
+    with pytest.raises(OSError):
+        store.flush()
+    store.flush()
+    store.close(pyramid=False)
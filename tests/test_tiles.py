@@ -0,0 +1,82 @@
+import os
+import pickle
+import numpy as np
+from vesuvius import TileIndex, Volume
+from vesuvius.tiles import tile_fractions
+from vesuvius.paths.metadata import get_metadata_cache
+from conftest import SEGMENT_ID
+
+
+def test_tile_fractions_match_a_direct_count():
+    rng = np.random.default_rng(2)
+    mask = rng.random((40, 50)) > 0.7
+    ys, xs = np.arange(0, 150, 24), np.arange(0, 190, 24)
+    fractions = tile_fractions(mask, 4, ys, xs, 32)
+    for i, y in enumerate(ys):
+        for j, x in enumerate(xs):
+            block = mask[y // 4:-(-(y + 32) // 4), x // 4:-(-(x + 32) // 4)]
+            assert fractions[i, j] == (block.mean() if block.size else 0)
+
+
+def test_build_finds_papyrus_and_ink(segment):
+    index = TileIndex.build(segment, 16, label_scale=4)
+    assert index.papyrus_fraction.shape == index.ink_fraction.shape == (5, 6)
+    assert np.all(index.papyrus_fraction[:3] == 1) and np.all(index.papyrus_fraction[3:] == 0)
+    corners, ink = index.positions(min_ink=0.25)
+    assert sorted(map(tuple, corners)) == [(0, 16), (0, 32), (16, 16), (16, 32)]
+    assert np.allclose(ink, 0.5)
+
+
+def test_saved_index_round_trips(segment, tmp_path):
+    index = TileIndex.build(segment, 16, stride=8)
+    index.save(tmp_path / "index.npz")
+    loaded = TileIndex.load(tmp_path / "index.npz")
+    assert (loaded.tile_size, loaded.stride) == (16, 8)
+    for name in ("ys", "xs", "papyrus_fraction", "ink_fraction"):
+        assert np.array_equal(getattr(loaded, name), getattr(index, name))
+
+
+def test_cached_index_does_not_read_the_label(remote_catalog, http_server, tmp_path):
+    volume = Volume(SEGMENT_ID, cache=False)
+    first = TileIndex.for_volume(volume, 16, cache_dir=tmp_path / "tiles", label_scale=4)
+    assert len(os.listdir(tmp_path / "tiles")) == 1
+
+    # Unpickled volumes (e.g. in DataLoader workers) load their label lazily: the cached index must not need it
+    worker = pickle.loads(pickle.dumps(volume))
+    with http_server.lock:
+        http_server.requests.clear()
+    second = TileIndex.for_volume(worker, 16, cache_dir=tmp_path / "tiles", label_scale=4)
+    assert worker._inklabel is None
+    assert not [path for path in http_server.requests if path.endswith(".png")]
+    assert np.array_equal(first.ink_fraction, second.ink_fraction)
+
+
+def test_opening_a_segment_does_not_read_the_label(remote_catalog, http_server, tmp_path, reference):
+    TileIndex.for_volume(Volume(SEGMENT_ID), 16, cache_dir=tmp_path / "tiles", label_scale=4)
+    with http_server.lock:
+        http_server.requests.clear()
+    volume = Volume(SEGMENT_ID)
+    TileIndex.for_volume(volume, 16, cache_dir=tmp_path / "tiles", label_scale=4)
+    assert volume._inklabel is None
+    assert not [path for path in http_server.requests if path.endswith("_inklabels.png")]
+    # The label is downloaded on first access
+    assert volume.inklabel.shape == reference.shape[1:]
+    assert [path for path in http_server.requests if path.endswith("_inklabels.png")]
+
+
+def test_changed_label_rebuilds_the_index(segment, segment_path, tmp_path):
+    TileIndex.for_volume(segment, 16, cache_dir=tmp_path / "tiles", label_scale=4)
+    label = segment_path[:-5] + "_inklabels.png"
+    stat = os.stat(label)
+    try:
+        os.utime(label, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        TileIndex.for_volume(segment, 16, cache_dir=tmp_path / "tiles", label_scale=4)
+    finally:
+        os.utime(label, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert len(os.listdir(tmp_path / "tiles")) == 2
+
+
+def test_label_validator(http_server):
+    validator = get_metadata_cache().get_validator(f"{http_server.url}/segments/{SEGMENT_ID}_inklabels.png")
+    assert validator["etag"] and validator["size"] > 0
+    assert get_metadata_cache().get_validator(f"{http_server.url}/segments/missing.png") is None
@@ -0,0 +1,79 @@
+import os
+import sys
+import json
+import subprocess
+import pytest
+from vesuvius import Volume, tracing
+from vesuvius.tracing import span, traced
+
+
+@pytest.fixture
+def spans():
+    tracing.clear_spans()
+    tracing.enable_tracing()
+    yield tracing.get_spans
+    tracing.disable_tracing()
+    tracing.clear_spans()
+
+
+def test_nothing_is_recorded_when_disabled():
+    tracing.clear_spans()
+    with span("idle") as record:
+        assert record is None
+    assert tracing.get_spans() == [] and not tracing.tracing_enabled()
+
+
+def test_nested_spans(spans, capsys):
+    finished = []
+    tracing.enable_tracing(finished.append)
+    tracing.enable_tracing(lambda record: 1 / 0)
+
+    @traced("inner")
+    def inner():
+        return 42
+
+    with span("outer", level=0) as record:
+        record["args"]["chunks"] = 3
+        assert inner() == 42
+    with pytest.raises(KeyError):
+        with span("failing"):
+            raise KeyError("missing")
+
+    names = [(record["name"], record["parent"]) for record in spans()]
+    assert names == [("inner", "outer"), ("outer", None), ("failing", None)]
+    outer = spans()[1]
+    assert outer["args"] == {"level": 0, "chunks": 3} and outer["duration"] >= spans()[0]["duration"]
+    assert spans()[2]["args"]["error"] == "KeyError('missing')"
+    assert finished == spans()
+    # Failing callbacks are reported, not raised
+    assert "Error in tracing callback" in capsys.readouterr().out
+
+
+def test_volume_phases_are_traced(spans, remote_catalog):
+    volume = Volume(type="scroll", scroll_id=1, energy=54, resolution=7.91, domain="dl.ash2txt")
+    volume[0:4, 0:4, 0:4]
+    names = {record["name"] for record in spans()}
+    assert {"Volume.load_ome_metadata", "Volume.load_data", "ts.open"} <= names
+
+
+def test_export(spans, tmp_path):
+    with span("read", chunks=2):
+        pass
+    tracing.export_trace(tmp_path / "trace.json")
+    events = json.loads((tmp_path / "trace.json").read_text())["traceEvents"]
+    assert [(event["name"], event["ph"], event["args"]) for event in events] == [("read", "X", {"chunks": 2})]
+    tracing.export_trace(tmp_path / "spans.json", format="json")
+    assert json.loads((tmp_path / "spans.json").read_text())[0]["name"] == "read"
+    with pytest.raises(ValueError):
+        tracing.export_trace(tmp_path / "trace.txt", format="text")
+
+
+def test_environment_variable_traces_a_run(tmp_path):
+    path = tmp_path / "run.json"
+    source = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+    env = {**os.environ, "VESUVIUS_TRACE": str(path), "PYTHONPATH": source}
+    env.pop("VESUVIUS_TRACE_PID", None)
+    code = "from vesuvius.tracing import span\nwith span('step', index=1):\n    pass\n"
+    subprocess.run([sys.executable, "-c", code], env=env, check=True, timeout=120)
+    events = json.loads(path.read_text())["traceEvents"]
+    assert [(event["name"], event["args"]) for event in events] == [("step", {"index": 1})]
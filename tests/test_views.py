@@ -0,0 +1,108 @@
+import pickle
+import numpy as np
+import pytest
+import zarr
+from vesuvius import Volume
+from conftest import write_ome_zarr
+
+
+def random_axis(rng, size):
+    step = int(rng.choice([1, 2, 3, -1, -2]))
+    if rng.random() < 0.2:
+        return slice(None, None, step)
+    low, high = sorted(int(bound) for bound in rng.integers(-size - 3, size + 3, 2))
+    return slice(low, high, step)
+
+
+def count_reads(volume, monkeypatch):
+    reads = []
+    read_region = volume._read_region
+
+    def counting(subvolume_idx, region):
+        reads.append((subvolume_idx, region))
+        return read_region(subvolume_idx, region)
+
+    monkeypatch.setattr(volume, "_read_region", counting)
+    return reads
+
+
+@pytest.mark.parametrize("normalize", [False, True])
+def test_composed_views_match_numpy(scroll_path, reference, normalize):
+    volume = Volume(type="scroll", scroll_id=1, energy=54, resolution=7.91, domain="local", path=scroll_path, normalize=normalize)
+    expected_dtype = np.float64 if normalize else np.uint8
+    rng = np.random.default_rng(0)
+    for _ in range(100):
+        view = volume.view()
+        expected = reference / 255 if normalize else reference
+        for _ in range(3):
+            idx = tuple(int(rng.integers(-size, size)) if size and rng.random() < 0.15 else random_axis(rng, size) for size in view.shape)
+            idx = idx[:int(rng.integers(1, len(idx) + 1))] if idx else ()
+            view, expected = view[idx], expected[idx]
+            if view.ndim > 1 and rng.random() < 0.5:
+                axes = tuple(int(axis) for axis in rng.permutation(view.ndim))
+                view, expected = view.transpose(axes), expected.transpose(axes)
+        data = np.asarray(view)
+        assert view.shape == expected.shape and view.dtype == expected_dtype
+        assert data.shape == expected.shape and data.dtype == view.dtype
+        assert np.array_equal(data, expected)
+
+
+def test_views_read_once(scroll, reference, monkeypatch):
+    reads = count_reads(scroll, monkeypatch)
+    view = scroll.view((slice(0, 48),))[:, 16:48][..., 32:64][0:16]
+    assert reads == []
+    assert np.array_equal(view.read(), reference[0:16, 16:48, 32:64])
+    assert reads == [(0, (slice(0, 16, 1), slice(16, 48, 1), slice(32, 64, 1)))]
+
+    assert np.array_equal(view.T.read(), reference[0:16, 16:48, 32:64].T)
+    assert scroll.view()[5:5].read().shape == (0, 80, 96)
+    assert len(reads) == 2
+
+
+def test_views_pickle(scroll, reference):
+    view = pickle.loads(pickle.dumps(scroll.view()[1:3, 2]))
+    assert np.array_equal(view.read(), reference[1:3, 2])
+
+
+def test_invalid_indices(scroll):
+    view = scroll.view()
+    with pytest.raises(IndexError):
+        view[64]
+    with pytest.raises(IndexError):
+        view[..., 0, ...]
+    with pytest.raises(IndexError):
+        view[0, 0, 0, 0]
+    with pytest.raises(IndexError):
+        view[[1, 2]]
+    with pytest.raises(ValueError):
+        view.transpose(0, 0, 1)
+    with pytest.raises(TypeError):
+        len(view[0, 0, 0])
+
+
+def test_levels_map_regions(scroll, reference):
+    view = scroll.view((slice(0, 32), slice(0, 32), slice(0, 64))).level(1)
+    assert view.shape == (16, 16, 32)
+    assert np.array_equal(view.read(), reference[::2, ::2, ::2][0:16, 0:16, 0:32])
+
+    # Single indices map to the nearest voxel, strides are scaled and directions kept
+    assert scroll.view()[10, 5:9].level(2).region == (3, slice(2, 3, 1), slice(0, 24, 1))
+    assert scroll.view()[::-1].level(1).region == (slice(31, None, -1), slice(0, 40, 1), slice(0, 48, 1))
+    assert scroll.view()[0:64:8].level(1).region[0] == slice(0, 29, 4)
+    assert scroll.view()[1:2].level(2).shape == (1, 20, 24)
+
+
+def test_levels_follow_the_translation(tmp_path, reference):
+    # Level 1 is offset by half a voxel of level 0, as when voxels are averaged in blocks of 2
+    path = write_ome_zarr(str(tmp_path / "translated.zarr"), reference, levels=2)
+    group = zarr.open_group(path, mode="r+")
+    multiscales = group.attrs["multiscales"]
+    multiscales[0]["datasets"][1]["coordinateTransformations"].append({"type": "translation", "translation": [0.5, 0.5, 0.5]})
+    group.attrs["multiscales"] = multiscales
+    volume = Volume(type="scroll", scroll_id=1, energy=54, resolution=7.91, domain="local", path=path)
+
+    assert volume.view()[9].level(1).region[0] == 4
+    assert volume.view(subvolume_idx=1)[4].level(0).region[0] == 9
+    assert volume.view()[0:32].level(1).region[0] == slice(0, 16, 1)
+    # Every voxel of level 1 covers two voxels of level 0
+    assert volume.view(subvolume_idx=1).level(0).shape == reference.shape